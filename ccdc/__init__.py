@@ -18,14 +18,45 @@ CASSANDRA_PORT                     = int(os.getenv('CASSANDRA_PORT', 9043))
 CASSANDRA_USER                     = os.getenv('CASSANDRA_USER', 'cassandra')
 CASSANDRA_PASS                     = os.getenv('CASSANDRA_PASS', 'cassandra')
 CASSANDRA_OUTPUT_CONCURRENT_WRITES = int(os.getenv('CASSANDRA_OUTPUT_CONCURRENT_WRITES', 2))
+CASSANDRA_OUTPUT_BATCH_ROWS        = os.getenv('CASSANDRA_OUTPUT_BATCH_ROWS', 'auto')
+CASSANDRA_OUTPUT_BATCH_BYTES       = int(os.getenv('CASSANDRA_OUTPUT_BATCH_BYTES', 1024))
+CASSANDRA_OUTPUT_BATCH_BUFFER      = int(os.getenv('CASSANDRA_OUTPUT_BATCH_BUFFER', 500))
+CASSANDRA_OUTPUT_THROUGHPUT_MB     = float(os.getenv('CASSANDRA_OUTPUT_THROUGHPUT_MB', 0))
+CASSANDRA_OUTPUT_GROUPING_KEY      = os.getenv('CASSANDRA_OUTPUT_GROUPING_KEY', 'partition')
 CASSANDRA_OUTPUT_CONSISTENCY_LEVEL = os.getenv('CASSANDRA_OUTPUT_CONSISTENCY_LEVEL', 'QUORUM')
 CASSANDRA_INPUT_CONSISTENCY_LEVEL  = os.getenv('CASSANDRA_INPUT_CONSISTENCY_LEVEL', 'QUORUM')
 INPUT_PARTITIONS                   = int(os.getenv('INPUT_PARTITIONS', 1))
 PRODUCT_PARTITIONS                 = int(os.getenv('PRODUCT_PARTITIONS', multiprocessing.cpu_count() * 8))
+ARROW                              = os.getenv('ARROW', 'false').lower() == 'true'
+ENCODING                           = os.getenv('ENCODING', 'list').lower()
+BATCH_SIZE                         = int(os.getenv('BATCH_SIZE', 100))
+BATCH_IN_FLIGHT                    = int(os.getenv('BATCH_IN_FLIGHT', 3))
+TILES_IN_FLIGHT                    = int(os.getenv('TILES_IN_FLIGHT', 2))
+FETCH_CHIPS                        = int(os.getenv('FETCH_CHIPS', 4))
+FETCH_REQUESTS                     = int(os.getenv('FETCH_REQUESTS', 8))
+FETCH_RETRIES                      = int(os.getenv('FETCH_RETRIES', 3))
+FETCH_BACKOFF                      = float(os.getenv('FETCH_BACKOFF', 0.5))
+CHIP_CACHE_DIR                     = os.getenv('CHIP_CACHE_DIR', '')
+CHIP_CACHE_BYTES                   = int(os.getenv('CHIP_CACHE_BYTES', 10 * 1024 ** 3))
+MODEL_DIR                          = os.getenv('MODEL_DIR', '')
+GRID_INDEX                         = os.getenv('GRID_INDEX', '')
+CHECKPOINT_DIR                     = os.getenv('CHECKPOINT_DIR', '')
+SINK                               = os.getenv('SINK', 'cassandra').lower()
+SINK_DIR                           = os.getenv('SINK_DIR', '')
+TRAINING_PER_CLASS                 = int(os.getenv('TRAINING_PER_CLASS', 20000))
+TRAINING_PER_CHIP                  = int(os.getenv('TRAINING_PER_CHIP', 0))
+TRAINING_SEED                      = int(os.getenv('TRAINING_SEED', 42))
 ARD                                = merlin.cfg.get(profile='chipmunk-ard', env={'CHIPMUNK_URL': ARD_CHIPMUNK}) 
 AUX                                = merlin.cfg.get(profile='chipmunk-aux', env={'CHIPMUNK_URL': AUX_CHIPMUNK}) 
 
 
+def version():
+    """Returns the CCDC version"""
+
+    pwd = os.path.dirname(os.path.realpath(__file__))
+    return merlin.files.read('{}{}version.txt'.format(os.path.dirname(pwd), os.path.sep)).strip()
+
+
 def keyspace():
     """ Compute the CCDC keyspace.
         
@@ -38,10 +69,8 @@ def keyspace():
 
     ard = re.sub("/", "", urlparse(ARD_CHIPMUNK).path)
     aux = re.sub("/", "", urlparse(AUX_CHIPMUNK).path)
-    pwd = os.path.dirname(os.path.realpath(__file__))
-    ver = merlin.files.read('{}{}version.txt'.format(os.path.dirname(pwd), os.path.sep))
     fmt = "{0}_{1}_ccdc_{2}"
-    return merlin.functions.cqlstr(fmt.format(ard, aux, ver)).strip().lower().lstrip('_')
+    return merlin.functions.cqlstr(fmt.format(ard, aux, version())).strip().lower().lstrip('_')
 
 
 def context(name):
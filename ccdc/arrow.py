@@ -0,0 +1,165 @@
+"""arrow.py builds dataframes from columns using Arrow record batches.
+
+Chip ids are bucketed and each bucket is handed to a grouped map pandas_udf.
+Buckets are repartitioned explicitly, one per partition, so the udf runs in
+ccdc.PRODUCT_PARTITIONS tasks instead of spark.sql.shuffle.partitions.
+The udf returns columns of numpy arrays, which Spark moves to the JVM as Arrow
+record batches instead of pickled rows that must be inferred and converted.
+
+Requires pandas and pyarrow on the driver and executors.
+"""
+
+from cytoolz import first
+from cytoolz import second
+from pyspark.sql import SparkSession
+from pyspark.sql import functions
+from pyspark.sql.types import ArrayType
+from pyspark.sql.types import ByteType
+from pyspark.sql.types import DoubleType
+from pyspark.sql.types import FloatType
+from pyspark.sql.types import IntegerType
+from pyspark.sql.types import LongType
+from pyspark.sql.types import StructField
+from pyspark.sql.types import StructType
+
+import ccdc
+import numpy
+
+__dtypes = {ByteType:    numpy.int8,
+            IntegerType: numpy.int32,
+            LongType:    numpy.int64,
+            FloatType:   numpy.float32,
+            DoubleType:  numpy.float64}
+
+
+def dtype(datatype):
+    """Returns the numpy dtype for a Spark datatype or None"""
+
+    return __dtypes.get(type(datatype))
+
+
+def series(field, values):
+    """Converts values to a pandas Series matching a schema field
+
+    Args:
+        field (StructField): schema field
+        values (sequence): column values
+
+    Returns:
+        pandas.Series
+    """
+
+    import pandas
+
+    t = field.dataType
+
+    if isinstance(t, ArrayType):
+        d = dtype(t.elementType)
+        return pandas.Series([None if v is None else numpy.asarray(v, dtype=d) for v in values], dtype=object)
+
+    if dtype(t) is not None and not field.nullable:
+        return pandas.Series(numpy.asarray(values, dtype=dtype(t)))
+
+    if isinstance(t, (FloatType, DoubleType)):
+        return pandas.Series(numpy.asarray([numpy.nan if v is None else v for v in values], dtype=dtype(t)))
+
+    return pandas.Series(values, dtype=object)
+
+
+def frame(columns, schema):
+    """Returns a pandas DataFrame matching schema
+
+    Args:
+        columns (dict): column name to sequence of values
+        schema (StructType): dataframe schema
+
+    Returns:
+        pandas.DataFrame
+    """
+
+    import pandas
+
+    return pandas.DataFrame({f.name: series(f, columns[f.name]) for f in schema.fields}, columns=schema.names)
+
+
+def bucket(xy, partitions):
+    """Returns the bucket a chip id is processed in
+
+    The chip id is packed as in grid.key() and mixed with the splitmix64
+    finalizer, so buckets are the same in every Python process and chip ids
+    on a regular grid still spread evenly.
+    """
+
+    m = 0xffffffffffffffff
+    k = ((int(first(xy)) << 32) | (int(second(xy)) & 0xffffffff)) & m
+    k = ((k ^ (k >> 30)) * 0xbf58476d1ce4e5b9) & m
+    k = ((k ^ (k >> 27)) * 0x94d049bb133111eb) & m
+    return (k ^ (k >> 31)) % partitions
+
+
+__labels = {}
+
+
+def labels(ctx, partitions):
+    """Returns a bucket label per partition number
+
+    Spark places a row repartitioned on an int column in partition
+    pmod(hash(value), n).  The smallest value landing in each partition is
+    looked up once per partition count, so labelled buckets are placed one
+    per partition instead of colliding.
+
+    Args:
+        ctx: spark context
+        partitions (int): number of partitions
+
+    Returns:
+        list: label for each partition number
+    """
+
+    if partitions not in __labels:
+        v    = functions.col('id').cast(IntegerType())
+        rows = SparkSession(ctx).range(partitions * 64)\
+                                .select(v.alias('v'), functions.expr('pmod(hash(cast(id as int)), {})'.format(partitions)).alias('p'))\
+                                .groupBy('p').agg(functions.min('v').alias('v'))\
+                                .collect()
+        found = {r['p']: r['v'] for r in rows}
+        __labels[partitions] = [found.get(p, p) for p in range(partitions)]
+
+    return __labels[partitions]
+
+
+def dataframe(ctx, cids, fn, schema, partitions=None):
+    """Creates a dataframe by applying fn to buckets of chip ids
+
+    Args:
+        ctx: spark context
+        cids (rdd): RDD of chip ids
+        fn: function of a sequence of (x, y) returning columns, see frame()
+        schema (StructType): schema of the result
+        partitions (int): number of buckets and partitions, defaults to
+                          ccdc.PRODUCT_PARTITIONS
+
+    Returns:
+        dataframe conforming to schema
+    """
+
+    from pyspark.sql.functions import PandasUDFType
+    from pyspark.sql.functions import pandas_udf
+
+    partitions = partitions or ccdc.PRODUCT_PARTITIONS
+    names      = labels(ctx, partitions)
+
+    keys = StructType([StructField('chipx', IntegerType(), nullable=False),
+                       StructField('chipy', IntegerType(), nullable=False),
+                       StructField('bucket', IntegerType(), nullable=False)])
+
+    ids  = SparkSession(ctx).createDataFrame(cids.map(lambda xy: (int(first(xy)),
+                                                                  int(second(xy)),
+                                                                  names[bucket(xy, partitions)])),
+                                             keys)
+
+    udf  = pandas_udf(lambda pdf: frame(fn(list(zip(pdf['chipx'].tolist(), pdf['chipy'].tolist()))), schema),
+                      schema,
+                      PandasUDFType.GROUPED_MAP)
+
+    return ids.repartition(partitions, 'bucket').groupBy('bucket').apply(udf)
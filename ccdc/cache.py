@@ -0,0 +1,237 @@
+"""cache.py is a local, size bounded chip cache for Merlin chips_fn results.
+
+Chips are content addressed by chip x/y, acquired range, ubids and Chipmunk url
+and stored as compressed npz files.  The least recently used files are evicted
+once the cache exceeds its size limit.
+
+Each Python worker keeps its own hit/miss counters.
+"""
+
+from base64 import b64decode
+from base64 import b64encode
+from cytoolz import assoc
+from cytoolz import dissoc
+from cytoolz import get
+from functools import partial
+from merlin.functions import sha256
+
+import ccdc
+import json
+import logging
+import numpy
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+class ChipCache(object):
+    """Size bounded, least recently used chip cache in a local directory"""
+
+    def __init__(self, directory, limit):
+        """
+        Args:
+            directory (str): directory to store cached chips in
+            limit     (int): maximum size of the cache in bytes
+        """
+
+        self.directory = directory
+        self.limit     = limit
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, '{}.npz'.format(key))
+
+    def get(self, key):
+        """Returns cached chips for key or None"""
+
+        path = self.path(key)
+
+        try:
+            with numpy.load(path) as npz:
+                chips = decode(npz)
+            os.utime(path)
+            self.hits += 1
+            return chips
+        except (IOError, OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+
+    def put(self, key, chips):
+        """Stores chips under key and evicts old entries if needed"""
+
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                numpy.savez_compressed(f, **encode(chips))
+            os.replace(tmp, self.path(key))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+        self.evict()
+        return chips
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits its limit"""
+
+        entries = sorted(files(self.directory))
+        size    = sum(e[1] for e in entries)
+
+        for _, s, path in entries:
+            if size <= self.limit:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except OSError:
+                # already evicted by another worker
+                pass
+            size -= s
+
+    def stats(self):
+        """Returns cache counters"""
+
+        return {'directory': self.directory,
+                'hits':      self.hits,
+                'misses':    self.misses,
+                'evictions': self.evictions}
+
+
+def files(directory):
+    """Returns (mtime, size, path) for every cached file in directory"""
+
+    for e in os.scandir(directory):
+        if e.name.endswith('.npz'):
+            try:
+                st = e.stat()
+                yield (st.st_mtime, st.st_size, e.path)
+            except OSError:
+                pass
+
+
+def encode(chips):
+    """Converts chips to npz arrays.  Chip data is stored as raw bytes.
+
+    Args:
+        chips (sequence): chips as returned from Chipmunk
+
+    Returns:
+        dict: {'meta': json array, 'data_0': uint8 array, 'data_1': ...}
+    """
+
+    meta = [dissoc(c, 'data') for c in chips]
+    data = {'data_{}'.format(i): numpy.frombuffer(b64decode(c['data']), dtype=numpy.uint8)
+            for i, c in enumerate(chips)}
+    return assoc(data, 'meta', numpy.array(json.dumps(meta)))
+
+
+def decode(npz):
+    """Converts npz arrays back to chips.  Inverse of encode().
+
+    Args:
+        npz: loaded npz file
+
+    Returns:
+        tuple: chips
+    """
+
+    meta = json.loads(str(npz['meta']))
+    return tuple(assoc(m, 'data', b64encode(npz['data_{}'.format(i)].tobytes()).decode('ascii'))
+                 for i, m in enumerate(meta))
+
+
+def key(x, y, acquired, ubids, url):
+    """Content address for a chips_fn request
+
+    Args:
+        x (int): projection coordinate x
+        y (int): projection coordinate y
+        acquired (str): ISO8601 date range
+        ubids (sequence): ubids requested
+        url (str): Chipmunk url
+
+    Returns:
+        str: sha256 hex digest
+    """
+
+    return sha256(json.dumps([float(x), float(y), acquired, sorted(ubids), url]))
+
+
+__caches = {}
+
+
+def instance(directory, limit):
+    """Returns the ChipCache for directory, creating it once per Python worker"""
+
+    if directory not in __caches:
+        __caches[directory] = ChipCache(directory=directory, limit=limit)
+    return __caches[directory]
+
+
+def cached(x, y, acquired, ubids, chips_fn, url, directory, limit):
+    """chips_fn that consults the local cache before calling the wrapped chips_fn
+
+    Args:
+        x (int): projection coordinate x
+        y (int): projection coordinate y
+        acquired (str): ISO8601 date range
+        ubids (sequence): ubids requested
+        chips_fn (fn): wrapped Merlin chips_fn
+        url (str): Chipmunk url, part of the cache key
+        directory (str): cache directory
+        limit (int): cache size in bytes
+
+    Returns:
+        tuple: chips
+    """
+
+    c = instance(directory, limit)
+    k = key(x=x, y=y, acquired=acquired, ubids=ubids, url=url)
+
+    chips = c.get(k)
+
+    if chips is None:
+        chips = chips_fn(x=x, y=y, acquired=acquired, ubids=ubids)
+
+        # Chipmunk errors are logged and dropped by Merlin, so empty results
+        # are never cached.
+        if chips:
+            c.put(k, chips)
+
+    logger.debug('chip cache:{}'.format(c.stats()))
+    return chips
+
+
+def configure(cfg, directory=None, limit=None):
+    """Returns a Merlin configuration with chips_fn served from the chip cache.
+
+    The cache is disabled and cfg is returned unaltered if no directory is
+    configured.
+
+    Args:
+        cfg: A Merlin configuration
+        directory (str): cache directory, defaults to ccdc.CHIP_CACHE_DIR
+        limit (int): cache size in bytes, defaults to ccdc.CHIP_CACHE_BYTES
+
+    Returns:
+        A Merlin configuration
+    """
+
+    directory = directory if directory is not None else ccdc.CHIP_CACHE_DIR
+    limit     = limit if limit is not None else ccdc.CHIP_CACHE_BYTES
+
+    if not directory:
+        return cfg
+
+    fn = get('chips_fn', cfg)
+
+    return assoc(cfg, 'chips_fn', partial(cached,
+                                          chips_fn=fn,
+                                          url=get('url', getattr(fn, 'keywords', {}), ''),
+                                          directory=directory,
+                                          limit=limit))
@@ -1,6 +1,9 @@
 from cytoolz import assoc
+from functools import reduce
 from pyspark.sql import SparkSession
+from pyspark.sql import functions
 import ccdc
+import time
 
 def options(table):
     """Returns Cassandra Spark Connector options
@@ -12,7 +15,7 @@ def options(table):
         dict: Python dictionary of Cassandra options
     """
     
-    return {
+    opts = {
         'table': table,
         'keyspace': ccdc.keyspace(),
         'spark.cassandra.auth.username': ccdc.CASSANDRA_USER,
@@ -23,9 +26,17 @@ def options(table):
         'spark.cassandra.input.consistency.level': ccdc.CASSANDRA_INPUT_CONSISTENCY_LEVEL,
         'spark.cassandra.output.consistency.level': ccdc.CASSANDRA_OUTPUT_CONSISTENCY_LEVEL,
         'spark.cassandra.output.concurrent.writes': ccdc.CASSANDRA_OUTPUT_CONCURRENT_WRITES,
-        'spark.cassandra.output.batch.grouping.buffer.size': 500
+        'spark.cassandra.output.batch.grouping.key': ccdc.CASSANDRA_OUTPUT_GROUPING_KEY,
+        'spark.cassandra.output.batch.grouping.buffer.size': ccdc.CASSANDRA_OUTPUT_BATCH_BUFFER,
+        'spark.cassandra.output.batch.size.rows': ccdc.CASSANDRA_OUTPUT_BATCH_ROWS,
+        'spark.cassandra.output.batch.size.bytes': ccdc.CASSANDRA_OUTPUT_BATCH_BYTES
     }
 
+    if ccdc.CASSANDRA_OUTPUT_THROUGHPUT_MB > 0:
+        opts['spark.cassandra.output.throughput_mb_per_sec'] = ccdc.CASSANDRA_OUTPUT_THROUGHPUT_MB
+
+    return opts
+
 
 def read(sc, table):
     """Read data from Cassandra as a dataframe
@@ -42,10 +53,138 @@ def read(sc, table):
     return SparkSession(sc).read.format('org.apache.spark.sql.cassandra').options(**opts).load()
 
 
+def restrictions(rows, keys, blocks=None):
+    """Returns IN restrictions covering the partition keys of rows
+
+    Values of the first key column are sorted and cut into contiguous
+    blocks.  Each restriction is an IN list of a block's values and IN
+    lists of the values the remaining columns take with them.  With one
+    block per value the restrictions match rows exactly, fewer blocks also
+    match combinations of values that are not in rows.
+
+    Args:
+        rows: sequence of Rows or dicts containing keys
+        keys: partition key column names
+        blocks (int): maximum number of restrictions, one per value if None
+
+    Returns:
+        list of Column
+    """
+
+    groups = {}
+
+    for r in rows:
+        groups.setdefault(int(r[keys[0]]), []).append(r)
+
+    values = sorted(groups)
+    n      = len(values) if blocks is None else max(min(blocks, len(values)), 1)
+    cuts   = [values[len(values) * i // n:len(values) * (i + 1) // n] for i in range(n)]
+
+    return [reduce(lambda a, b: a & b,
+                   [functions.col(keys[0]).isin(cut)] +
+                   [functions.col(k).isin(sorted(set(int(r[k]) for v in cut for r in groups[v]))) for k in keys[1:]])
+            for cut in cuts if cut]
+
+
+def predicate(rows, keys):
+    """Returns a restriction matching exactly the partition keys of rows
+
+    Args:
+        rows: sequence of Rows or dicts containing keys
+        keys: partition key column names
+
+    Returns:
+        Column
+    """
+
+    if not rows:
+        return functions.lit(False)
+
+    return reduce(lambda a, b: a | b, restrictions(rows, keys))
+
+
+def select(sc, table, ids, keys, blocks=8):
+    """Read the partitions of a Cassandra table named by a dataframe of keys
+
+    The keys are collected and pushed down to Cassandra as IN restrictions
+    on the partition key, so only the requested partitions are read instead
+    of the whole table.  The connector pushes down IN lists but not OR, and
+    IN lists on several columns read every combination of their values.
+    Keys that form a full grid, such as the chips of a tile, are read with
+    one IN list per column.  Other keys, such as the chips of a region, are
+    read in at most blocks reads over contiguous ranges of the first key, so
+    each read only covers the combinations near its own keys and the plan
+    stays bounded.  Rows of combinations not in ids are dropped by the join.
+
+    Args:
+        sc: spark context
+        table: Cassandra table to read from
+        ids: small dataframe of partition keys
+        keys: partition key column names
+        blocks (int): maximum number of reads for keys that are not a grid
+
+    Returns:
+        ids joined with the matching rows of table
+    """
+
+    rows   = ids.select(*keys).distinct().collect()
+    values = [sorted(set(int(r[k]) for r in rows)) for k in keys]
+    grid   = reduce(lambda a, b: a * b, map(len, values), 1) == len(rows)
+    df     = read(sc, table)
+
+    ccdc.logger(sc, name=__name__).debug('selecting {} partitions from {}'.format(len(rows), table))
+
+    if not rows:
+        return ids.join(df.filter(functions.lit(False)), on=list(keys), how='inner')
+
+    reads = [df.filter(r) for r in restrictions(rows, keys, 1 if grid else blocks)]
+
+    return ids.join(reduce(lambda a, b: a.union(b), reads), on=list(keys), how='inner')
+
+
+def partition(dataframe):
+    """Returns the partition key columns of a dataframe, chip or tile"""
+
+    for keys in (['chipx', 'chipy'], ['tilex', 'tiley']):
+        if all(k in dataframe.columns for k in keys):
+            return keys
+    return []
+
+
+def throughput(rows, elapsed):
+    """Returns write statistics
+
+    Args:
+        rows (int): rows written or None if unknown
+        elapsed (float): seconds
+
+    Returns:
+        dict
+    """
+
+    return {'rows':    rows,
+            'seconds': round(elapsed, 3),
+            'rows/s':  round(rows / max(elapsed, 1e-9), 1) if rows is not None else None}
+
+
+def rows(dataframe):
+    """Returns the number of rows of a cached dataframe or None
+
+    Counting a cached dataframe reads its cached partitions, so it costs no
+    recomputation.  Other dataframes would be computed a second time and
+    are not counted.
+    """
+
+    return dataframe.count() if dataframe.is_cached else None
+
+
 def write(sc, dataframe, table):
     """Write a dataframe to cassandra using options.  
 
-    Dataframe must conform to the table schema.
+    Dataframe must conform to the table schema.  Rows are sorted by
+    partition key within each Spark partition so the connector groups them
+    into single partition batches.  Rows written per second are logged for
+    cached dataframes, elapsed time for all others, see rows().
     
     Args:
         sc: spark context
@@ -58,6 +197,52 @@ def write(sc, dataframe, table):
 
     opts = options(table)
     msg  = assoc(opts, 'spark.cassandra.auth.password', 'XXXXX')
-    ccdc.logger(sc, name=__name__).info('writing dataframe:{}'.format(msg))
-    return dataframe.write.format('org.apache.spark.sql.cassandra')\
-                          .mode('append').options(**opts).save()
+    log  = ccdc.logger(sc, name=__name__)
+    keys = partition(dataframe)
+    log.info('writing dataframe:{}'.format(msg))
+
+    start = time.time()
+    out   = dataframe.sortWithinPartitions(*keys) if keys else dataframe
+    out.write.format('org.apache.spark.sql.cassandra').mode('append').options(**opts).save()
+    spent = time.time() - start
+    stats = throughput(rows(dataframe), spent)
+
+    log.info('wrote {}:{}'.format(table, stats))
+    return None
+
+
+def delete(sc, table, keys):
+    """Delete partitions from a Cassandra table.
+
+    The Spark Cassandra Connector has no Python API for deletes, so
+    statements are executed on the driver through the connector's session.
+
+    Args:
+        sc: spark context
+        table: Cassandra table to delete from
+        keys: sequence of partition keys as dicts, {'chipx': 1, 'chipy': 2}
+
+    Returns:
+        count of deleted partitions
+    """
+
+    opts = options(table)
+    conf = sc._jsc.sc().getConf().clone()
+
+    for k, v in opts.items():
+        if k.startswith('spark.cassandra'):
+            conf.set(k, str(v))
+
+    session = sc._jvm.com.datastax.spark.connector.cql.CassandraConnector.apply(conf).openSession()
+    count   = 0
+
+    try:
+        for key in keys:
+            where = ' AND '.join('{} = {}'.format(c, int(v)) for c, v in sorted(key.items()))
+            session.execute('DELETE FROM {}.{} WHERE {}'.format(opts['keyspace'], table, where))
+            count += 1
+    finally:
+        session.close()
+
+    ccdc.logger(sc, name=__name__).info('deleted {} partitions from {}'.format(count, table))
+    return count
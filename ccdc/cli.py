@@ -10,29 +10,39 @@ Prerequisites:
 
 from ccdc import ARD
 from ccdc import AUX
-from ccdc import cassandra
 from ccdc import features
+from ccdc import fetch
 from ccdc import grid
 from ccdc import ids
+from ccdc import ledger
 from ccdc import logger
 from ccdc import metadata
 from ccdc import pyccd
 from ccdc import randomforest
+from ccdc import region
+from ccdc import sink
 from ccdc import timeseries
 
+from cytoolz   import concat
+from cytoolz   import dissoc
 from cytoolz   import do
 from cytoolz   import filter
 from cytoolz   import first
 from cytoolz   import get
 from cytoolz   import merge
+from cytoolz   import second
 from cytoolz   import take
 from cytoolz   import thread_last
+from cytoolz   import unique
 from functools import partial
+from itertools import chain
 from merlin    import functions
 
 import ccdc
 import click
+import csv
 import datetime
+import time
 import traceback
 
 
@@ -49,12 +59,15 @@ def context_settings():
 def acquired():
     """Dynamically generated acquired date range
 
+    The range ends on today's date rather than the current time, so runs
+    started on the same day share chip cache keys.
+
     Returns:
         str: ISO8601 compliant date range
     """
     
     start = '0001-01-01'
-    end   = datetime.datetime.now().isoformat()
+    end   = datetime.datetime.now().date().isoformat()
     return '{}/{}'.format(start, end)
     
 
@@ -64,19 +77,256 @@ def entrypoint():
     pass
 
 
+def incremental(ctx, xys, acquired):
+    """Updates stored change detection results for a batch of chip ids
+
+    Chips whose stored segments can be extended only fetch observations
+    after their open segments, see pyccd.since() and pyccd.update().  All
+    other chips fall back to full detection over acquired.
+
+    Args:
+        ctx: spark context
+        xys: [(x,y), (x1, y1),...]
+        acquired (str): ISO8601 date range
+
+    Returns:
+        tuple: (RDD of pyccd results, [RDDs to unpersist once written])
+    """
+
+    log     = logger(ctx, __name__)
+    prior   = pyccd.select(ctx=ctx, xys=xys).rdd\
+                   .map(lambda r: ((r.chipx, r.chipy), pyccd.decode(r.asDict())))\
+                   .groupByKey()\
+                   .mapValues(list)\
+                   .persist()
+
+    ranges  = dict(prior.mapValues(partial(pyccd.since, acquired=acquired)).collect())
+    stale   = [(x, y, ranges[(x, y)]) for x, y in xys if get((x, y), ranges)]
+    ard     = timeseries.chips(ctx=ctx, cids=ids.rdd(ctx=ctx, xys=stale), acquired=acquired, cfg=ccdc.ARD, name='ard-update')
+    updated = ard.join(prior)\
+                 .map(lambda kv: (first(kv), pyccd.update(timeseries=(first(kv), first(second(kv))),
+                                                          rows=second(second(kv)))))\
+                 .persist()
+
+    fallback = updated.filter(lambda kv: second(kv) is None).keys().collect()
+    full     = [xy for xy in xys if not get(tuple(xy), ranges)] + fallback
+    rdd      = updated.flatMap(lambda kv: second(kv) or [])
+
+    log.info('updating {} chips, {} fell back to full detection, {} without stored results'.format(
+        len(stale), len(fallback), len(full) - len(fallback)))
+
+    if full:
+        cids = ids.rdd(ctx=ctx, xys=full)
+        ard  = timeseries.chips(ctx=ctx, cids=cids, acquired=acquired, cfg=ccdc.ARD, name='ard')
+        rdd  = rdd.union(pyccd.chips(ctx=ctx, timeseries=ard))
+
+    return rdd, [prior, updated]
+
+
+def checkpoint(ctx, df):
+    """Materialises a dataframe and truncates its lineage
+
+    The checkpoint is written to ccdc.CHECKPOINT_DIR, which should be on a
+    shared filesystem so it survives the loss of an executor.  Without it
+    the checkpoint is kept in executor storage: losing an executor then
+    fails the job instead of recomputing df from its sources.
+
+    Args:
+        ctx: spark context
+        df: dataframe
+
+    Returns:
+        materialised dataframe
+    """
+
+    if not ccdc.CHECKPOINT_DIR:
+        return df.localCheckpoint(eager=True)
+
+    ctx.setCheckpointDir(ccdc.CHECKPOINT_DIR)
+    return df.checkpoint(eager=True)
+
+
+def detection(ctx, xys, acquired, update=False):
+    """Runs change detection for a batch of chip ids and saves the results
+
+    The batch is only held in memory until it has been written.  Chips are
+    recorded in the ledger once their segments have been saved.
+
+    When updating, stored results are replaced chip by chip, see incremental().
+    The updated results are checkpointed before stored chips are deleted, so
+    they are never recomputed from a partially deleted table.  Otherwise
+    results are built through Arrow when ccdc.ARROW is set.
+
+    Args:
+        ctx: spark context
+        xys: [(x,y), (x1, y1),...]
+        acquired (str): ISO8601 date range
+        update (bool): update stored results instead of detecting from scratch
+
+    Returns:
+        count of saved segments
+    """
+
+    if update:
+        rdd, cached = incremental(ctx=ctx, xys=xys, acquired=acquired)
+        ccd = pyccd.dataframe(ctx=ctx, rdd=rdd)
+    elif ccdc.ARROW:
+        cached = []
+        ccd    = pyccd.columnar(ctx=ctx, cids=ids.rdd(ctx=ctx, xys=xys), acquired=acquired)
+    else:
+        cids   = ids.rdd(ctx=ctx, xys=xys)
+        ard    = timeseries.chips(ctx=ctx, cids=cids, acquired=acquired, cfg=ccdc.ARD, name='ard')
+        ccd    = pyccd.dataframe(ctx=ctx, rdd=pyccd.chips(ctx=ctx, timeseries=ard))
+        cached = []
+
+    # updated rows are computed from the stored rows they replace, so they
+    # are materialised before those rows are deleted
+    ccd = checkpoint(ctx, ccd) if update else ccd.persist()
+
+    try:
+        if update:
+            # segment end days are part of the primary key, so rewritten chips
+            # must be removed before their results are saved again
+            keys = ccd.select('chipx', 'chipy').distinct().collect()
+            sink.delete(ctx, pyccd.table(), [k.asDict() for k in keys])
+
+        pyccd.write(ctx, ccd)
+        ledger.write(ctx, ledger.dataframe(ccd, acquired=acquired, detector=pyccd.algorithm()))
+        return ccd.count()
+    finally:
+        ccd.unpersist()
+        for r in cached:
+            r.unpersist()
+
+
+def stream(ctx, xys, acquired, batch_size, in_flight, log, update=False):
+    """Runs change detection over chip ids in bounded micro-batches.
+
+    Each batch is a separate Spark job and up to in_flight batches run at
+    once, so fetching, detecting and writing of consecutive batches overlap
+    while memory stays bounded by batch_size * in_flight chips.
+
+    Args:
+        ctx: spark context
+        xys: [(x,y), (x1, y1),...] or a numpy array, see grid.array()
+        acquired (str): ISO8601 date range
+        batch_size (int): chips per batch
+        in_flight (int): maximum concurrent batches
+        log: logger
+        update (bool): update stored results, see detection()
+
+    Returns:
+        count of saved segments
+    """
+
+    batches = [xys[i:i + batch_size] for i in range(0, len(xys), batch_size)]
+    start   = time.time()
+    written = 0
+    done    = 0
+
+    log.info('detecting {} chips in {} batches of {}, {} in flight...'.format(len(xys), len(batches), batch_size, in_flight))
+
+    fn = lambda b: (len(b), detection(ctx=ctx, xys=grid.tuples(b), acquired=acquired, update=update))
+
+    for i, (chips, segments) in enumerate(fetch.pmap(fn, batches, concurrency=in_flight), start=1):
+        written += segments
+        done    += chips
+        rate     = done / max(time.time() - start, 1e-9)
+        log.info('batch {}/{} complete: {} chips, {} segments, {:.2f} chips/sec'.format(i, len(batches), chips, segments, rate))
+
+    return written
+
+
+def tiledetection(ctx, x, y, acquired, number, batch_size, in_flight, log, cfg=ARD, resume=False, update=False):
+    """Runs change detection for a tile and saves results and tile metadata
+
+    When resuming, chips already in the ledger for this detector and
+    acquired range are skipped and their segments are counted from the ledger.
+
+    Args:
+        ctx: spark context
+        x          (int): tile x coordinate
+        y          (int): tile y coordinate
+        acquired   (str): ISO8601 date range
+        number     (int): Number of chips to run change detection on.  Testing only.
+        batch_size (int): Number of chips per micro-batch
+        in_flight  (int): Maximum number of micro-batches processed concurrently
+        log: logger
+        cfg (dict): Merlin configuration used to resolve the tile
+        resume (bool): skip chips that have already completed
+        update (bool): update stored results from newly acquired observations
+
+    Returns:
+        dict: detection metadata for the tile
+    """
+
+    start = time.time()
+    tile  = grid.tile(x=x, y=y, cfg=cfg)
+    xys   = list(take(number, grid.chips(tile)))
+    done  = ledger.completed(ctx, xys, acquired, pyccd.algorithm()) if resume else {}
+    todo  = [xy for xy in xys if xy not in done]
+
+    # emit parameters
+    log.info(str(merge(dissoc(tile, 'chips'), {'acquired': acquired,
+                                               'input-partitions': ccdc.INPUT_PARTITIONS,
+                                               'product-partitions': ccdc.PRODUCT_PARTITIONS,
+                                               'batch-size': batch_size,
+                                               'in-flight': in_flight,
+                                               'resume': resume,
+                                               'update': update,
+                                               'chips': len(xys),
+                                               'remaining': len(todo)})))
+
+    log.info('finding ccd segments...')
+    written = stream(ctx=ctx,
+                     xys=todo,
+                     acquired=acquired,
+                     batch_size=batch_size,
+                     in_flight=in_flight,
+                     log=log,
+                     update=update) + sum(done.values())
+
+    # write metadata
+    md =  metadata.detection(tilex=int(get('x', tile)),
+                             tiley=int(get('y', tile)),
+                             h=int(get('h', tile)),
+                             v=int(get('v', tile)),
+                             acquired=acquired,
+                             detector=pyccd.algorithm(),
+                             ardurl=ccdc.ARD_CHIPMUNK,
+                             segcount=written)
+
+    _ = metadata.write(ctx, metadata.dataframe(ctx, md))
+
+    elapsed = time.time() - start
+    log.info('tile h:{} v:{} complete: {} chips, {} segments in {:.1f}s, {:.2f} chips/sec'.format(
+        get('h', tile), get('v', tile), len(todo), written, elapsed, len(todo) / max(elapsed, 1e-9)))
+
+    return md
+
+
 @entrypoint.command()
-@click.option('--x',        '-x', required=True)
-@click.option('--y',        '-y', required=True)
-@click.option('--acquired', '-a', required=False, default=acquired())
-@click.option('--number',   '-n', required=False, default=2500)
-def changedetection(x, y, acquired=acquired(), number=2500):
+@click.option('--x',          '-x', required=True, type=float)
+@click.option('--y',          '-y', required=True, type=float)
+@click.option('--acquired',   '-a', required=False, default=acquired())
+@click.option('--number',     '-n', required=False, default=2500)
+@click.option('--batch-size', '-b', required=False, default=ccdc.BATCH_SIZE)
+@click.option('--in-flight',  '-f', required=False, default=ccdc.BATCH_IN_FLIGHT)
+@click.option('--resume',     '-r', is_flag=True, default=False)
+@click.option('--update',     '-u', is_flag=True, default=False)
+def changedetection(x, y, acquired=acquired(), number=2500, batch_size=ccdc.BATCH_SIZE, in_flight=ccdc.BATCH_IN_FLIGHT,
+                    resume=False, update=False):
     """Run change detection for a tile and save results to Cassandra.
     
     Args:
-        x        (int): tile x coordinate
-        y        (int): tile y coordinate
-        acquired (str): ISO8601 date range
-        number   (int): Number of chips to run change detection on.  Testing only.
+        x          (int): tile x coordinate
+        y          (int): tile y coordinate
+        acquired   (str): ISO8601 date range
+        number     (int): Number of chips to run change detection on.  Testing only.
+        batch_size (int): Number of chips per micro-batch
+        in_flight  (int): Maximum number of micro-batches processed concurrently
+        resume    (bool): Skip chips that already have results
+        update    (bool): Update stored results from newly acquired observations
 
     Returns:
         count of saved segments 
@@ -94,31 +344,16 @@ def changedetection(x, y, acquired=acquired(), number=2500):
         
         # wire everything up
         print(ARD)
-        tile = grid.tile(x=x, y=y, cfg=ARD)
-        cids = ids.rdd(ctx=ctx, xys=list(take(number, tile.get('chips'))))
-        ard  = timeseries.rdd(ctx=ctx, cids=cids, acquired=acquired, cfg=ccdc.ARD, name='ard')
-        ccd  = pyccd.dataframe(ctx=ctx, rdd=pyccd.rdd(ctx=ctx, timeseries=ard)).cache()
-
-        # emit parameters
-        log.info(str(merge(tile, {'acquired': acquired,
-                                  'input-partitions': ccdc.INPUT_PARTITIONS,
-                                  'product-partitions': ccdc.PRODUCT_PARTITIONS,
-                                  'chips': cids.count()})))
-
-        log.info('finding ccd segments...')
-        written = pyccd.write(ctx, ccd).count()
-
-        # write metadata
-        md =  metadata.detection(tilex=int(get('x', tile)),
-                                 tiley=int(get('y', tile)),
-                                 h=int(get('h', tile)),
-                                 v=int(get('v', tile)),
-                                 acquired=acquired,
-                                 detector=pyccd.algorithm(),
-                                 ardurl=ccdc.ARD_CHIPMUNK,
-                                 segcount=written)
-        
-        _ = metadata.write(ctx, metadata.dataframe(ctx, md))
+        md = tiledetection(ctx=ctx,
+                           x=x,
+                           y=y,
+                           acquired=acquired,
+                           number=number,
+                           batch_size=batch_size,
+                           in_flight=in_flight,
+                           log=log,
+                           resume=resume,
+                           update=update)
                         
         # log and return metadata for detection job
         return do(log.info, "{} complete: {}".format(name, md))
@@ -134,48 +369,528 @@ def changedetection(x, y, acquired=acquired(), number=2500):
             ctx.stop()
             ctx = None
 
+
+def points(hvs=(), xys=(), path=None, cfg=ARD):
+    """Returns tile points for grid coordinates, projection coordinates and a tile file
+
+    The file is csv with a header row containing either h,v or x,y columns,
+    such as resources/conus.csv.  Duplicate points are removed while keeping
+    order.
+
+    Args:
+        hvs  (sequence): ['h,v', ...]
+        xys  (sequence): ['x,y', ...]
+        path (str): path to a tile csv file
+        cfg (dict): Merlin configuration used to resolve h,v
+
+    Returns:
+        list: [(x, y), (x1, y1), ...]
+    """
+
+    def pair(s):
+        a, b = s.split(',')
+        return (a.strip(), b.strip())
+
+    rows = []
+
+    if path:
+        with open(path) as f:
+            rows = list(csv.DictReader(line.strip('\0') for line in f if line.strip('\0\r\n')))
+
+    hv = chain(map(pair, hvs), ((r['h'], r['v']) for r in rows if 'h' in r and 'v' in r))
+    xy = chain(map(pair, xys), ((r['x'], r['y']) for r in rows if 'x' in r and 'y' in r and 'h' not in r))
+
+    return list(unique(chain((grid.point(h=h, v=v, cfg=cfg) for h, v in hv),
+                             ((float(x), float(y)) for x, y in xy))))
+
+
+@entrypoint.command()
+@click.option('--hv',          '-t', required=False, multiple=True)
+@click.option('--xy',          '-p', required=False, multiple=True)
+@click.option('--file',        '-i', required=False, default=None)
+@click.option('--acquired',    '-a', required=False, default=acquired())
+@click.option('--number',      '-n', required=False, default=2500)
+@click.option('--batch-size',  '-b', required=False, default=ccdc.BATCH_SIZE)
+@click.option('--in-flight',   '-f', required=False, default=ccdc.BATCH_IN_FLIGHT)
+@click.option('--concurrency', '-c', required=False, default=ccdc.TILES_IN_FLIGHT)
+@click.option('--resume',      '-r', is_flag=True, default=False)
+@click.option('--update',      '-u', is_flag=True, default=False)
+def batchdetection(hv=(), xy=(), file=None, acquired=acquired(), number=2500, batch_size=ccdc.BATCH_SIZE,
+                   in_flight=ccdc.BATCH_IN_FLIGHT, concurrency=ccdc.TILES_IN_FLIGHT, resume=False, update=False):
+    """Run change detection for many tiles in one Spark context.
+
+    Tiles are scheduled from a work queue with up to concurrency tiles
+    running at once.  Grid definitions are requested once and reused for
+    every tile.  A failed tile is logged and does not stop the batch.
+
+    Args:
+        hv          (str): tile grid coordinates 'h,v', may be repeated
+        xy          (str): tile projection coordinates 'x,y', may be repeated
+        file        (str): csv file of tiles with h,v or x,y columns
+        acquired    (str): ISO8601 date range
+        number      (int): Number of chips per tile to run change detection on.  Testing only.
+        batch_size  (int): Number of chips per micro-batch
+        in_flight   (int): Maximum number of micro-batches processed concurrently per tile
+        concurrency (int): Maximum number of tiles processed concurrently
+        resume     (bool): Skip chips that already have results
+        update     (bool): Update stored results from newly acquired observations
+
+    Returns:
+        list of detection metadata for completed tiles
+    """
+
+    ctx  = None
+    name = 'batch-change-detection'
+
+    try:
+        # start and/or connect Spark
+        ctx  = ccdc.context(name)
+
+        # get logger
+        log  = logger(ctx, name)
+
+        cfg  = fetch.configure(ARD)
+        xys  = points(hvs=hv, xys=xy, path=file, cfg=cfg)
+
+        log.info('{}: {} tiles, {} concurrently'.format(name, len(xys), concurrency))
+
+        def run(xy):
+            try:
+                return (xy, tiledetection(ctx=ctx,
+                                          x=first(xy),
+                                          y=second(xy),
+                                          acquired=acquired,
+                                          number=number,
+                                          batch_size=batch_size,
+                                          in_flight=in_flight,
+                                          log=log,
+                                          cfg=cfg,
+                                          resume=resume,
+                                          update=update))
+            except Exception as e:
+                log.error('tile x:{} y:{} failed: {}'.format(first(xy), second(xy), e))
+                traceback.print_exc()
+                return (xy, None)
+
+        start  = time.time()
+        done   = []
+        failed = []
+
+        for i, (xy, md) in enumerate(fetch.pmap(run, xys, concurrency=concurrency), start=1):
+            if md is None:
+                failed.append(xy)
+            else:
+                done.append(md)
+
+            elapsed = time.time() - start
+            log.info('{}/{} tiles finished, {} failed, {:.1f}s elapsed, {:.2f} tiles/hour'.format(
+                i, len(xys), len(failed), elapsed, len(done) * 3600 / max(elapsed, 1e-9)))
+
+        if failed:
+            log.warn('{} failed tiles: {}'.format(len(failed), failed))
+
+        log.info('{} complete: {} of {} tiles'.format(name, len(done), len(xys)))
+        return done
+
+    except Exception as e:
+        # spark errors & stack trace
+        print('{} error:{}'.format(name, e))
+        traceback.print_exc()
+
+    finally:
+        # stop and/or disconnect Spark
+        if ctx is not None:
+            ctx.stop()
+            ctx = None
+
             
-def training(ctx, cids, msday, meday, acquired=acquired()):
-    """Trains and returns a random forest model for the grid
+@entrypoint.command()
+@click.option('--bbox',             required=False, default=None)
+@click.option('--hv',         '-t', required=False, multiple=True)
+@click.option('--geojson',    '-g', required=False, multiple=True)
+@click.option('--acquired',   '-a', required=False, default=acquired())
+@click.option('--batch-size', '-b', required=False, default=ccdc.BATCH_SIZE)
+@click.option('--in-flight',  '-f', required=False, default=ccdc.BATCH_IN_FLIGHT)
+@click.option('--resume',     '-r', is_flag=True, default=False)
+@click.option('--update',     '-u', is_flag=True, default=False)
+def regiondetection(bbox=None, hv=(), geojson=(), acquired=acquired(), batch_size=ccdc.BATCH_SIZE,
+                    in_flight=ccdc.BATCH_IN_FLIGHT, resume=False, update=False):
+    """Run change detection for the chips of a study area and save results.
+
+    The area is the union of a bounding box, tiles and GeoJSON polygons.  Only
+    chips touching it are run, see region.py, and they are streamed in equal
+    micro-batches regardless of the tiles they belong to.  Tile metadata is
+    not written as tiles may be partially covered.
+
+    Args:
+        bbox         (str): 'ulx,uly,lrx,lry'
+        hv      (sequence): ['h,v', ...]
+        geojson (sequence): paths to GeoJSON files in the grid projection
+        acquired     (str): ISO8601 date range
+        batch_size   (int): Number of chips per micro-batch
+        in_flight    (int): Maximum number of micro-batches processed concurrently
+        resume      (bool): Skip chips that already have results
+        update      (bool): Update stored results from newly acquired observations
+
+    Returns:
+        count of saved segments
+    """
+
+    ctx  = None
+    name = 'region-change-detection'
+
+    try:
+        # start and/or connect Spark
+        ctx  = ccdc.context(name)
+
+        # get logger
+        log  = logger(ctx, name)
+
+        start = time.time()
+        xys   = region.chips(cfg=fetch.configure(ARD),
+                             box=region.bbox(bbox) if bbox else None,
+                             hvs=[h.split(',') for h in hv],
+                             shapes=list(concat(map(region.load, geojson))))
+        done  = ledger.completed(ctx, xys, acquired, pyccd.algorithm()) if resume else {}
+        todo  = grid.difference(xys, list(done)) if done else xys
+
+        log.info('{}: {} chips, {} remaining, found in {:.1f}s'.format(name, len(xys), len(todo), time.time() - start))
+
+        written = stream(ctx=ctx,
+                         xys=todo,
+                         acquired=acquired,
+                         batch_size=batch_size,
+                         in_flight=in_flight,
+                         log=log,
+                         update=update) + sum(done.values())
+
+        log.info('{} complete: {} chips, {} segments'.format(name, len(xys), written))
+        return written
+
+    except Exception as e:
+        # spark errors & stack trace
+        print('{} error:{}'.format(name, e))
+        traceback.print_exc()
+
+    finally:
+        # stop and/or disconnect Spark
+        if ctx is not None:
+            ctx.stop()
+            ctx = None
+
+
+def stored(ctx, x, y, msday, meday, acquired=acquired(), directory=None, per_class=None, per_chip=None):
+    """Returns the stored random forest model for the training area around a tile
+
+    Args:
+        see training()
+
+    Returns:
+        (stored model or None, model path or None)
+    """
+
+    log   = logger(ctx, __name__)
+    tiles = grid.near(x, y, AUX)
+    key   = randomforest.key(tiles, msday, meday, acquired, per_class, per_chip)
+    path  = randomforest.path(key, directory)
+    model = randomforest.read(ctx, key, directory)
+
+    if model is not None:
+        log.info('reusing stored model {}'.format(path))
+
+    return model, path
+
+
+def training(ctx, x, y, msday, meday, acquired=acquired(), directory=None, per_class=None, per_chip=None, ccd=None,
+             reuse=True):
+    """Returns a random forest model for the training area around a tile
+
+    A model stored for the same training tiles, period, acquired range,
+    features and ccdc version is reused.  Otherwise a model is trained and
+    stored when a model directory is configured.
 
     Args:
         ctx: spark context
-        cids: [(x,y), (x1, y1),...]
+        x: x coordinate in tile
+        y: y coordinate in tile
         msday: ordinal model start day
         meday: ordinal model end day
         acquired: ISO8601 date range "YYYY-MM-DD/YYYY-MM-DD"
+        directory: model store directory, defaults to ccdc.MODEL_DIR
+        per_class: maximum training rows per label, defaults to ccdc.TRAINING_PER_CLASS
+        per_chip: maximum training rows per chip, defaults to ccdc.TRAINING_PER_CHIP
+        ccd: pyccd dataframe containing the training chips, read if None
+        reuse: look for a stored model first, see stored()
 
     Returns:
-        trained model
+        (trained model, model path or None)
     """
-    log = logger(ctx, __name__)
+    log   = logger(ctx, __name__)
+    tiles = grid.near(x, y, AUX)
+    desc  = randomforest.manifest(tiles, msday, meday, acquired, per_class, per_chip)
+    key   = randomforest.key(tiles, msday, meday, acquired, per_class, per_chip)
+
+    if reuse:
+        model, path = stored(ctx, x, y, msday, meday, acquired, directory, per_class, per_chip)
+
+        if model is not None:
+            return model, path
+
+    log.info('training model with training grid chip ids...')
     model = randomforest.train(ctx=ctx,
-                               cids=ids.rdd(ctx, cids),
+                               cids=ids.rdd(ctx, grid.training(x, y, AUX)),
                                msday=msday,
                                meday=meday,
-                               acquired=acquired)
+                               acquired=acquired,
+                               per_class=per_class,
+                               per_chip=per_chip,
+                               ccd=ccd)
 
     if model is None:
         log.warn('Model could not be trained.')
-    else:
-        log.debug('model type:{}'.format(type(model)))
-        log.debug('model:{}'.format(model))
+        return None, None
+
+    log.debug('model type:{}'.format(type(model)))
+    log.debug('model:{}'.format(model))
+    return model, randomforest.write(ctx, model, key, desc, directory)
+
+
+def tileclassification(ctx, model, x, y, msday, meday, acquired, log, classifier='', ccd=None):
+    """Classify the change segments of one tile with a trained model
+
+    Args:
+        ctx: spark context
+        model: trained model, see training()
+        x (int): x coordinate in tile
+        y (int): y coordinate in tile
+        msday (int): ordinal day, beginning of training period
+        meday (int): ordinal day, end of training period
+        acquired (str): date range of change segments to classify
+        log: logger
+        classifier (str): model reference recorded in tile metadata
+        ccd: pyccd dataframe containing the classification chips, read if None
+
+    Returns:
+        dict: classification metadata
+    """
+
+    log.info('x:{} y:{} acquired:{}'.format(x, y, acquired))
+
+    log.info('finding classification grid chip ids...')
+    xys  = grid.classification(x, y, AUX)
+    cids = ids.dataframe(ctx=ctx,
+                         rdd=ids.rdd(ctx, xys),
+                         schema=ids.chip_schema())
+
+    log.info('found {} classification grid chip ids...'.format(len(xys)))
+
+    log.info('finding change segments...')
+    ccd = pyccd.restrict(ccd if ccd is not None else pyccd.select(ctx, xys), cids)\
+               .filter('sday >= 0 AND eday >= 0')
+
+    log.info('finding aux rasters...')
+    aux = timeseries.static(ctx,
+                            cids.rdd.repartition(ccdc.INPUT_PARTITIONS),
+                            acquired)
+
+    log.info('finding classification features...')
+    fdf = features.dataframe(aux, ccd)
+
+    log.info('predicting classes...')
+    preds = randomforest.classify(model, fdf).persist()
+
+    log.info('saving classification results...')
+    written = pyccd.write(ctx, preds).count()
+    log.info('saved {} classification results'.format(written))
+
+    preds.unpersist()
+
+    # write metadata
+    # doing this driver side instead of udf as metadata is only 1 small record per tile
+    tile = grid.tile(x=x, y=y, cfg=ARD)
+
+    tids = ids.dataframe(ctx=ctx,
+                         rdd=ids.rdd(ctx=ctx, xys=((tile['x'], tile['y']),)),
+                         schema=ids.tile_schema())
+
+    md = merge(dict.fromkeys(metadata.schema().names),
+               get(0, [r.asDict() for r in metadata.read(ctx=ctx, ids=tids).take(1)], {}),
+               metadata.classify(tilex=tile['x'],
+                                 tiley=tile['y'],
+                                 msday=msday,
+                                 meday=meday,
+                                 classifier=classifier,
+                                 auxurl=ccdc.AUX_CHIPMUNK))
+
+    metadata.write(ctx=ctx, df=metadata.dataframe(ctx=ctx, d=md))
+    return md
+
+
+@entrypoint.command()
+@click.option('--x',        '-x', required=True, type=float)
+@click.option('--y',        '-y', required=True, type=float)
+@click.option('--msday',    '-s', required=True)
+@click.option('--meday',    '-e', required=True)
+@click.option('--acquired', '-a', required=False, default=acquired())
+@click.option('--output',   '-o', required=False, default=ccdc.MODEL_DIR)
+@click.option('--per-class',      required=False, default=ccdc.TRAINING_PER_CLASS)
+@click.option('--per-chip',       required=False, default=ccdc.TRAINING_PER_CHIP)
+def train(x, y, msday, meday, acquired=acquired(), output=ccdc.MODEL_DIR,
+          per_class=ccdc.TRAINING_PER_CLASS, per_chip=ccdc.TRAINING_PER_CHIP):
+    """Train a random forest model for the training area around a tile.
+
+    The model and a manifest describing it are saved under output, named
+    by their model store key.  An existing model for the same inputs is
+    reused.  Pass the printed path to classify.
+
+    Args:
+        x        (int): x coordinate in tile
+        y        (int): y coordinate in tile
+        msday    (int): ordinal day, beginning of training period
+        meday    (int): ordinal day, end of training period
+        acquired (str): ISO8601 date range
+        output   (str): model directory, defaults to MODEL_DIR
+        per_class (int): maximum training rows per label, 0 for no limit
+        per_chip  (int): maximum training rows per chip, 0 for no limit
+
+    Returns:
+        str: path of the trained model
+    """
+
+    ctx  = None
+    name = 'random-forest-training'
+
+    try:
+        if not output:
+            raise ValueError('a model directory is required, set --output or MODEL_DIR')
+
+        ctx = ccdc.context(name)
+        log = logger(ctx, name)
+
+        log.info('beginning {}...'.format(name))
+        log.info('x:{} y:{} msday:{} meday:{} acquired:{}'.format(x, y, msday, meday, acquired))
+
+        model, path = training(ctx=ctx,
+                               x=x,
+                               y=y,
+                               msday=msday,
+                               meday=meday,
+                               acquired=acquired,
+                               directory=output,
+                               per_class=per_class,
+                               per_chip=per_chip)
+
+        if path is not None:
+            log.info('{} complete, model:{}'.format(name, path))
+            print(path)
+
+        return path
+
+    except Exception as e:
+        # spark errors & stack trace
+        print('{} error:{}'.format(name, e))
+        traceback.print_exc()
+    finally:
+        # stop and/or disconnect Spark
+        if ctx is not None:
+            ctx.stop()
+            ctx = None
+
+
+@entrypoint.command()
+@click.option('--model',       '-m', required=True)
+@click.option('--hv',          '-t', required=False, multiple=True)
+@click.option('--xy',          '-p', required=False, multiple=True)
+@click.option('--file',        '-i', required=False, default=None)
+@click.option('--acquired',    '-a', required=False, default=acquired())
+@click.option('--concurrency', '-c', required=False, default=ccdc.TILES_IN_FLIGHT)
+def classify(model, hv=(), xy=(), file=None, acquired=acquired(), concurrency=ccdc.TILES_IN_FLIGHT):
+    """Classify many tiles with a model saved by train, in one Spark context.
+
+    The model is loaded once and shared by every tile.  The training period
+    is taken from the model manifest.  A failed tile is logged and does not
+    stop the batch.
+
+    Args:
+        model       (str): path of a model saved by train
+        hv          (str): tile grid coordinates 'h,v', may be repeated
+        xy          (str): tile projection coordinates 'x,y', may be repeated
+        file        (str): csv file of tiles with h,v or x,y columns
+        acquired    (str): date range of change segments to classify
+        concurrency (int): Maximum number of tiles processed concurrently
+
+    Returns:
+        list of classification metadata for completed tiles
+    """
+
+    ctx  = None
+    name = 'random-forest-classify'
+
+    try:
+        ctx = ccdc.context(name)
+        log = logger(ctx, name)
+
+        rf, desc = randomforest.load(ctx, model)
+        randomforest.compatible(desc)
+
+        xys = points(hvs=hv, xys=xy, path=file, cfg=fetch.configure(ARD))
+
+        log.info('{}: {} tiles, {} concurrently, model:{}'.format(name, len(xys), concurrency, model))
+
+        def run(xy):
+            try:
+                return (xy, tileclassification(ctx=ctx,
+                                               model=rf,
+                                               x=first(xy),
+                                               y=second(xy),
+                                               msday=desc['msday'],
+                                               meday=desc['meday'],
+                                               acquired=acquired,
+                                               log=log,
+                                               classifier=model))
+            except Exception as e:
+                log.error('tile x:{} y:{} failed: {}'.format(first(xy), second(xy), e))
+                traceback.print_exc()
+                return (xy, None)
+
+        done   = []
+        failed = []
+
+        for i, (xy, md) in enumerate(fetch.pmap(run, xys, concurrency=concurrency), start=1):
+            if md is None:
+                failed.append(xy)
+            else:
+                done.append(md)
+            log.info('{}/{} tiles finished, {} failed'.format(i, len(xys), len(failed)))
+
+        if failed:
+            log.warn('{} failed tiles: {}'.format(len(failed), failed))
+
+        log.info('{} complete: {} of {} tiles'.format(name, len(done), len(xys)))
+        return done
+
+    except Exception as e:
+        # spark errors & stack trace
+        print('{} error:{}'.format(name, e))
+        traceback.print_exc()
+    finally:
+        # stop and/or disconnect Spark
+        if ctx is not None:
+            ctx.stop()
+            ctx = None
 
-    return model
 
-            
 @entrypoint.command()
-@click.option('--x', '-x', required=True)
-@click.option('--y', '-y', required=True)
+@click.option('--x', '-x', required=True, type=float)
+@click.option('--y', '-y', required=True, type=float)
 @click.option('--msday', '-s', required=True)
 @click.option('--meday', '-e', required=True)
 @click.option('--acquired', '-a', required=False, default=acquired())
 def classification(x, y, msday, meday, acquired=acquired()): 
     """
-    Classify a tile.
+    Train and classify a single tile.
 
     Args:
-        acquired (str): ISO8601 date range       
         x        (int): x coordinate in tile
         y        (int): y coordinate in tile
         msday    (int): ordinal day, beginning of training period
@@ -184,6 +899,7 @@ def classification(x, y, msday, meday, acquired=acquired()):
     """
   
     ctx = None
+    ccd = None
     name = 'random-forest-classification'
     
     try:
@@ -191,76 +907,46 @@ def classification(x, y, msday, meday, acquired=acquired()):
         log = logger(ctx, name)
 
         log.info('beginning {}...'.format(name))
-        log.info('x:{} y:{} acquired:{}'.format(x, y, acquired))
 
-        log.info('training model with training grid chip ids...')
-        model = training(ctx=ctx,
-                         cids=grid.training(x, y, AUX),
-                         msday=msday,
-                         meday=meday,
-                         acquired=acquired)
+        model, path = stored(ctx=ctx, x=x, y=y, msday=msday, meday=meday, acquired=acquired)
 
         if model is None:
-            return
-
-        # end model training, begin classification
-        
-        log.info('finding classification grid chip ids...')
-        cids = ids.dataframe(ctx=ctx,
-                             rdd=ids.rdd(ctx, grid.classification(x, y, AUX)),
-                             schema=ids.chip_schema())
-        
-        log.info('found {} classification grid chip ids...'.format(cids.count()))
-        
-        log.info('finding change segments...')
-        ccd = pyccd.read(ctx,
-                         cids.repartition(ccdc.PRODUCT_PARTITIONS))\
-                         .filter('sday >= 0 AND eday >= 0')
-         
-        log.info('finding aux timeseries...')
-        aux = timeseries.aux(ctx,
-                             cids.rdd.repartition(ccdc.INPUT_PARTITIONS),
-                             acquired).repartition(ccdc.PRODUCT_PARTITIONS)        
-       
-        log.info('finding classification features...')
-        fdf = features.dataframe(aux, ccd)
-        
-        log.info('predicting classes...')
-        preds = randomforest.classify(model, fdf)
+            # the tile is inside its own training area, so change segments for
+            # training and classification are read from Cassandra once
+            xys = grid.union(grid.training(x, y, AUX), grid.classification(x, y, AUX))
+            ccd = pyccd.select(ctx, xys).persist()
+
+            model, path = training(ctx=ctx,
+                                   x=x,
+                                   y=y,
+                                   msday=msday,
+                                   meday=meday,
+                                   acquired=acquired,
+                                   ccd=ccd,
+                                   reuse=False)
 
-        log.info('saving classification results...')
-        results = pyccd.join(ccd, preds).persist()
-
-        log.debug('sample result:{}'.format(results.first()))
-        
-        written = pyccd.write(ctx, randomforest.dedensify(results)).count()
-        log.info('saved {} classification results'.format(written))
-
-        # write metadata
-        # doing this driver side instead of udf as metadata is only 1 small record per tile
-        tile = grid.tile(x=x, y=y, cfg=ARD)
-
-        tids = ids.dataframe(ctx=ctx,
-                             rdd=ids.rdd(ctx=ctx, xys=((tile['x'], tile['y']),)),
-                             schema=ids.tile_schema())
-
-        md = merge(metadata.read(ctx=ctx, ids=tids).first().asDict(),
-                   metadata.classify(tilex=tile['x'],
-                                     tiley=tile['y'],
-                                     msday=msday,
-                                     meday=meday,
-                                     classifier='',
-                                     auxurl=ccdc.AUX_CHIPMUNK))
+        if model is None:
+            return
 
-        return metadata.write(ctx=ctx,
-                              df=metadata.dataframe(ctx=ctx, d=md).first().asDict())
+        return tileclassification(ctx=ctx,
+                                  model=model,
+                                  x=x,
+                                  y=y,
+                                  msday=msday,
+                                  meday=meday,
+                                  acquired=acquired,
+                                  log=log,
+                                  classifier=path or '',
+                                  ccd=ccd)
 
-               
     except Exception as e:
         # spark errors & stack trace
         print('{} error:{}'.format(name, e))
         traceback.print_exc()    
     finally:
+        if ccd is not None:
+            ccd.unpersist()
+
         # stop and/or disconnect Spark
         if ctx is not None:
             ctx.stop()
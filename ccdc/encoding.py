@@ -0,0 +1,133 @@
+"""encoding.py packs per observation pyccd values into compact blobs.
+
+prmask -- processing mask, one bit per observation.  The observation count
+          is written first as a varint, followed by numpy.packbits() bytes.
+
+dates  -- ordinal dates, the first date then the difference to each previous
+          date, each zigzag varint encoded.  Consecutive ARD dates are days
+          apart so most dates take a single byte.
+
+Both round trip to the list form stored in the prmask and dates columns.
+"""
+
+from cytoolz import first
+
+import numpy
+
+
+def varints(values):
+    """Encodes non-negative integers as LEB128 varints
+
+    Args:
+        values (sequence): non-negative integers
+
+    Returns:
+        bytes
+    """
+
+    out = bytearray()
+
+    for v in values:
+        v = int(v)
+        while v > 0x7f:
+            out.append((v & 0x7f) | 0x80)
+            v >>= 7
+        out.append(v)
+
+    return bytes(out)
+
+
+def unvarints(blob, count=None):
+    """Decodes LEB128 varints
+
+    Args:
+        blob (bytes): encoded varints
+        count (int): number of values to decode, all if None
+
+    Returns:
+        (list of int, offset of the first byte not decoded)
+    """
+
+    values, value, shift, offset = [], 0, 0, 0
+
+    for offset, b in enumerate(bytearray(blob)):
+        if count is not None and len(values) == count:
+            return values, offset
+
+        value |= (b & 0x7f) << shift
+        shift += 7
+
+        if not b & 0x80:
+            values.append(value)
+            value, shift = 0, 0
+
+    return values, len(blob)
+
+
+def packdates(dates):
+    """Delta and zigzag varint encodes a list of ordinal dates
+
+    Args:
+        dates (sequence): ordinal dates, in any order
+
+    Returns:
+        bytes or None if dates is None
+    """
+
+    if dates is None:
+        return None
+
+    d = numpy.diff(numpy.asarray(dates, dtype=numpy.int64), prepend=0)
+    return varints(((d << 1) ^ (d >> 63)).tolist())
+
+
+def unpackdates(blob):
+    """Decodes packdates()
+
+    Args:
+        blob (bytes): packed dates
+
+    Returns:
+        list of int or None if blob is None
+    """
+
+    if blob is None:
+        return None
+
+    z = numpy.asarray(first(unvarints(blob)), dtype=numpy.int64)
+    return numpy.cumsum((z >> 1) ^ -(z & 1)).tolist()
+
+
+def packmask(mask):
+    """Bit packs a processing mask
+
+    Args:
+        mask (sequence): 0/1 values
+
+    Returns:
+        bytes or None if mask is None
+    """
+
+    if mask is None:
+        return None
+
+    m = numpy.asarray(mask, dtype=numpy.uint8)
+    return varints([len(m)]) + numpy.packbits(m).tobytes()
+
+
+def unpackmask(blob):
+    """Decodes packmask()
+
+    Args:
+        blob (bytes): packed mask
+
+    Returns:
+        list of int or None if blob is None
+    """
+
+    if blob is None:
+        return None
+
+    (count,), offset = unvarints(blob, 1)
+    bits = numpy.unpackbits(numpy.frombuffer(bytes(blob[offset:]), dtype=numpy.uint8))
+    return bits[:count].astype(int).tolist()
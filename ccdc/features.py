@@ -1,6 +1,100 @@
-from ccdc.udfs import densify
 from cytoolz import first
 from cytoolz import thread_last
+from pyspark.ml.feature import VectorAssembler
+from pyspark.sql import functions
+from pyspark.sql.types import ArrayType
+
+import ccdc
+
+
+def plan(df):
+    """Returns the physical plan of a dataframe
+
+    Under adaptive query execution the plan is wrapped in an
+    AdaptiveSparkPlan whose partitioning is only known once it has run, so
+    the plan it starts from is returned instead.
+    """
+
+    p = df._jdf.queryExecution().executedPlan()
+    return p.inputPlan() if p.nodeName() == 'AdaptiveSparkPlan' else p
+
+
+def nodes(p):
+    """Returns a physical plan node and all nodes below it"""
+
+    children = p.children()
+    return [p] + [n for i in range(children.size()) for n in nodes(children.apply(i))]
+
+
+def partitioning(df):
+    """Returns the hash partitioning of a dataframe
+
+    Args:
+        df: dataframe
+
+    Returns:
+        tuple: ([column names], number of partitions) or None if not hash partitioned
+    """
+
+    p = plan(df).outputPartitioning()
+
+    if p.getClass().getSimpleName() != 'HashPartitioning':
+        return None
+
+    exprs = [p.expressions().apply(i) for i in range(p.expressions().size())]
+
+    if any(e.getClass().getSimpleName() != 'AttributeReference' for e in exprs):
+        return None
+
+    return ([e.name() for e in exprs], p.numPartitions())
+
+
+def partitioned(df, partitions=None):
+    """Returns a dataframe hash partitioned by chip
+
+    Dataframes already partitioned by chip into the same number of
+    partitions are returned unaltered, so joins between them on chip
+    do not shuffle.
+
+    Args:
+        df: dataframe with chipx and chipy columns
+        partitions (int): number of partitions, defaults to ccdc.PRODUCT_PARTITIONS
+
+    Returns:
+        dataframe
+    """
+
+    n = partitions or ccdc.PRODUCT_PARTITIONS
+
+    if partitioning(df) == (['chipx', 'chipy'], n):
+        return df
+
+    return df.repartition(n, 'chipx', 'chipy')
+
+
+def exchanges(df):
+    """Returns the number of shuffles in the physical plan of a dataframe"""
+
+    return len([n for n in nodes(plan(df)) if n.nodeName() == 'Exchange'])
+
+
+def copartitioned(joined, *dfs):
+    """Raises ValueError if joining dfs added a shuffle
+
+    Args:
+        joined: dataframe joining dfs
+        dfs: dataframes partitioned by partitioned()
+
+    Returns:
+        joined
+    """
+
+    added = exchanges(joined) - sum(exchanges(df) for df in dfs)
+
+    if added > 0:
+        raise ValueError('chip partitioning was lost, join added {} shuffles'.format(added))
+
+    return joined
 
 
 def join(dfs):
@@ -12,9 +106,34 @@ def join(dfs):
     Returns:
         combined dataframe
     """
-    return dfs['aux'].join(dfs['ccd'],
-                           on=['chipx', 'chipy', 'pixelx', 'pixely'],
-                           how='inner')
+    return partitioned(dfs['aux']).join(partitioned(dfs['ccd']),
+                                        on=['chipx', 'chipy', 'pixelx', 'pixely'],
+                                        how='inner')
+
+
+def locate(static, ccd):
+    """Join aux rasters and ccd dataframes
+
+    Each ccd row takes its AUX values from the raster of its chip by
+    chip local index, so only one row per chip is joined.  Both sides are
+    partitioned by chip so the join is local to each partition.
+
+    Args:
+        static: aux raster dataframe, see timeseries.static()
+        ccd: ccd dataframe
+
+    Returns:
+        combined dataframe with one value per AUX layer
+    """
+
+    layers = [c for c in static.columns if c not in ('chipx', 'chipy', 'ox', 'oy', 'rx', 'ry', 'ncols')]
+    ccd    = partitioned(ccd)
+    static = partitioned(static)
+    df     = copartitioned(ccd.join(static, on=['chipx', 'chipy'], how='inner'), ccd, static)
+    index  = ((df.oy - df.pixely) / df.ry).cast('int') * df.ncols + ((df.pixelx - df.ox) / df.rx).cast('int')
+
+    return df.select(*([c for c in ccd.columns] +
+                       [df[l][index].alias(l) for l in layers if l not in ccd.columns]))
 
 
 def columns():
@@ -47,36 +166,65 @@ def dependent(df):
         dataframe with label column
     """
     
-    return df.withColumn('label', df.trends[0])
+    return df.withColumn('label', df.trends[0] if isinstance(df.schema['trends'].dataType, ArrayType) else df.trends)
+
+
+def value(df, name):
+    """Returns a column expression for the feature value of a column
+
+    Array columns contribute their first element.  Nulls become NaN.
+
+    Args:
+        df: dataframe
+        name (str): column name
+
+    Returns:
+        double column
+    """
+
+    c = df[name][0] if isinstance(df.schema[name].dataType, ArrayType) else df[name]
+    return functions.coalesce(c.cast('double'), functions.lit(float('nan')))
 
 
 def independent(df):
     """Create independent variable
 
+    Features are assembled by the JVM in columns() order, producing the same
+    values as udfs.densify without a Python round trip per row.
+
     Args:
         df: dataframe with columns as specified in columns()
 
     Returns:
         dataframe with features column
     """
-    
-    return df.withColumn('features', densify(*columns()))
+
+    names = ['__feature_{}'.format(c) for c in columns()]
+    exprs = [value(df, c).alias(n) for c, n in zip(columns(), names)]
+
+    assembler = VectorAssembler(inputCols=names, outputCol='features')
+
+    # Spark 2.4+ rejects NaN unless invalid values are kept
+    if assembler.hasParam('handleInvalid'):
+        assembler.setHandleInvalid('keep')
+
+    return assembler.transform(df.select('*', *exprs)).drop(*names)
 
 
 def dataframe(aux, ccd):
     """Create a dataframe suitable for training and classification
 
     Args:
-        aux: aux dataframe
+        aux: aux dataframe or aux raster dataframe, see timeseries.static()
         ccd: ccd dataframe
 
     Returns:
         dataframe with location, label and features
     """
 
-    df = thread_last({'aux': aux, 'ccd': ccd},
-                     join,
-                     dependent,
-                     independent)
+    joined = join({'aux': aux, 'ccd': ccd}) if 'pixelx' in aux.columns else locate(aux, ccd)
+    df     = thread_last(joined,
+                         dependent,
+                         independent)
     
     return df.select(['chipx', 'chipy', 'pixelx', 'pixely', 'sday', 'eday', 'label', 'features']) 
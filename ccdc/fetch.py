@@ -0,0 +1,182 @@
+"""fetch.py issues Chipmunk requests concurrently.
+
+A single keep-alive connection pool with retry and backoff is shared by every
+thread in a Python worker.  Requests for the ubids of a chip run concurrently,
+and pmap() keeps a bounded number of chips in flight per partition, yielding
+each result as soon as it completes.
+"""
+
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from cytoolz import assoc
+from cytoolz import concat
+from cytoolz import get
+from functools import partial
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import ccdc
+import logging
+import merlin
+import requests
+import threading
+
+logger = logging.getLogger(__name__)
+
+__lock     = threading.Lock()
+__sessions = {}
+__memos    = {}
+
+
+def session(connections=None, retries=None, backoff=None):
+    """Returns the pooled HTTP session for this Python worker
+
+    Args:
+        connections (int): size of the keep-alive connection pool
+        retries (int): number of retries for failed requests
+        backoff (float): exponential backoff factor in seconds
+
+    Returns:
+        requests.Session
+    """
+
+    connections = connections or ccdc.FETCH_CHIPS * ccdc.FETCH_REQUESTS
+    retries     = retries if retries is not None else ccdc.FETCH_RETRIES
+    backoff     = backoff if backoff is not None else ccdc.FETCH_BACKOFF
+    key         = (connections, retries, backoff)
+
+    with __lock:
+        if key not in __sessions:
+            retry   = Retry(total=retries,
+                            backoff_factor=backoff,
+                            status_forcelist=(429, 500, 502, 503, 504))
+            adapter = HTTPAdapter(pool_connections=connections,
+                                  pool_maxsize=connections,
+                                  max_retries=retry)
+            s = requests.Session()
+            s.mount('http://', adapter)
+            s.mount('https://', adapter)
+            __sessions[key] = s
+
+    return __sessions[key]
+
+
+def chips(x, y, acquired, ubids, url, resource='/chips', concurrency=None, retries=None, backoff=None):
+    """Returns chips from a Chipmunk url given x, y, date range and ubid sequence.
+
+    Drop-in replacement for merlin.chipmunk.chips that requests all ubids
+    concurrently over pooled connections.  Requests that still fail after
+    retries raise, so Spark retries the task instead of producing partial chips.
+
+    Args:
+        x (int): projection coordinate x
+        y (int): projection coordinate y
+        acquired (str): ISO8601 daterange '2012-01-01/2014-01-03'
+        ubids (sequence): sequence of ubids
+        url (str): protocol://host:port/path
+        resource (str): /chips/resource/path (default: /chips)
+        concurrency (int): concurrent requests, defaults to ccdc.FETCH_REQUESTS
+        retries (int): retries for failed requests, defaults to ccdc.FETCH_RETRIES
+        backoff (float): retry backoff factor, defaults to ccdc.FETCH_BACKOFF
+
+    Returns:
+        tuple: chips
+    """
+
+    endpoint = '{}{}'.format(url, resource)
+    limit    = concurrency or ccdc.FETCH_REQUESTS
+    pool     = session(connections=ccdc.FETCH_CHIPS * limit, retries=retries, backoff=backoff)
+
+    def request(ubid):
+        r = pool.get(url=endpoint, params={'x': x, 'y': y, 'acquired': acquired, 'ubid': ubid})
+        r.raise_for_status()
+        return r.json()
+
+    with ThreadPoolExecutor(max_workers=limit) as threads:
+        return tuple(concat(threads.map(request, ubids)))
+
+
+def memoized(fn, key):
+    """Calls fn once per Python worker for key and returns the saved result"""
+
+    with __lock:
+        if key not in __memos:
+            __memos[key] = fn()
+        return __memos[key]
+
+
+def pmap(fn, items, concurrency=None):
+    """Maps fn over items using a bounded number of threads.
+
+    At most concurrency results are in flight at any time.  Results are
+    yielded as they complete, so ordering is not preserved.
+
+    Args:
+        fn: function of one argument
+        items: iterable
+        concurrency (int): maximum calls in flight, defaults to ccdc.FETCH_CHIPS
+
+    Returns:
+        generator of fn(item)
+    """
+
+    limit = concurrency or ccdc.FETCH_CHIPS
+    items = iter(items)
+
+    with ThreadPoolExecutor(max_workers=limit) as pool:
+        pending = set()
+
+        while True:
+            for item in items:
+                pending.add(pool.submit(fn, item))
+                if len(pending) >= limit:
+                    break
+
+            if not pending:
+                return
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            for f in done:
+                yield f.result()
+
+
+def configure(cfg):
+    """Returns a Merlin configuration that fetches chips concurrently.
+
+    Merlin's Chipmunk chips_fn is replaced with chips() and the registry
+    and grid definitions are requested once per Python worker instead of
+    once per chip.  Other injected functions are left unaltered.
+
+    Settings are captured from ccdc when configure() is called so executors
+    use the same values as the driver.
+
+    Args:
+        cfg: A Merlin configuration
+
+    Returns:
+        A Merlin configuration
+    """
+
+    def chipmunk(fn):
+        return getattr(fn, 'func', None) in (merlin.chipmunk.chips,
+                                             merlin.chipmunk.registry,
+                                             merlin.chipmunk.grid)
+
+    def memo(name, c):
+        fn = get(name, c)
+        if not chipmunk(fn):
+            return c
+        return assoc(c, name, partial(memoized, fn=fn, key=(name, tuple(sorted(fn.keywords.items())))))
+
+    cfn = get('chips_fn', cfg)
+
+    if chipmunk(cfn):
+        cfg = assoc(cfg, 'chips_fn', partial(chips,
+                                             concurrency=ccdc.FETCH_REQUESTS,
+                                             retries=ccdc.FETCH_RETRIES,
+                                             backoff=ccdc.FETCH_BACKOFF,
+                                             **cfn.keywords))
+
+    return memo('grid_fn', memo('registry_fn', cfg))
@@ -0,0 +1,223 @@
+"""forest.py evaluates trained random forests with NumPy.
+
+A RandomForestClassificationModel is exported to flat node tables with one
+entry per node of every tree: split feature, threshold, categorical split
+mask, child indices and normalized leaf class counts.  All trees are then
+walked for a whole matrix of feature rows at once, one tree level per step,
+which produces the same raw prediction vectors as Spark ML without a Spark
+job per batch.
+
+The node tables are read from the model's saved data, which has the same
+layout in every Spark release since 2.0.
+"""
+
+from pyspark.ml import PipelineModel
+from pyspark.ml.classification import RandomForestClassificationModel
+from pyspark.ml.feature import VectorIndexerModel
+from pyspark.sql import SparkSession
+
+import numpy
+
+
+def table(nodes, categories=None, invalid='error'):
+    """Builds flat node tables from saved tree nodes
+
+    Args:
+        nodes (sequence): (treeID, id, impurityStats, leftChild, rightChild,
+                           featureIndex, leftCategoriesOrThreshold, numCategories)
+        categories (dict): {feature: {value: index}} applied to features
+                           before traversal, see VectorIndexerModel.categoryMaps
+        invalid (str): VectorIndexerModel handleInvalid, see categorize()
+
+    Returns:
+        dict: forest
+    """
+
+    nodes   = sorted(nodes, key=lambda n: (n[0], n[1]))
+    trees   = sorted(set(n[0] for n in nodes))
+    sizes   = {t: 0 for t in trees}
+
+    for n in nodes:
+        sizes[n[0]] = max(sizes[n[0]], n[1] + 1)
+
+    offsets = dict(zip(trees, numpy.cumsum([0] + [sizes[t] for t in trees[:-1]]).tolist()))
+    count   = sum(sizes.values())
+    classes = max(len(n[2]) for n in nodes)
+    width   = max([n[7] for n in nodes] + [1])
+
+    feature   = numpy.full(count, -1, dtype=numpy.int32)
+    threshold = numpy.zeros(count, dtype=numpy.float64)
+    left      = numpy.arange(count, dtype=numpy.int32)
+    right     = numpy.arange(count, dtype=numpy.int32)
+    split     = numpy.zeros(count, dtype=numpy.bool_)
+    mask      = numpy.zeros((count, width), dtype=numpy.bool_)
+    size      = numpy.zeros(count, dtype=numpy.int64)
+    unseen    = numpy.zeros(count, dtype=numpy.bool_)
+    stats     = numpy.zeros((count, classes), dtype=numpy.float64)
+
+    for tree, nid, istats, lchild, rchild, findex, values, ncats in nodes:
+        i = offsets[tree] + nid
+
+        if lchild < 0:
+            s = numpy.asarray(istats, dtype=numpy.float64)
+            t = s.sum()
+            stats[i, :len(s)] = s / t if t else 0.0
+            continue
+
+        feature[i] = findex
+        left[i]    = offsets[tree] + lchild
+        right[i]   = offsets[tree] + rchild
+
+        if ncats < 0:
+            threshold[i] = values[0]
+        else:
+            split[i]  = True
+            size[i]   = ncats
+            mask[i, numpy.asarray(values, dtype=numpy.int64)] = True
+            # Spark's CategoricalSplit keeps the smaller side of the split,
+            # the left categories only if there are at most ncats / 2 of
+            # them, and sends values it does not hold to the other side
+            unseen[i] = len(values) > ncats // 2
+
+    return {'roots':      numpy.asarray([offsets[t] for t in trees], dtype=numpy.int32),
+            'feature':    feature,
+            'threshold':  threshold,
+            'left':       left,
+            'right':      right,
+            'split':      split,
+            'mask':       mask,
+            'size':       size,
+            'unseen':     unseen,
+            'stats':      stats,
+            'categories': {int(k): dict(v) for k, v in (categories or {}).items()},
+            'invalid':    invalid}
+
+
+def stage(model, kind):
+    """Returns the last stage of a PipelineModel of type kind or None"""
+
+    stages = model.stages if isinstance(model, PipelineModel) else [model]
+    found  = [s for s in stages if isinstance(s, kind)]
+    return found[-1] if found else None
+
+
+def export(ctx, model, path):
+    """Exports a trained random forest to flat node tables
+
+    Args:
+        ctx: spark context
+        model: RandomForestClassificationModel or a PipelineModel containing one,
+               a VectorIndexerModel in the pipeline is applied in raw()
+        path (str): scratch directory the forest is saved to
+
+    Returns:
+        dict: forest, see table()
+    """
+
+    rf      = stage(model, RandomForestClassificationModel)
+    indexer = stage(model, VectorIndexerModel)
+
+    if rf is None:
+        raise ValueError('no random forest in model:{}'.format(model))
+
+    rf.write().overwrite().save(path)
+
+    rows = SparkSession(ctx).read.parquet('{}/data'.format(path))\
+                            .select('treeID',
+                                    'nodeData.id',
+                                    'nodeData.impurityStats',
+                                    'nodeData.leftChild',
+                                    'nodeData.rightChild',
+                                    'nodeData.split.featureIndex',
+                                    'nodeData.split.leftCategoriesOrThreshold',
+                                    'nodeData.split.numCategories')\
+                            .collect()
+
+    if indexer is None:
+        return table([tuple(r) for r in rows])
+
+    invalid = indexer.getHandleInvalid() if hasattr(indexer, 'getHandleInvalid') else 'error'
+    return table([tuple(r) for r in rows], indexer.categoryMaps, invalid)
+
+
+def categorize(forest, features):
+    """Replaces categorical feature values with their category indices
+
+    Values must match a category exactly.  As in VectorIndexerModel, values
+    that were not seen in training, NaN included, get the extra index
+    len(categories) when handleInvalid is 'keep' and raise otherwise: 'skip'
+    would drop rows, which raw() cannot do and stay aligned with its input.
+    """
+
+    if not forest['categories']:
+        return features
+
+    features = numpy.array(features, dtype=numpy.float64)
+
+    for f, cmap in forest['categories'].items():
+        keys  = numpy.asarray(sorted(cmap), dtype=numpy.float64)
+        vals  = numpy.asarray([cmap[k] for k in sorted(cmap)], dtype=numpy.float64)
+        pos   = numpy.clip(numpy.searchsorted(keys, features[:, f]), 0, len(keys) - 1)
+        found = keys[pos] == features[:, f]
+
+        if not found.all() and forest['invalid'] != 'keep':
+            raise ValueError('unseen value:{} for categorical feature:{}'.format(features[~found, f][0], f))
+
+        features[:, f] = numpy.where(found, vals[pos], len(keys))
+
+    return features
+
+
+def leaves(forest, features):
+    """Returns the leaf reached in every tree for every row
+
+    Args:
+        forest (dict): see table()
+        features: 2d array of feature rows
+
+    Returns:
+        2d array of node indices, (trees, rows)
+    """
+
+    x     = numpy.asarray(features, dtype=numpy.float64)
+    rows  = numpy.arange(x.shape[0])
+    nodes = numpy.repeat(forest['roots'][:, None], x.shape[0], axis=1)
+
+    while True:
+        f     = forest['feature'][nodes]
+        inner = f >= 0
+
+        if not inner.any():
+            return nodes
+
+        v     = x[rows, numpy.maximum(f, 0)]
+        known = (v >= 0) & (v < forest['size'][nodes])
+        cats  = numpy.where(known, v, 0).astype(numpy.int64)
+        left  = numpy.where(forest['split'][nodes],
+                            numpy.where(known, forest['mask'][nodes, cats], forest['unseen'][nodes]),
+                            v <= forest['threshold'][nodes])
+        nodes = numpy.where(inner,
+                            numpy.where(left, forest['left'][nodes], forest['right'][nodes]),
+                            nodes)
+
+
+def raw(forest, features):
+    """Returns raw prediction vectors for feature rows
+
+    Matches rawPrediction of RandomForestClassificationModel: the sum over
+    trees of the normalized class counts of the leaf each row falls in.
+
+    Args:
+        forest (dict): see table()
+        features: 2d array of feature rows
+
+    Returns:
+        2d array, (rows, classes)
+    """
+
+    x = numpy.atleast_2d(numpy.asarray(features, dtype=numpy.float64))
+
+    if x.shape[0] == 0:
+        return numpy.zeros((0, forest['stats'].shape[1]))
+
+    return forest['stats'][leaves(forest, categorize(forest, x))].sum(axis=0)
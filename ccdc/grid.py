@@ -1,92 +1,332 @@
+"""grid.py computes tile and chip geometry locally.
+
+The grid definition is requested once per Python process, or read from the
+on-disk index at ccdc.GRID_INDEX, and every snap, tile, neighbour and chip
+list is then plain arithmetic on it.  Tiles are memoized by grid point, so
+repeated and overlapping calls such as training() cost no requests.
+
+Chip ids are kept as (n, 2) int64 NumPy arrays of (x, y).  Areas are combined
+with union(), intersection() and difference() and narrowed with bounded() and
+inside(), and the arrays are passed to ids.rdd() as they are.
+"""
+
 from cytoolz  import first
 from cytoolz  import get
-from cytoolz  import get_in
 from cytoolz  import second
-from cytoolz  import thread_last
-from functools import partial
-from merlin.functions import denumpify
-from merlin.functions import flatten
+from functools import lru_cache
 from merlin.geometry import extents
-from merlin.geometry import coordinates
-from operator import eq
 
 import ccdc
-import merlin
+import json
+import math
+import numpy
+import os
+import threading
 
+__lock        = threading.Lock()
+__definitions = {}
 
-def definition(cfg=ccdc.ARD):
-    """Returns the grid definition associated with configuration"""
-    
-    return get('grid_fn', cfg)()
 
+def load(path):
+    """Returns the grid definition stored in an index file or None"""
+
+    if not path or not os.path.exists(path):
+        return None
+
+    with open(path) as f:
+        return get('grid', json.load(f), None)
+
+
+def save(path, grid):
+    """Stores a grid definition in an index file and returns it"""
+
+    if path:
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+
+        with open(tmp, 'w') as f:
+            json.dump({'grid': grid}, f)
+
+        os.replace(tmp, path)
+
+    return grid
+
+
+def definition(cfg=ccdc.ARD, index=None):
+    """Returns the grid definition associated with configuration
+
+    The definition is read from the index file if it exists, otherwise it
+    is requested from grid_fn and written to the index.  Either way it is
+    kept for the life of the process.
 
-def tile(x, y, cfg):
-    """Given a point return a tile
-    
     Args:
-        x (float): x coordinate
-        y (float): y coordinate
+        cfg (dict): a Merlin configuration
+        index (str): path to the grid index, defaults to ccdc.GRID_INDEX
 
-    Return:
-        dict: {'x', 'y', 'h', 'v', 'ulx', 'uly', 'lrx', 'lry', 'chips'}
+    Returns:
+        list: [{'name', 'proj', 'rx', 'ry', 'sx', 'sy', 'tx', 'ty'}, ...]
+    """
+
+    fn    = get('grid_fn', cfg)
+    index = ccdc.GRID_INDEX if index is None else index
+
+    with __lock:
+        if fn not in __definitions:
+            __definitions[fn] = load(index) or save(index, fn())
+        return __definitions[fn]
+
+
+def grids(cfg):
+    """Returns the (tile, chip) grids of a configuration as hashable tuples"""
+
+    named = {get('name', g): tuple(sorted(g.items())) for g in definition(cfg)}
+    return named['tile'], named['chip']
+
+
+def snap(x, y, grid):
+    """Snaps a point to a grid
+
+    Args:
+        x (float): x coordinate, numeric strings are accepted
+        y (float): y coordinate, numeric strings are accepted
+        grid (dict): {'rx', 'ry', 'sx', 'sy', 'tx', 'ty'}
+
+    Returns:
+        dict: {'proj-pt': (x, y), 'grid-pt': (h, v)}, as returned by Chipmunk
     """
 
-    # get all grid definitions
-    grid    = definition(cfg)
+    h = float(math.floor((float(x) * grid['rx'] + grid['tx']) / grid['sx']))
+    v = float(math.floor((float(y) * grid['ry'] + grid['ty']) / grid['sy']))
+    return {'proj-pt': corner(h, v, grid),
+            'grid-pt': (h, v)}
 
-    # get tile & chip grids
-    tgrid   = first(filter(lambda x: eq(get('name', x), 'tile'), grid))
-    cgrid   = first(filter(lambda x: eq(get('name', x), 'chip'), grid))
 
-    snap_fn = get('snap_fn', cfg)
-    snapped = snap_fn(x=x, y=y)
-    tx, ty  = get_in(['tile', 'proj-pt'], snapped)
-    h, v    = get_in(['tile', 'grid-pt'], snapped)
-    exts    = extents(ulx=tx, uly=ty, grid=tgrid)
-    chips   = denumpify(coordinates(exts, grid=cgrid, snap_fn=snap_fn))
+@lru_cache(maxsize=1024)
+def cell(h, v, tgrid, cgrid):
+    """Returns the tile at grid point h, v, see tile()"""
+
+    tgrid  = dict(tgrid)
+    tx, ty = corner(h, v, tgrid)
+    exts   = extents(ulx=tx, uly=ty, grid=tgrid)
+    chips  = region(cfg=None, cgrid=dict(cgrid), **exts)
+
+    chips.flags.writeable = False
 
     return dict(x=tx,
                 y=ty,
-                h=h,
-                v=v,
+                h=float(h),
+                v=float(v),
                 **exts,
                 chips=chips)
 
 
+def corner(h, v, grid):
+    """Returns the upper left projection point of grid point h, v"""
+
+    x = (int(h) * get('sx', grid) - get('tx', grid)) / get('rx', grid)
+    y = (int(v) * get('sy', grid) - get('ty', grid)) / get('ry', grid)
+    return (x, y)
+
+
+def point(h, v, cfg):
+    """Returns the upper left projection point of a tile given its grid point
+
+    Args:
+        h   (int): tile horizontal grid coordinate
+        v   (int): tile vertical grid coordinate
+        cfg (dict): a Merlin configuration
+
+    Returns:
+        tuple: (x, y)
+    """
+
+    return corner(h, v, dict(first(grids(cfg))))
+
+
+def tile(x, y, cfg):
+    """Given a point return a tile
+
+    Args:
+        x (float): x coordinate
+        y (float): y coordinate
+
+    Return:
+        dict: {'x', 'y', 'h', 'v', 'ulx', 'uly', 'lrx', 'lry', 'chips'},
+              chips is a read only array of chip ids
+    """
+
+    tgrid, cgrid = grids(cfg)
+    h, v         = get('grid-pt', snap(x, y, dict(tgrid)))
+
+    return dict(cell(int(h), int(v), tgrid, cgrid))
+
+
 def chips(tile):
     """Returns chips ids for a tile.
 
     Args:
         tile: tile(x, y, cfg)
-    
+
     Returns:
         list of ints: [(x,y), (x1,y1), ...]
     """
-    
-    return list(map(lambda xy: (int(first(xy)), int(second(xy))), get('chips', tile)))
-    
+
+    return tuples(get('chips', tile))
+
+
+def tuples(xys):
+    """Returns chip ids as a list of (x, y) int tuples"""
+
+    return list(map(tuple, array(xys).tolist()))
+
+
+def region(ulx, uly, lrx, lry, cfg, cgrid=None):
+    """Returns the chip ids of every chip touching a bounding box
+
+    Args:
+        ulx, uly (float): upper left projection point
+        lrx, lry (float): lower right projection point, inclusive
+        cfg (dict): a Merlin configuration
+        cgrid (dict): chip grid, instead of the one in cfg
+
+    Returns:
+        numpy array: [[x, y], [x1, y1], ...], x major
+    """
+
+    cgrid  = cgrid if cgrid is not None else dict(second(grids(cfg)))
+    x0, y0 = get('proj-pt', snap(ulx, uly, cgrid))
+    x1, y1 = get('proj-pt', snap(lrx, lry, cgrid))
+    dx     = cgrid['sx'] * cgrid['rx']
+    dy     = cgrid['sy'] * cgrid['ry']
+    xs     = x0 + dx * numpy.arange(max(int(round((x1 - x0) / dx)) + 1, 0))
+    ys     = y0 + dy * numpy.arange(max(int(round((y1 - y0) / dy)) + 1, 0))
+
+    return numpy.column_stack([numpy.repeat(xs, len(ys)), numpy.tile(ys, len(xs))]).astype(numpy.int64)
+
+
+def array(xys):
+    """Returns chip ids as an (n, 2) int64 array"""
+
+    return numpy.asarray(xys, dtype=numpy.int64).reshape(-1, 2)
+
+
+def key(xys):
+    """Packs chip ids into one int64 per chip"""
+
+    a = array(xys)
+    return (a[:, 0] << 32) | (a[:, 1] & 0xffffffff)
+
+
+def unkey(keys):
+    """Unpacks key()"""
+
+    keys = numpy.asarray(keys, dtype=numpy.int64)
+    return numpy.column_stack([keys >> 32, (keys & 0xffffffff).astype(numpy.uint32).view(numpy.int32)]).astype(numpy.int64)
+
+
+def union(*xys):
+    """Returns the sorted unique chip ids of all areas"""
+
+    return unkey(numpy.unique(numpy.concatenate([key(a) for a in xys] or [key([])])))
+
+
+def intersection(a, b):
+    """Returns the sorted chip ids in both a and b"""
+
+    return unkey(numpy.intersect1d(key(a), key(b)))
+
+
+def difference(a, b):
+    """Returns the sorted chip ids in a that are not in b"""
+
+    return unkey(numpy.setdiff1d(key(a), key(b)))
+
+
+def bounded(xys, ulx, uly, lrx, lry):
+    """Returns the chip ids whose upper left point is within a bounding box"""
+
+    a  = array(xys)
+    xs = numpy.logical_and(a[:, 0] >= min(ulx, lrx), a[:, 0] <= max(ulx, lrx))
+    ys = numpy.logical_and(a[:, 1] >= min(uly, lry), a[:, 1] <= max(uly, lry))
+    return a[xs & ys]
+
+
+def parity(points, ring):
+    """Returns True for each point inside a ring, by the even-odd rule
+
+    Args:
+        points: (n, 2) array of (x, y)
+        ring (sequence): vertices [(x, y), (x1, y1), ...]
+
+    Returns:
+        numpy bool array
+    """
+
+    p      = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+    r      = numpy.asarray(ring, dtype=numpy.float64)
+    x, y   = p[:, 0], p[:, 1]
+    result = numpy.zeros(len(p), dtype=numpy.bool_)
+
+    if len(p) == 0:
+        return result
+
+    # only edges spanning the points vertically can be crossed
+    edges  = numpy.stack([r, numpy.roll(r, -1, axis=0)], axis=1)
+    lo, hi = edges[:, :, 1].min(axis=1), edges[:, :, 1].max(axis=1)
+    edges  = edges[(lo != hi) & (hi > y.min()) & (lo <= y.max())]
+
+    for (x0, y0), (x1, y1) in edges:
+        crosses = (y0 > y) != (y1 > y)
+        result ^= crosses & (x < x0 + (y - y0) * (x1 - x0) / (y1 - y0))
+
+    return result
+
+
+def inside(xys, polygon):
+    """Returns the chip ids whose upper left point is inside a polygon
+
+    Args:
+        xys: chip ids
+        polygon (sequence): vertices [(x, y), (x1, y1), ...], even-odd rule
+
+    Returns:
+        numpy array of chip ids
+    """
+
+    a = array(xys)
+    return a[parity(a, polygon)]
+
+
+def near(x, y, cfg):
+    """Returns the tiles surrounding and including the tile containing x and y
+
+    Args:
+        x   (int):  x coordinate in tile
+        y   (int):  y coordinate in tile
+        cfg (dict): a Merlin configuration
+
+    Returns:
+        list of tile projection points: [(x, y), (x1, y1), ...]
+    """
+
+    tgrid = dict(first(grids(cfg)))
+    h, v  = map(int, get('grid-pt', snap(x, y, tgrid)))
+
+    return [corner(h + i, v + j, tgrid) for i in (-1, 0, 1) for j in (1, 0, -1)]
+
 
 def training(x, y, cfg):
     """Returns the chip ids for training
-    
+
     Args:
-        x   (int):  x coordinate in tile 
+        x   (int):  x coordinate in tile
         y   (int):  y coordinate in tile
         cfg (dict): a Merlin configuration
 
     Returns:
-        list of chip ids for training area
+        numpy array of chip ids for training area
     """
 
-    near_fn = get('near_fn', cfg)
-
-    return thread_last(near_fn(x=x, y=y),
-                       partial(get, 'tile'),
-                       partial(map, lambda t:  t.get('proj-pt')),
-                       partial(map, lambda xy: tile(x=first(xy), y=second(xy), cfg=cfg)),
-                       partial(map, lambda t:  get('chips', t)),
-                       flatten,
-                       list)
+    return union(*[get('chips', tile(x=tx, y=ty, cfg=cfg)) for tx, ty in near(x=x, y=y, cfg=cfg)])
 
 
 def classification(x, y, cfg):
@@ -98,7 +338,6 @@ def classification(x, y, cfg):
         cfg (dict): a Merlin configuration
 
     Returns:
-        list of chip ids for classification area
+        numpy array of chip ids for classification area
     """
-    return chips(tile(x, y, cfg))
-
+    return get('chips', tile(x, y, cfg))
@@ -4,6 +4,7 @@ from pyspark.sql.types import StructField
 from pyspark.sql.types import StructType
 
 import ccdc
+import numpy
 
 
 def chip_schema():
@@ -25,7 +26,8 @@ def rdd(ctx, xys):
     
     Args:
         ctx             : spark context
-        xys  (sequence): ((x1,y1),(x2,y2),(x3,y3)...))
+        xys  (sequence): ((x1,y1),(x2,y2),(x3,y3)...)) or an (n, 2) numpy array,
+                         see grid.array()
 
     Returns:
         RDD of ids
@@ -37,6 +39,11 @@ def rdd(ctx, xys):
     log.debug('xys datatype:{}'.format(type(xys)))
     log.trace('xys:{}'.format(xys))
     
+    if isinstance(xys, numpy.ndarray):
+        # ship array slices and make (x, y) tuples on the executors
+        return ctx.parallelize(numpy.array_split(xys, ccdc.INPUT_PARTITIONS), ccdc.INPUT_PARTITIONS)\
+                  .flatMap(lambda a: map(tuple, a.tolist()))
+
     return ctx.parallelize(xys, ccdc.INPUT_PARTITIONS)
  
     
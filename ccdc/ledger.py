@@ -0,0 +1,115 @@
+"""ledger.py records which chips have completed change detection.
+
+A ledger row is written for a chip only after all of its segments have been
+written to the pyccd table, so a chip present in the ledger for a detector
+and acquired range never needs to be detected again.
+"""
+
+from ccdc import ids
+from ccdc import logger
+from ccdc import sink
+from pyspark.sql import functions
+from pyspark.sql.types import IntegerType
+from pyspark.sql.types import StringType
+from pyspark.sql.types import StructField
+from pyspark.sql.types import StructType
+
+import datetime
+
+
+def table():
+    """Cassandra ledger table name"""
+
+    return 'ledger'
+
+
+def schema():
+    """pyspark dataframe schema for the ledger"""
+
+    return StructType([
+        StructField('chipx', IntegerType(), nullable=False),
+        StructField('chipy', IntegerType(), nullable=False),
+        StructField('detector', StringType(), nullable=False),
+        StructField('acq', StringType(), nullable=False),
+        StructField('segcnt', IntegerType(), nullable=True),
+        StructField('dran', StringType(), nullable=True)])
+
+
+def dataframe(ccd, acquired, detector):
+    """Creates ledger entries for every chip in a pyccd dataframe
+
+    Args:
+        ccd: dataframe conforming to pyccd.schema()
+        acquired (str): ISO8601 date range
+        detector (str): name and version of detector
+
+    Returns:
+        dataframe conforming to schema()
+    """
+
+    return ccd.groupBy('chipx', 'chipy')\
+              .agg(functions.count('*').cast(IntegerType()).alias('segcnt'))\
+              .select('chipx',
+                      'chipy',
+                      functions.lit(detector).alias('detector'),
+                      functions.lit(acquired).alias('acq'),
+                      'segcnt',
+                      functions.lit(datetime.datetime.now().isoformat()).alias('dran'))
+
+
+def read(ctx, ids):
+    """Read ledger entries
+
+    Only the partitions for ids are read, see sink.select().
+
+    Args:
+        ctx: spark context
+        ids: dataframe of (chipx, chipy)
+
+    Returns:
+        dataframe conforming to ledger.schema()
+    """
+
+    return sink.select(ctx, table(), ids, ['chipx', 'chipy'], schema())
+
+
+def write(ctx, df):
+    """Write ledger entries
+
+    Args:
+        ctx: spark context
+        df : dataframe conforming to ledger.schema()
+
+    Returns:
+        df
+    """
+
+    sink.write(ctx, df, table())
+    return df
+
+
+def completed(ctx, xys, acquired, detector):
+    """Returns chips that have already completed change detection
+
+    Args:
+        ctx: spark context
+        xys: [(x,y), (x1, y1),...] or a numpy array, see grid.array()
+        acquired (str): ISO8601 date range
+        detector (str): name and version of detector
+
+    Returns:
+        dict: {(chipx, chipy): segcnt}
+    """
+
+    if len(xys) == 0:
+        return {}
+
+    cids = ids.dataframe(ctx=ctx, rdd=ids.rdd(ctx=ctx, xys=xys), schema=ids.chip_schema())
+    rows = read(ctx, cids).filter((functions.col('detector') == detector) &
+                                  (functions.col('acq') == acquired))\
+                          .select('chipx', 'chipy', 'segcnt')\
+                          .collect()
+
+    logger(ctx, name=__name__).info('{} of {} chips already complete'.format(len(rows), len(xys)))
+
+    return {(r.chipx, r.chipy): r.segcnt for r in rows}
@@ -1,5 +1,5 @@
-from ccdc import cassandra
 from ccdc import logger
+from ccdc import sink
 from pyspark.sql import Row
 from pyspark.sql import SparkSession
 from pyspark.sql.types import IntegerType
@@ -97,14 +97,16 @@ def detection(tilex, tiley, h, v, acquired, detector, ardurl, segcount):
             'meday': None}
 
 
-def classify(tilex, tiley, classifier, auxurl):
+def classify(tilex, tiley, msday, meday, classifier, auxurl):
     """create metadata for classifiers
 
     Args:
         tilex: x coordinate of tile
         tiley: y coordinate of tile
-        detector: name and version of classifier
-        params: parameters supplied to classifier at runtime
+        msday: ordinal day, beginning of training period
+        meday: ordinal day, end of training period
+        classifier: name and version of classifier, or the model used
+        auxurl: URL used to supply AUX data to classifier
 
     Returns:
         dict: Classifier metadata
@@ -112,6 +114,8 @@ def classify(tilex, tiley, classifier, auxurl):
 
     return {'tilex': tilex,
             'tiley': tiley,
+            'msday': int(msday),
+            'meday': int(meday),
             'classifier': classifier,
             'cran': datetime.datetime.now().isoformat(),
             'auxurl': auxurl}
@@ -135,6 +139,8 @@ def dataframe(ctx, d):
 def read(ctx, ids):
     """Read metadata results
 
+    Only the partitions for ids are read, see sink.select().
+
     Args:
         ctx: spark context
         ids: dataframe of (tilex, tiley)
@@ -142,10 +148,8 @@ def read(ctx, ids):
     Returns:
         dataframe conforming to metadata.schema()
     """
-    
-    return ids.join(cassandra.read(ctx, table()),
-                    on=['tilex', 'tiley'],
-                    how='inner')
+
+    return sink.select(ctx, table(), ids, ['tilex', 'tiley'], schema())
 
 
 def write(ctx, df):
@@ -159,5 +163,5 @@ def write(ctx, df):
         df
     """
 
-    cassandra.write(ctx, df, table())
+    sink.write(ctx, df, table())
     return df
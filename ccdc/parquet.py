@@ -0,0 +1,286 @@
+"""parquet.py stores results as partitioned Parquet files.
+
+Each table is a directory under ccdc.SINK_DIR/<keyspace>/ partitioned by the
+table's Cassandra partition key, with the same columns as the Cassandra table.
+Writes behave like Cassandra upserts: rows are merged into existing rows by
+primary key and columns missing from a write keep their stored values.
+
+Every write goes through its own staging directory and its partitions are
+then renamed into the table, so concurrent writes never share an output
+committer's _temporary directory.
+"""
+
+from ccdc import cassandra
+from cytoolz import first
+from pyspark.sql import SparkSession
+from pyspark.sql import functions
+
+import ccdc
+import threading
+import uuid
+
+# (partition key, clustering columns) as defined in resources/schema.cql
+__keys = {'data':     (['chipx', 'chipy'], ['pixelx', 'pixely', 'sday', 'eday']),
+          'metadata': (['tilex', 'tiley'], []),
+          'ledger':   (['chipx', 'chipy'], ['detector', 'acq'])}
+
+__lock    = threading.Lock()
+__schemas = {}
+
+
+def keys(table):
+    """Returns (partition key, clustering columns) for a table"""
+
+    return __keys[table]
+
+
+def path(table, directory=None):
+    """Returns the directory a table is stored in"""
+
+    directory = directory if directory is not None else ccdc.SINK_DIR
+    return '{}/{}/{}'.format(directory.rstrip('/'), ccdc.keyspace(), table)
+
+
+def filesystem(sc, p):
+    """Returns (hadoop FileSystem, hadoop Path) for a path"""
+
+    hp = sc._jvm.org.apache.hadoop.fs.Path(p)
+    return hp.getFileSystem(sc._jsc.hadoopConfiguration()), hp
+
+
+def exists(sc, p):
+    """True if path exists"""
+
+    fs, hp = filesystem(sc, p)
+    return fs.exists(hp)
+
+
+def remove(sc, p):
+    """Recursively removes a path"""
+
+    fs, hp = filesystem(sc, p)
+    return fs.delete(hp, True)
+
+
+def partitions(sc, table):
+    """Returns the set of stored partition directories of a table
+
+    The directories are listed with a single glob rather than one exists
+    call per partition key.
+    """
+
+    p      = path(table)
+    fs, hp = filesystem(sc, p)
+    root   = fs.makeQualified(hp).toString()
+    glob   = sc._jvm.org.apache.hadoop.fs.Path('/'.join([p] + ['*'] * len(first(keys(table)))))
+
+    return {p + status.getPath().toString()[len(root):] for status in fs.globStatus(glob) or []}
+
+
+def stored(sc, table):
+    """Returns the schema of a written table or None
+
+    The schema is read once per table and kept for the life of the process,
+    so writes do not list the whole table to find its columns.
+    """
+
+    p = path(table)
+
+    with __lock:
+        if p not in __schemas and exists(sc, p):
+            __schemas[p] = SparkSession(sc).read.parquet(p).schema
+        return __schemas.get(p)
+
+
+def directory(table, key):
+    """Returns the directory of a partition given its key as a Row or dict"""
+
+    return '/'.join([path(table)] + ['{}={}'.format(c, int(key[c])) for c in first(keys(table))])
+
+
+def publish(sc, staging, table):
+    """Moves the partition directories of a staging directory into a table
+
+    Each partition replaces the stored partition of the same key.  The stored
+    partition is first renamed aside next to the staging directory and is
+    only deleted once the new partition is in place.  If the move fails it
+    is renamed back, and if that fails too it is left aside to recover.
+
+    Args:
+        sc: spark context
+        staging: directory written with partitionBy(partition key)
+        table: table to move the partitions into
+
+    Returns:
+        count of moved partitions
+    """
+
+    fs, hp = filesystem(sc, staging)
+    root   = fs.makeQualified(hp).toString()
+    glob   = sc._jvm.org.apache.hadoop.fs.Path('/'.join([staging] + ['*'] * len(first(keys(table)))))
+    count  = 0
+
+    for status in fs.globStatus(glob) or []:
+        src = status.getPath()
+        dst = sc._jvm.org.apache.hadoop.fs.Path(path(table) + src.toString()[len(root):])
+
+        old = sc._jvm.org.apache.hadoop.fs.Path(staging + '.replaced' + src.toString()[len(root):])
+        replaced = fs.exists(dst)
+
+        if replaced:
+            fs.mkdirs(old.getParent())
+            if not fs.rename(dst, old):
+                raise IOError('could not move {} to {}'.format(dst, old))
+        else:
+            fs.mkdirs(dst.getParent())
+
+        if not fs.rename(src, dst):
+            if replaced and not fs.rename(old, dst):
+                raise IOError('could not move {} to {}, stored partition left at {}'.format(src, dst, old))
+            raise IOError('could not move {} to {}'.format(src, dst))
+
+        if replaced:
+            fs.delete(old, True)
+
+        count += 1
+
+    return count
+
+
+def read(sc, table, schema=None):
+    """Read a table as a dataframe
+
+    Args:
+        sc: spark context
+        table: table to read from
+        schema: dataframe schema returned if the table has not been written
+
+    Returns:
+        dataframe
+    """
+
+    p = path(table)
+
+    if not exists(sc, p) and schema is not None:
+        return SparkSession(sc).createDataFrame(sc.emptyRDD(), schema)
+
+    return SparkSession(sc).read.parquet(p)
+
+
+def select(sc, table, ids, keys, schema=None):
+    """Read the partitions of a table named by a dataframe of keys
+
+    Args:
+        sc: spark context
+        table: table to read from
+        ids: small dataframe of partition keys
+        keys: partition key column names
+        schema: dataframe schema returned if the table has not been written
+
+    Returns:
+        ids joined with the matching rows of table
+    """
+
+    rows = ids.select(*keys).distinct().collect()
+
+    return ids.join(read(sc, table, schema).filter(cassandra.predicate(rows, keys)),
+                    on=list(keys),
+                    how='inner')
+
+
+def merge(stored, df, primary):
+    """Upserts df into stored rows by primary key
+
+    Values from df replace stored values, including nulls.  Columns not
+    present in df keep their stored values.
+
+    Args:
+        stored: dataframe of stored rows
+        df: dataframe of rows to write
+        primary: primary key column names
+
+    Returns:
+        dataframe with the columns of stored
+    """
+
+    new = df.withColumn('__new', functions.lit(True))
+    old = stored.select(*[functions.col(c).alias('__old_' + c) if c not in primary else c for c in stored.columns])
+    out = old.join(new, on=list(primary), how='full_outer')
+
+    def column(c):
+        if c in primary:
+            return functions.col(c)
+        if c in df.columns:
+            return functions.when(functions.col('__new').isNotNull(), functions.col(c))\
+                            .otherwise(functions.col('__old_' + c)).alias(c)
+        return functions.col('__old_' + c).alias(c)
+
+    return out.select(*[column(c) for c in stored.columns])
+
+
+def write(sc, dataframe, table):
+    """Write a dataframe to a table, replacing rows with the same primary key
+
+    Only the stored partitions touched by the write are read.  They are
+    merged with the new rows in a staging directory that belongs to this
+    write, and each merged partition is then renamed over the stored one, so
+    reads never see a partial partition.
+
+    Args:
+        sc: spark context
+        dataframe: The dataframe to write
+        table: table to write dataframe to
+
+    Returns:
+        None
+    """
+
+    partition, clustering = keys(table)
+    p       = path(table)
+    ss      = SparkSession(sc)
+    schema  = stored(sc, table)
+    dirs    = sorted(partitions(sc, table) & {directory(table, k) for k in dataframe.select(*partition).distinct().collect()}
+                     if schema is not None else [])
+    staging = '{}/.staging-{}-{}'.format(p.rsplit('/', 1)[0], table, uuid.uuid4().hex)
+
+    ccdc.logger(sc, name=__name__).info('writing dataframe:{}'.format(p))
+
+    if schema is None:
+        out = dataframe
+    elif dirs:
+        old = ss.read.schema(schema).option('basePath', p).parquet(*dirs)
+        out = merge(old, dataframe, partition + clustering)
+    else:
+        out = dataframe.select(*[functions.col(f.name) if f.name in dataframe.columns else
+                                 functions.lit(None).cast(f.dataType).alias(f.name) for f in schema.fields])
+
+    try:
+        out.write.partitionBy(*partition).parquet(staging)
+        publish(sc, staging, table)
+        remove(sc, staging + '.replaced')
+    finally:
+        remove(sc, staging)
+
+
+def delete(sc, table, keys):
+    """Delete partitions from a table
+
+    Args:
+        sc: spark context
+        table: table to delete from
+        keys: sequence of partition keys as dicts, {'chipx': 1, 'chipy': 2}
+
+    Returns:
+        count of deleted partitions
+    """
+
+    partition = first(__keys[table])
+    count = 0
+
+    for key in keys:
+        d = '/'.join('{}={}'.format(c, int(key[c])) for c in partition)
+        if remove(sc, '{}/{}'.format(path(table), d)):
+            count += 1
+
+    ccdc.logger(sc, name=__name__).info('deleted {} partitions from {}'.format(count, table))
+    return count
@@ -1,6 +1,13 @@
-from ccdc import cassandra
+from ccdc import arrow
+from ccdc import encoding
+from ccdc import ids
 from ccdc import logger
+from ccdc import sink
+from ccdc import timeseries
+from cytoolz import assoc
+from cytoolz import concat
 from cytoolz import first
+from cytoolz import groupby
 from cytoolz import get
 from cytoolz import get_in
 from cytoolz import merge
@@ -11,6 +18,7 @@ from pyspark import sql
 from pyspark.sql import SparkSession
 from pyspark.sql import functions
 from pyspark.sql.types import ArrayType
+from pyspark.sql.types import BinaryType
 from pyspark.sql.types import ByteType
 from pyspark.sql.types import FloatType
 from pyspark.sql.types import IntegerType
@@ -19,6 +27,12 @@ from pyspark.sql.types import StructField
 from pyspark.sql.types import StructType
 
 import ccd
+import ccdc
+import ccd.app
+import ccd.models.lasso
+import ccd.qa
+import datetime
+import numpy
 
 
 def algorithm():
@@ -33,7 +47,23 @@ def table():
     return 'data'
 
 
-def schema():
+def schema(scheme=None):
+    """Schema of pyccd results
+
+    The dtbits and prbits blob columns are only present with the compact
+    encoding.  Arrow in Spark 2.3 has no binary type, so the list schema is
+    the one used to build results through Arrow, see columnar().
+
+    Args:
+        scheme (str): 'list' or 'compact', defaults to ccdc.ENCODING
+
+    Returns:
+        StructType
+    """
+
+    blobs = [StructField('dtbits', BinaryType(), nullable=True),
+             StructField('prbits', BinaryType(), nullable=True)]
+
     return StructType([
         StructField('chipx' , IntegerType(), nullable=False),
         StructField('chipy' , IntegerType(), nullable=False),
@@ -66,18 +96,19 @@ def schema():
         StructField('s2coef', ArrayType(FloatType()), nullable=True),
         StructField('thcoef', ArrayType(FloatType()), nullable=True),
         StructField('blint' , FloatType(), nullable=True),
+        StructField('grint' , FloatType(), nullable=True),
         StructField('reint' , FloatType(), nullable=True),
         StructField('niint' , FloatType(), nullable=True),
         StructField('s1int' , FloatType(), nullable=True),
         StructField('s2int' , FloatType(), nullable=True),
         StructField('thint' , FloatType(), nullable=True),
-        StructField('dates' , ArrayType(IntegerType()), nullable=False),
+        StructField('dates' , ArrayType(IntegerType()), nullable=True),
         StructField('snprob', FloatType(), nullable=True),
         StructField('waprob', FloatType(), nullable=True),
         StructField('clprob', FloatType(), nullable=True),
         StructField('prmask', ArrayType(ByteType()), nullable=True),
         StructField('rfrawp', ArrayType(FloatType()), nullable=True)
-    ])
+    ] + (blobs if (scheme or ccdc.ENCODING) == 'compact' else []))
 
 
 def dataframe(ctx, rdd):
@@ -102,52 +133,118 @@ def default(change_models):
     return [{'start_day': 0, 'end_day': 0}] if not change_models else change_models
 
     
-def format(chipx, chipy, pixelx, pixely, dates, ccdresult):
-       
-    return [denumpify(
-             {'chipx'  : chipx,
-              'chipy'  : chipy,
-              'pixelx' : pixelx,
-              'pixely' : pixely,
-              'sday'   : get('start_day', cm),
-              'eday'   : get('end_day', cm),
-              'bday'   : get('bday', cm, None),
-              'chprob' : get('change_probability', cm, None),
-              'curqa'  : get('curve_qa', cm, None),
-              'blmag'  : get_in(['blue', 'magnitude'], cm, None),
-              'grmag'  : get_in(['green', 'magnitude'], cm, None),
-              'remag'  : get_in(['red', 'magnitude'], cm, None),
-              'nimag'  : get_in(['nir', 'magnitude'], cm, None),
-              's1mag'  : get_in(['swir1', 'magnitude'], cm, None),
-              's2mag'  : get_in(['swir2', 'magnitude'], cm, None),
-              'thmag'  : get_in(['thermal', 'magnitude'], cm, None),
-              'blrmse' : get_in(['blue', 'rmse'], cm, None),
-              'grrmse' : get_in(['green', 'rmse'], cm, None),
-              'rermse' : get_in(['red', 'rmse'], cm, None),
-              'nirmse' : get_in(['nir', 'rmse'], cm, None),
-              's1rmse' : get_in(['swir1', 'rmse'], cm, None),
-              's2rmse' : get_in(['swir2', 'rmse'], cm, None),
-              'thrmse' : get_in(['thermal', 'rmse'], cm, None),
-              'blcoef' : get_in(['blue', 'coefficients'], cm, None),
-              'grcoef' : get_in(['green', 'coefficients'], cm, None),
-              'recoef' : get_in(['red', 'coefficients'], cm, None),
-              'nicoef' : get_in(['nir', 'coefficients'], cm, None),
-              's1coef' : get_in(['swir1', 'coefficients'], cm, None),
-              's2coef' : get_in(['swir2', 'coefficients'], cm, None),
-              'thcoef' : get_in(['thermal', 'coefficients'], cm, None),
-              'blint'  : get_in(['blue', 'intercept'], cm, None),
-              'grint'  : get_in(['green', 'intercept'], cm, None),
-              'reint'  : get_in(['red', 'intercept'], cm, None),
-              'niint'  : get_in(['nir', 'intercept'], cm, None),
-              's1int'  : get_in(['swir1', 'intercept'], cm, None),
-              's2int'  : get_in(['swir2', 'intercept'], cm, None),
-              'thint'  : get_in(['thermal', 'intercept'], cm, None),
-              'dates'  : dates,
-              'snprob' : get('snow_prob', ccdresult, None),
-              'waprob' : get('water_prob', ccdresult, None),
-              'clprob' : get('cloud_prob', ccdresult, None),
-              'prmask' : get('processing_mask', ccdresult, None)})
-             for cm in default(get('change_models', ccdresult, None))]
+def segment(chipx, chipy, pixelx, pixely, cm, ccdresult):
+    # a single change model as a row of pyccd.schema(), without dates and
+    # without converting numpy values.
+
+    return {'chipx'  : chipx,
+            'chipy'  : chipy,
+            'pixelx' : pixelx,
+            'pixely' : pixely,
+            'sday'   : get('start_day', cm),
+            'eday'   : get('end_day', cm),
+            'bday'   : get('bday', cm, None),
+            'chprob' : get('change_probability', cm, None),
+            'curqa'  : get('curve_qa', cm, None),
+            'blmag'  : get_in(['blue', 'magnitude'], cm, None),
+            'grmag'  : get_in(['green', 'magnitude'], cm, None),
+            'remag'  : get_in(['red', 'magnitude'], cm, None),
+            'nimag'  : get_in(['nir', 'magnitude'], cm, None),
+            's1mag'  : get_in(['swir1', 'magnitude'], cm, None),
+            's2mag'  : get_in(['swir2', 'magnitude'], cm, None),
+            'thmag'  : get_in(['thermal', 'magnitude'], cm, None),
+            'blrmse' : get_in(['blue', 'rmse'], cm, None),
+            'grrmse' : get_in(['green', 'rmse'], cm, None),
+            'rermse' : get_in(['red', 'rmse'], cm, None),
+            'nirmse' : get_in(['nir', 'rmse'], cm, None),
+            's1rmse' : get_in(['swir1', 'rmse'], cm, None),
+            's2rmse' : get_in(['swir2', 'rmse'], cm, None),
+            'thrmse' : get_in(['thermal', 'rmse'], cm, None),
+            'blcoef' : get_in(['blue', 'coefficients'], cm, None),
+            'grcoef' : get_in(['green', 'coefficients'], cm, None),
+            'recoef' : get_in(['red', 'coefficients'], cm, None),
+            'nicoef' : get_in(['nir', 'coefficients'], cm, None),
+            's1coef' : get_in(['swir1', 'coefficients'], cm, None),
+            's2coef' : get_in(['swir2', 'coefficients'], cm, None),
+            'thcoef' : get_in(['thermal', 'coefficients'], cm, None),
+            'blint'  : get_in(['blue', 'intercept'], cm, None),
+            'grint'  : get_in(['green', 'intercept'], cm, None),
+            'reint'  : get_in(['red', 'intercept'], cm, None),
+            'niint'  : get_in(['nir', 'intercept'], cm, None),
+            's1int'  : get_in(['swir1', 'intercept'], cm, None),
+            's2int'  : get_in(['swir2', 'intercept'], cm, None),
+            'thint'  : get_in(['thermal', 'intercept'], cm, None),
+            'snprob' : get('snow_prob', ccdresult, None),
+            'waprob' : get('water_prob', ccdresult, None),
+            'clprob' : get('cloud_prob', ccdresult, None),
+            'prmask' : get('processing_mask', ccdresult, None)}
+
+
+def shared(dates, scheme=None):
+    """Returns the chip level date columns in the configured encoding
+
+    Args:
+        dates (list): ordinal dates as Python ints
+        scheme (str): 'list' or 'compact', defaults to ccdc.ENCODING
+
+    Returns:
+        dict: {'dates': list or None, 'dtbits': bytes or None}
+    """
+
+    if (scheme or ccdc.ENCODING) == 'compact':
+        return {'dates': None, 'dtbits': encoding.packdates(dates)}
+
+    return {'dates': dates, 'dtbits': None}
+
+
+def encode(row, static, scheme=None):
+    """Returns a row with chip level columns and prmask in the configured encoding
+
+    Args:
+        row (dict): a row of pyccd.schema()
+        static (dict): chip level columns, see shared()
+        scheme (str): 'list' or 'compact', defaults to ccdc.ENCODING
+
+    Returns:
+        dict
+    """
+
+    row = merge(row, static)
+
+    if (scheme or ccdc.ENCODING) == 'compact':
+        return merge(row, {'prmask': None, 'prbits': encoding.packmask(get('prmask', row))})
+
+    return assoc(row, 'prbits', None)
+
+
+def decode(row):
+    """Returns a stored row with dates and prmask as lists, whichever encoding it was written with
+
+    Args:
+        row (dict): a row of pyccd.schema()
+
+    Returns:
+        dict
+    """
+
+    if get('dates', row) is None and get('dtbits', row) is not None:
+        row = assoc(row, 'dates', encoding.unpackdates(get('dtbits', row)))
+
+    if get('prmask', row) is None and get('prbits', row) is not None:
+        row = assoc(row, 'prmask', encoding.unpackmask(get('prbits', row)))
+
+    return row
+
+
+def format(chipx, chipy, pixelx, pixely, dates, ccdresult, static=None):
+    # dates are shared by every row of a pixel (and chip), so they must be
+    # converted to Python types once by the caller rather than once per row.
+    # Callers formatting many pixels of a chip pass static, see shared().
+
+    static = static if static is not None else shared(dates)
+
+    return [denumpify(encode(segment(chipx, chipy, pixelx, pixely, cm, ccdresult), static))
+            for cm in default(get('change_models', ccdresult, None))]
 
 
 def detect(timeseries):
@@ -166,10 +263,90 @@ def detect(timeseries):
                   chipy=chipy,
                   pixelx=pixelx,
                   pixely=pixely,
-                  dates=get('dates', second(timeseries)),
+                  dates=denumpify(get('dates', second(timeseries))),
                   ccdresult=ccd.detect(**second(timeseries)))
 
 
+def chip(timeseries):
+    """Takes in a chip timeseries and returns detections for every pixel
+
+    Dates are shared by every pixel in the chip so they are sorted once and
+    all bands are reordered together before each pixel is handed to ccd.
+
+    Args:
+        timeseries (tuple): chip timeseries, see timeseries.pack()
+
+    Return:
+        sequence of change detections
+    """
+
+    (chipx, chipy), data = timeseries
+
+    pdates = denumpify(get('dates', data))
+    static = shared(pdates)
+
+    return list(concat(format(chipx=chipx,
+                              chipy=chipy,
+                              pixelx=pixelx,
+                              pixely=pixely,
+                              dates=pdates,
+                              ccdresult=ccdresult,
+                              static=static)
+                       for pixelx, pixely, ccdresult in detections(timeseries)))
+
+
+def detections(timeseries):
+    """Runs ccd for every pixel in a chip timeseries
+
+    Args:
+        timeseries (tuple): chip timeseries, see timeseries.pack()
+
+    Return:
+        generator of (pixelx, pixely, ccdresult)
+    """
+
+    (chipx, chipy), data = timeseries
+
+    dates  = numpy.asarray(get('dates', data))
+    order  = numpy.argsort(dates, kind='mergesort')
+    bands  = {k: numpy.asarray(v)[:, order] for k, v in data.items() if k not in ('dates', 'pixels')}
+    sdates = dates[order]
+
+    for i, (x, y) in enumerate(get('pixels', data)):
+        yield (int(x), int(y), ccd.detect(dates=sdates, **{k: v[i] for k, v in bands.items()}))
+
+
+def columns(chips):
+    """Runs ccd for chip timeseries and returns the results as columns
+
+    Values are left as Python and numpy types for arrow.frame(), so no
+    per value conversion happens.  Results are always in the list encoding,
+    see schema().
+
+    Args:
+        chips (sequence): chip timeseries, see timeseries.pack()
+
+    Return:
+        dict: column name to list of values, see pyccd.schema()
+    """
+
+    names = schema('list').names
+    cols  = {n: [] for n in names}
+
+    for c in chips:
+        (chipx, chipy), data = c
+        static = shared(get('dates', data), 'list')
+
+        for pixelx, pixely, ccdresult in detections(c):
+            for cm in default(get('change_models', ccdresult, None)):
+                row = encode(segment(chipx, chipy, pixelx, pixely, cm, ccdresult), static, 'list')
+
+                for n in names:
+                    cols[n].append(get(n, row, None))
+
+    return cols
+
+
 def rdd(ctx, timeseries):
     """Run pyccd against a timeseries
 
@@ -185,9 +362,218 @@ def rdd(ctx, timeseries):
     return timeseries.flatMap(detect)
 
 
+def chips(ctx, timeseries):
+    """Run pyccd against a chip timeseries
+
+    Args:
+        ctx: spark context
+        timeseries: RDD of chip timeseries data, see timeseries.chips()
+
+    Returns:
+        RDD of pyccd results
+    """
+    
+    logger(context=ctx, name=__name__).info('executing chip change detection...')
+    return timeseries.flatMap(chip)
+
+
+def columnar(ctx, cids, acquired, cfg=ccdc.ARD):
+    """Run pyccd for chip ids and build the results through Arrow
+
+    Chips are fetched and detected inside a grouped map pandas_udf, so
+    results reach the JVM as Arrow record batches instead of pickled rows.
+    Arrow in Spark 2.3 cannot carry binary columns, so results are built in
+    the list encoding whatever ccdc.ENCODING is.
+
+    Args:
+        ctx: spark context
+        cids (rdd): RDD of chip ids
+        acquired (str): ISO8601 date range
+        cfg: A Merlin configuration
+
+    Returns:
+        dataframe conforming to pyccd.schema()
+    """
+
+    logger(context=ctx, name=__name__).info('executing columnar chip change detection...')
+
+    fetch_fn = timeseries.creator(acquired=acquired, cfg=cfg)
+
+    return arrow.dataframe(ctx=ctx,
+                           cids=cids,
+                           fn=lambda xys: columns(fetch_fn(xys)),
+                           schema=schema('list'))
+
+
+def since(rows, acquired):
+    """Returns the date range needed to update a chip from its stored segments
+
+    A chip can be updated when the last segment of every pixel is an open,
+    fully fitted model.  Observations are needed from the day after the
+    earliest end day of those segments, because ccd holds back the most
+    recent observations from the open model.
+
+    Args:
+        rows (sequence): stored pyccd results for one chip
+        acquired (str): ISO8601 date range of the update
+
+    Returns:
+        str: ISO8601 date range or None if the chip needs full detection
+    """
+
+    params = ccd.app.get_default_params()
+    fitted = (params.COEFFICIENT_MIN, params.COEFFICIENT_MID, params.COEFFICIENT_MAX)
+    lasts  = [max(r, key=lambda x: get('sday', x))
+              for r in groupby(lambda x: (get('pixelx', x), get('pixely', x)), rows).values()]
+
+    if not lasts or any(get('sday', l, 0) <= 0 or get('chprob', l) != 0 or get('curqa', l) not in fitted
+                        for l in lasts):
+        return None
+
+    start = datetime.date.fromordinal(min(get('eday', l) for l in lasts) + 1)
+    return '{}/{}'.format(start.isoformat(), acquired.split('/')[-1])
+
+
+def extend(segment, dates, bands, clear, params):
+    """Extends an open segment over observations after its end day
+
+    New observations are compared against the stored model.  The segment
+    is extended if none of them exceed the change threshold, holding back
+    the last PEEK_SIZE observations as ccd does.
+
+    Residuals are normalised by the stored rmse.  ccd normalises by the
+    larger of the variogram and the model or seasonal rmse, neither of which
+    is stored, so the check may be stricter or looser than a full run.
+
+    Args:
+        segment (dict): last stored segment of a pixel
+        dates (ndarray): sorted ordinal dates
+        bands (dict): band name to observations for the pixel
+        clear (ndarray): boolean mask of usable observations
+        params: ccd processing parameters
+
+    Returns:
+        dict: the updated segment or None if the pixel needs full detection
+    """
+
+    mask  = clear & (dates > get('eday', segment))
+    new   = dates[mask]
+
+    if not len(new):
+        return segment
+
+    matrix = ccd.models.lasso.coefficient_matrix(new, params.AVG_DAYS_YR, 8)
+    models = (('greens', 'grcoef', 'grint', 'grrmse'),
+              ('reds',   'recoef', 'reint', 'rermse'),
+              ('nirs',   'nicoef', 'niint', 'nirmse'),
+              ('swir1s', 's1coef', 's1int', 's1rmse'),
+              ('swir2s', 's2coef', 's2int', 's2rmse'))
+
+    if any(get(c, segment) is None or get(i, segment) is None or not get(r, segment) for _, c, i, r in models):
+        return None
+
+    residuals = numpy.array([(bands[b][mask] - (matrix.dot(get(c, segment)) + get(i, segment))) / get(r, segment)
+                             for b, c, i, r in models])
+
+    if numpy.any(numpy.sum(residuals ** 2, axis=0) > params.CHANGE_THRESHOLD):
+        return None
+
+    used = len(new) - params.PEEK_SIZE
+
+    if used <= 0:
+        return segment
+
+    return merge(segment, {'eday': int(new[used - 1]), 'bday': int(new[used])})
+
+
+def update(timeseries, rows):
+    """Updates stored pyccd results for a chip with newly acquired observations
+
+    Closed segments are kept as is and each pixel's open segment is
+    extended without refitting.  If any pixel shows a possible change,
+    has no stored results or has an incomplete stored model, the whole
+    chip needs full detection.
+
+    Args:
+        timeseries (tuple): chip timeseries since pyccd.since(), see timeseries.pack()
+        rows (sequence): stored pyccd results for the chip, see decode()
+
+    Returns:
+        sequence of change detections or None if the chip needs full detection
+    """
+
+    (chipx, chipy), data = timeseries
+
+    params = ccd.app.get_default_params()
+    dates  = numpy.asarray(get('dates', data))
+    order  = numpy.argsort(dates, kind='mergesort')
+    dates  = dates[order]
+    bands  = {k: numpy.asarray(v)[:, order] for k, v in data.items() if k not in ('dates', 'pixels')}
+    pixels = groupby(lambda x: (get('pixelx', x), get('pixely', x)), rows)
+
+    prior  = get('dates', first(rows))
+    added  = dates > max(prior)
+    alldates = sorted(set(prior) | set(dates[added].tolist()), reverse=True)
+
+    static  = shared(alldates)
+    results = []
+
+    for i, (x, y) in enumerate(get('pixels', data)):
+        segments = sorted(get((int(x), int(y)), pixels, []), key=lambda s: get('sday', s))
+
+        if not segments:
+            return None
+
+        qas   = ccd.qa.unpackqa(bands['qas'][i], params)
+        clear = (qas == params.QA_CLEAR) | (qas == params.QA_WATER)
+        last  = extend(segments[-1], dates, {k: v[i] for k, v in bands.items()}, clear, params)
+
+        if last is None:
+            return None
+
+        prmask = list(get('prmask', last) or []) + clear[added].astype(int).tolist()
+
+        results.extend(encode(merge(s, {'prmask': prmask, 'prbits': None}), static)
+                       for s in segments[:-1] + [last])
+
+    return results
+
+
+def select(ctx, xys):
+    """Read pyccd results for a collection of chip ids
+
+    Args:
+        ctx: spark context
+        xys: [(x,y), (x1, y1),...]
+
+    Returns:
+        dataframe conforming to pyccd.schema()
+    """
+
+    return read(ctx, ids.dataframe(ctx=ctx, rdd=ids.rdd(ctx=ctx, xys=xys), schema=ids.chip_schema()))
+
+
+def restrict(ccd, ids):
+    """Returns the rows of a pyccd dataframe for a subset of chips
+
+    Args:
+        ccd: dataframe conforming to pyccd.schema()
+        ids: small dataframe of (chipx, chipy), broadcast to the join
+
+    Returns:
+        dataframe conforming to pyccd.schema()
+    """
+
+    return ccd.join(functions.broadcast(ids.select('chipx', 'chipy')),
+                    on=['chipx', 'chipy'],
+                    how='left_semi')
+
+
 def read(ctx, ids):
     """Read pyccd results
 
+    Only the partitions for ids are read, see sink.select().
+
     Args:
         ctx: spark context
         ids: dataframe of (chipx, chipy)
@@ -196,9 +582,7 @@ def read(ctx, ids):
         dataframe conforming to pyccd.schema()
     """
     
-    return ids.join(cassandra.read(ctx, table()),
-                    on=['chipx', 'chipy'],
-                    how='inner')
+    return sink.select(ctx, table(), ids, ['chipx', 'chipy'], schema())
 
 
 def write(ctx, df):
@@ -211,7 +595,7 @@ def write(ctx, df):
     Returns:
         df
     """
-    cassandra.write(ctx, df, table())
+    sink.write(ctx, df, table())
     return df
 
 
@@ -4,22 +4,263 @@ from ccdc import logger
 from ccdc import pyccd
 from ccdc import timeseries
 from ccdc import udfs
-from merlin.functions import denumpify
+from cytoolz import first
+from cytoolz import get
+from merlin.functions import sha256
 from pyspark.ml import Pipeline
+from pyspark.ml import PipelineModel
 from pyspark.ml.classification import RandomForestClassifier
 from pyspark.ml.feature import StringIndexer
 from pyspark.ml.feature import VectorIndexer
-from pyspark.sql.types import Row
+from pyspark.sql import Window
+from pyspark.sql import functions
 
 import ccdc
+import datetime
+import json
 
 
-def write():
-    pass
+def span(acquired, today=None):
+    """Returns an acquired range with an end of today written as open
 
+    The default acquired range ends on the day a run starts, so it would
+    name a different model every day.  An end on or after the previous day,
+    which covers runs started before midnight, is replaced by '..', the
+    open end of ISO 8601-2, so default ranges name the same model.
 
-def read():
-    pass
+    Args:
+        acquired (str): ISO8601 date range
+        today (date): defaults to the current date
+
+    Returns:
+        str: ISO8601 date range
+    """
+
+    start, _, end = acquired.partition('/')
+    today         = today or datetime.date.today()
+
+    try:
+        open_ended = datetime.datetime.strptime(end[:10], '%Y-%m-%d').date() >= today - datetime.timedelta(days=1)
+    except ValueError:
+        open_ended = False
+
+    return '{}/..'.format(start) if open_ended else acquired
+
+
+def manifest(tiles, msday, meday, acquired, per_class=None, per_chip=None, seed=None):
+    """Describes a trained model
+
+    Models are interchangeable when trained over the same tiles, training
+    period, acquired range, training sample, feature columns and ccdc version.
+    Acquired ranges ending today are open ended, see span().
+
+    Args:
+        tiles (sequence): training area tile points [(x, y), ...]
+        msday (int): ordinal day, beginning of training period
+        meday (int): ordinal day, end of training period
+        acquired (str): ISO8601 date range
+        per_class (int): training rows per label, see sample()
+        per_chip (int): training rows per chip, see sample()
+        seed (int): sampling seed
+
+    Returns:
+        dict
+    """
+
+    return {'tiles':    sorted([float(x), float(y)] for x, y in tiles),
+            'msday':    int(msday),
+            'meday':    int(meday),
+            'acquired': span(acquired),
+            'sample':   sampling(per_class, per_chip, seed),
+            'features': sha256(json.dumps(features.columns())),
+            'version':  ccdc.version()}
+
+
+def key(tiles, msday, meday, acquired, per_class=None, per_chip=None, seed=None):
+    """Returns the model store key for a trained model, see manifest()
+
+    Returns:
+        str: sha256 hex digest
+    """
+
+    return sha256(json.dumps(manifest(tiles, msday, meday, acquired, per_class, per_chip, seed), sort_keys=True))
+
+
+def path(key, directory=None):
+    """Returns the model store path for key or None if the store is disabled"""
+
+    directory = directory if directory is not None else ccdc.MODEL_DIR
+    return '{}/{}'.format(directory.rstrip('/'), key) if directory else None
+
+
+def save(ctx, model, path, manifest):
+    """Saves a trained model and its manifest to path
+
+    Args:
+        ctx: spark context
+        model: trained PipelineModel
+        path (str): model directory
+        manifest (dict): see manifest()
+
+    Returns:
+        path
+    """
+
+    logger(ctx, __name__).info('saving model {}'.format(path))
+    model.write().overwrite().save(path)
+    ctx.parallelize([json.dumps(manifest, sort_keys=True)], 1).saveAsTextFile('{}/manifest'.format(path))
+    return path
+
+
+def load(ctx, path):
+    """Loads a trained model and its manifest from path
+
+    Args:
+        ctx: spark context
+        path (str): model directory
+
+    Returns:
+        tuple: (PipelineModel, manifest)
+    """
+
+    model = PipelineModel.load(path)
+    desc  = json.loads(ctx.textFile('{}/manifest'.format(path)).first())
+    logger(ctx, __name__).info('loaded model {}'.format(path))
+    return model, desc
+
+
+def compatible(desc):
+    """Raises ValueError if a model manifest does not match these features"""
+
+    if get('features', desc) != sha256(json.dumps(features.columns())):
+        raise ValueError('model was trained with different features: {}'.format(desc))
+
+    return desc
+
+
+def write(ctx, model, key, manifest, directory=None):
+    """Saves a trained model to the model store
+
+    Args:
+        ctx: spark context
+        model: trained PipelineModel
+        key (str): model store key, see key()
+        manifest (dict): see manifest()
+        directory (str): model store directory, defaults to ccdc.MODEL_DIR
+
+    Returns:
+        str: path of the saved model or None if the store is disabled
+    """
+
+    p = path(key, directory)
+    return save(ctx, model, p, manifest) if p else None
+
+
+def read(ctx, key, directory=None):
+    """Loads a trained model from the model store
+
+    Args:
+        ctx: spark context
+        key (str): model store key, see key()
+        directory (str): model store directory, defaults to ccdc.MODEL_DIR
+
+    Returns:
+        PipelineModel or None if no model is stored
+    """
+
+    p = path(key, directory)
+
+    if not p:
+        return None
+
+    try:
+        return first(load(ctx, p))
+    except Exception as e:
+        logger(ctx, __name__).info('no stored model {}: {}'.format(p, e))
+        return None
+
+
+def sampling(per_class=None, per_chip=None, seed=None):
+    """Returns training sample options with ccdc defaults applied
+
+    Args:
+        per_class (int): maximum rows per label, 0 for no limit
+        per_chip (int): maximum rows per chip, 0 for no limit
+        seed (int): sampling seed
+
+    Returns:
+        dict
+    """
+
+    return {'per_class': int(per_class if per_class is not None else ccdc.TRAINING_PER_CLASS),
+            'per_chip':  int(per_chip if per_chip is not None else ccdc.TRAINING_PER_CHIP),
+            'seed':      int(seed if seed is not None else ccdc.TRAINING_SEED)}
+
+
+def histogram(fdf):
+    """Returns the number of rows for each label
+
+    Args:
+        fdf: Features dataframe
+
+    Returns:
+        dict: {label: count}
+    """
+
+    return {r['label']: r['count'] for r in fdf.groupBy('label').count().collect()}
+
+
+def thin(fdf, per_chip, seed):
+    """Keeps at most per_chip randomly chosen rows from each chip"""
+
+    w = Window.partitionBy('chipx', 'chipy').orderBy(functions.rand(seed))
+
+    return fdf.withColumn('__rank', functions.row_number().over(w))\
+              .filter(functions.col('__rank') <= per_chip)\
+              .drop('__rank')
+
+
+def fractions(counts, per_class):
+    """Returns the fraction of each label to sample to keep per_class rows
+
+    Args:
+        counts (dict): {label: count}, see histogram()
+        per_class (int): maximum rows per label, 0 for no limit
+
+    Returns:
+        dict: {label: fraction}
+    """
+
+    return {k: 1.0 if not per_class or v <= per_class else float(per_class) / v
+            for k, v in counts.items() if k is not None}
+
+
+def sample(fdf, per_class=None, per_chip=None, seed=None):
+    """Builds a training set by stratified sampling of a features dataframe
+
+    Rows are first thinned to at most per_chip per chip, then each label is
+    sampled down to about per_class rows.  Labels with fewer rows are kept
+    whole so rare classes are not lost.
+
+    Args:
+        fdf: Features dataframe
+        per_class (int): maximum rows per label, defaults to ccdc.TRAINING_PER_CLASS
+        per_chip (int): maximum rows per chip, defaults to ccdc.TRAINING_PER_CHIP
+        seed (int): sampling seed, defaults to ccdc.TRAINING_SEED
+
+    Returns:
+        (training dataframe, {label: count} of fdf after thinning)
+    """
+
+    opts = sampling(per_class, per_chip, seed)
+    df   = thin(fdf, opts['per_chip'], opts['seed']) if opts['per_chip'] else fdf
+    hist = histogram(df)
+    frac = fractions(hist, opts['per_class'])
+
+    if all(f == 1.0 for f in frac.values()):
+        return df.filter(functions.col('label').isNotNull()), hist
+
+    return df.sampleBy('label', fractions=frac, seed=opts['seed']), hist
 
 
 def pipeline(fdf):
@@ -39,7 +280,7 @@ def pipeline(fdf):
     return Pipeline(stages=[lindex, findex, rf])
 
 
-def train(ctx, cids, msday, meday, acquired):
+def train(ctx, cids, msday, meday, acquired, per_class=None, per_chip=None, seed=None, ccd=None):
     """Trains a random forest model for a set of chip ids
 
     Args:
@@ -48,6 +289,10 @@ def train(ctx, cids, msday, meday, acquired):
         msday (int): ordinal day, beginning of training period
         meday (int); ordinal day, end of training period
         acquired (str): ISO8601 date range       
+        per_class (int): maximum training rows per label, see sample()
+        per_chip (int): maximum training rows per chip, see sample()
+        seed (int): sampling seed
+        ccd: pyccd dataframe containing the training chips, read if None
                
     Returns:
         A trained model or None
@@ -58,25 +303,28 @@ def train(ctx, cids, msday, meday, acquired):
     log  = logger(ctx, name)
 
     # wire everything up
-    aux  = timeseries.aux(ctx=ctx,
-                          cids=cids,
-                          acquired=acquired)\
-                     .filter('trends[0] NOT IN (0, 9)')\
-                     .repartition(ccdc.PRODUCT_PARTITIONS).persist()
+    aux  = timeseries.static(ctx=ctx,
+                             cids=cids,
+                             acquired=acquired).persist()
     
-    aid  = aux.select(aux.chipx, aux.chipy).distinct()
+    aid  = aux.select(aux.chipx, aux.chipy)
+
+    ccd  = ccd if ccd is not None else pyccd.select(ctx, cids.collect())
 
-    ccd  = pyccd.read(ctx, aid).filter('sday >= {} AND eday <= {}'.format(msday, meday))
+    ccd  = pyccd.restrict(ccd, aid).filter('sday >= {} AND eday <= {}'.format(msday, meday))
 
-    fdf  = features.dataframe(aux, ccd).persist()
+    fdf, hist = sample(features.dataframe(aux, ccd).filter('label NOT IN (0, 9)'), per_class, per_chip, seed)
 
-    if fdf.count() == 0:
+    if sum(hist.values()) == 0:
         log.info('No features found to train model')
+        aux.unpersist()
         return None
-    else:
-        log.debug('sample feature:{}'.format(fdf.first()))
-        log.debug('feature row count:{}'.format(fdf.count()))
-        log.debug('feature columns:{}'.format(fdf.columns))
+
+    fdf  = fdf.persist()
+    
+    log.info('feature class histogram:{}'.format(hist))
+    log.info('training class histogram:{}'.format(histogram(fdf)))
+    log.debug('feature columns:{}'.format(fdf.columns))
 
     model = pipeline(fdf).fit(fdf)
 
@@ -87,39 +335,42 @@ def train(ctx, cids, msday, meday, acquired):
     return model
 
 
-def classify(model, dataframe):
-    """Classifies a dataframe using a trained random forest model
+def floats(column):
+    """Returns a Vector column as an array<float> column
+
+    pyspark.ml.functions.vector_to_array converts in the JVM but only exists
+    from Spark 3.0.  On Spark 2.3 there is no JVM conversion, so udfs.floats
+    runs instead and every row makes a round trip through a Python worker.
 
     Args:
-        model: trained RandomForestClassifier
-        dataframe: A features dataframe
+        column: name of a Vector column
 
     Returns:
-        dataframe of raw predictions
+        Column
     """
 
-    return model.transform(dataframe)\
-                .select(['chipx', 'chipy', 'pixelx', 'pixely', 'sday', 'eday', 'rawPrediction'])\
-                .withColumnRenamed('rawPrediction', 'rfrawp')
+    try:
+        from pyspark.ml.functions import vector_to_array
+        return vector_to_array(functions.col(column), 'float32')
+    except ImportError:
+        return udfs.floats(functions.col(column))
 
 
-def dedensify(dataframe):
-    """Returns a random forest dataframe with rfrawp column converted to 
-       standard Python types
+def classify(model, dataframe):
+    """Classifies a dataframe using a trained random forest model
+
+    The model is applied to each partition in place and rfrawp is returned
+    as a list of floats, so predictions can be written to the pyccd table
+    without joining them back to the change segments.
 
     Args:
-        dataframe: random forest dataframe (from classify)
+        model: trained RandomForestClassifier
+        dataframe: A features dataframe
 
     Returns:
-        dataframe with rfrawp converted to standard Python types
+        dataframe of (chipx, chipy, pixelx, pixely, sday, eday, rfrawp)
     """
 
-    return dataframe.rdd.map(lambda r: Row(chipx=r['chipx'],
-                                           chipy=r['chipy'],
-                                           pixelx=r['pixelx'],
-                                           pixely=r['pixely'],
-                                           sday=r['sday'],
-                                           eday=r['eday'],
-                                           rfrawp=denumpify(list(r['rfrawp'])))).toDF()
-
-    
+    return model.transform(dataframe)\
+                .select('chipx', 'chipy', 'pixelx', 'pixely', 'sday', 'eday',
+                        floats('rawPrediction').alias('rfrawp'))
@@ -0,0 +1,223 @@
+"""region.py selects the chips of a study area.
+
+An area is any combination of a bounding box, tiles given by h,v and GeoJSON
+polygons.  Polygons are matched against the tile grid first: tiles entirely
+inside contribute all of their chips, tiles the boundary passes through have
+their chips tested one by one, and all other tiles are skipped.  Only chips
+that touch the area are returned, so clipped coastlines and irregular study
+areas do not schedule empty chips.
+
+A cell (tile or chip) touches a polygon if one of its corners or its center
+is inside, or if the polygon's boundary passes through it.  Every edge is
+cut where it crosses grid lines, so cells crossed by thin slivers and long
+edges are found even when no corner, center or vertex lies in them.
+"""
+
+from ccdc import grid
+from cytoolz import first
+from cytoolz import get
+
+import json
+import numpy
+
+
+def bbox(text):
+    """Parses 'ulx,uly,lrx,lry' into a tuple of floats"""
+
+    values = tuple(float(v) for v in text.split(','))
+
+    if len(values) != 4:
+        raise ValueError('bounding box must be ulx,uly,lrx,lry: {}'.format(text))
+
+    return values
+
+
+def polygons(geojson):
+    """Returns the polygons of a GeoJSON object as lists of rings
+
+    Args:
+        geojson (dict): FeatureCollection, Feature, Polygon or MultiPolygon
+
+    Returns:
+        list: [[exterior ring, hole, ...], ...], rings as (n, 2) arrays
+    """
+
+    kind = geojson.get('type')
+
+    if kind == 'FeatureCollection':
+        return [p for f in geojson['features'] for p in polygons(f)]
+
+    if kind == 'Feature':
+        return polygons(geojson['geometry'])
+
+    if kind == 'Polygon':
+        return [[numpy.asarray(r, dtype=numpy.float64)[:, :2] for r in geojson['coordinates']]]
+
+    if kind == 'MultiPolygon':
+        return [[numpy.asarray(r, dtype=numpy.float64)[:, :2] for r in p] for p in geojson['coordinates']]
+
+    raise ValueError('unsupported GeoJSON type:{}'.format(kind))
+
+
+def load(path):
+    """Reads the polygons of a GeoJSON file, see polygons()"""
+
+    with open(path) as f:
+        return polygons(json.load(f))
+
+
+def within(points, rings):
+    """Returns True for each point inside a polygon with holes"""
+
+    result = numpy.zeros(len(points), dtype=numpy.bool_)
+
+    for ring in rings:
+        result ^= grid.parity(points, ring)
+
+    return result
+
+
+def snap(points, g):
+    """Returns the upper left point of the cell containing each point"""
+
+    p = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+    h = numpy.floor((p[:, 0] * g['rx'] + g['tx']) / g['sx'])
+    v = numpy.floor((p[:, 1] * g['ry'] + g['ty']) / g['sy'])
+    return numpy.column_stack([(h * g['sx'] - g['tx']) / g['rx'], (v * g['sy'] - g['ty']) / g['ry']])
+
+
+def crossed(rings, g):
+    """Returns the upper left points of the cells the edges of rings pass through
+
+    Edges are moved to grid index space, where cells are unit squares, and
+    cut at every grid line they cross.  The midpoint of each piece lies in a
+    cell the edge passes through.  Pieces of zero length, where an edge only
+    touches a cell corner, are dropped.
+
+    Args:
+        rings (list): polygon rings, see polygons()
+        g (dict): grid
+
+    Returns:
+        (n, 2) array of cell upper left points
+    """
+
+    p    = numpy.concatenate([numpy.stack([r, numpy.roll(r, -1, axis=0)], axis=1) for r in rings])
+    u    = (p[:, :, 0] * g['rx'] + g['tx']) / g['sx']
+    v    = (p[:, :, 1] * g['ry'] + g['ty']) / g['sy']
+    edge = numpy.arange(len(p))
+    ts   = [numpy.zeros(len(p)), numpy.ones(len(p))]
+    ids  = [edge, edge]
+
+    for c in (u, v):
+        lo, hi = numpy.floor(c.min(axis=1)), numpy.floor(c.max(axis=1))
+        n      = (hi - lo).astype(numpy.int64)
+        which  = numpy.repeat(edge, n)
+        lines  = lo[which] + 1 + (numpy.arange(n.sum()) - numpy.repeat(numpy.cumsum(n) - n, n))
+        ts.append((lines - c[which, 0]) / (c[which, 1] - c[which, 0]))
+        ids.append(which)
+
+    t, e   = numpy.concatenate(ts), numpy.concatenate(ids)
+    order  = numpy.lexsort((t, e))
+    t, e   = t[order], e[order]
+    piece  = (e[1:] == e[:-1]) & (t[1:] - t[:-1] > 1e-9)
+    mid    = (t[1:] + t[:-1])[piece] / 2.0
+    e      = e[1:][piece]
+    hs     = numpy.floor(u[e, 0] + mid * (u[e, 1] - u[e, 0]))
+    vs     = numpy.floor(v[e, 0] + mid * (v[e, 1] - v[e, 0]))
+
+    return numpy.column_stack([(hs * g['sx'] - g['tx']) / g['rx'], (vs * g['sy'] - g['ty']) / g['ry']])
+
+
+def probes(cells, g):
+    """Returns the four corners and center of each cell, (n, 5, 2)"""
+
+    w      = g['sx'] * g['rx']
+    h      = g['sy'] * g['ry']
+    offset = numpy.array([[0, 0], [w, 0], [0, h], [w, h], [w / 2.0, h / 2.0]])
+    return cells[:, None, :].astype(numpy.float64) + offset[None, :, :]
+
+
+def boundary(rings, g):
+    """Returns the keys of the cells holding a vertex or crossed by an edge, see grid.key()"""
+
+    return numpy.union1d(grid.key(snap(numpy.concatenate(rings), g)), grid.key(crossed(rings, g)))
+
+
+def touches(cells, g, rings, edges=None):
+    """Classifies grid cells against a polygon
+
+    Args:
+        cells: (n, 2) array of cell upper left points
+        g (dict): grid the cells belong to
+        rings (list): polygon rings, see polygons()
+        edges: boundary(rings, g), computed if None
+
+    Returns:
+        tuple: (bool array of cells touching the polygon,
+                bool array of cells entirely inside it)
+    """
+
+    if len(cells) == 0:
+        return numpy.zeros(0, dtype=numpy.bool_), numpy.zeros(0, dtype=numpy.bool_)
+
+    edges    = boundary(rings, g) if edges is None else edges
+    inside   = within(probes(cells, g).reshape(-1, 2), rings).reshape(-1, 5)
+    holding  = numpy.isin(grid.key(cells), edges)
+
+    return inside.any(axis=1) | holding, inside.all(axis=1) & ~holding
+
+
+def polygon(rings, cfg):
+    """Returns the chip ids touching a polygon
+
+    Args:
+        rings (list): polygon rings, see polygons()
+        cfg (dict): a Merlin configuration
+
+    Returns:
+        numpy array of chip ids
+    """
+
+    tgrid, cgrid = grid.grids(cfg)
+    tgrid, cgrid = dict(tgrid), dict(cgrid)
+    vertices     = numpy.concatenate(rings)
+    (ulx, lry), (lrx, uly) = vertices.min(axis=0), vertices.max(axis=0)
+
+    cells        = grid.region(ulx, uly, lrx, lry, cfg=None, cgrid=tgrid)
+    touched, full = touches(cells, tgrid, rings)
+    edges        = boundary(rings, cgrid)
+    areas        = []
+
+    for (tx, ty), whole in zip(cells[touched].tolist(), full[touched]):
+        chips = get('chips', grid.tile(tx, ty, cfg))
+        areas.append(chips if whole else chips[first(touches(chips, cgrid, rings, edges))])
+
+    return grid.union(*areas)
+
+
+def tiles(hvs, cfg):
+    """Returns the chip ids of tiles given by h,v"""
+
+    return grid.union(*[grid.tile(*grid.point(h, v, cfg), cfg=cfg)['chips'] for h, v in hvs])
+
+
+def chips(cfg, box=None, hvs=(), shapes=()):
+    """Returns the chip ids of an area
+
+    Args:
+        cfg (dict): a Merlin configuration
+        box (tuple): (ulx, uly, lrx, lry), see bbox()
+        hvs (sequence): [(h, v), ...]
+        shapes (sequence): polygons, see polygons()
+
+    Returns:
+        numpy array of the unique chip ids touching any part of the area
+    """
+
+    areas = [tiles(hvs, cfg)] + [polygon(rings, cfg) for rings in shapes]
+
+    if box is not None:
+        areas.append(grid.region(*box, cfg=cfg))
+
+    return grid.union(*areas)
@@ -0,0 +1,79 @@
+"""sink.py reads and writes results through the configured backend.
+
+ccdc.SINK selects the backend for a run:
+
+cassandra -- the Cassandra keyspace for this ccdc version (default)
+parquet   -- partitioned Parquet files under ccdc.SINK_DIR, see parquet.py
+
+Both backends use the table names, columns and partition keys of
+resources/schema.cql.
+"""
+
+from ccdc import cassandra
+from ccdc import parquet
+
+import ccdc
+
+__backends = {'cassandra': cassandra,
+              'parquet':   parquet}
+
+
+def backend(name=None):
+    """Returns the module implementing a backend, defaults to ccdc.SINK"""
+
+    name = name or ccdc.SINK
+
+    if name not in __backends:
+        raise ValueError('unknown sink:{}, expected one of {}'.format(name, sorted(__backends)))
+
+    return __backends[name]
+
+
+def select(ctx, table, ids, keys, schema):
+    """Read the partitions of a table named by a dataframe of keys
+
+    Args:
+        ctx: spark context
+        table: table to read from
+        ids: small dataframe of partition keys
+        keys: partition key column names
+        schema: table schema, returned empty if the table has not been written
+
+    Returns:
+        ids joined with the matching rows of table
+    """
+
+    if backend() is parquet:
+        return parquet.select(ctx, table, ids, keys, schema)
+
+    return cassandra.select(ctx, table, ids, keys)
+
+
+def write(ctx, df, table):
+    """Write a dataframe to a table, replacing rows with the same primary key
+
+    Args:
+        ctx: spark context
+        df: dataframe conforming to the table schema
+        table: table to write to
+
+    Returns:
+        None
+    """
+
+    return backend().write(ctx, df, table)
+
+
+def delete(ctx, table, keys):
+    """Delete partitions from a table
+
+    Args:
+        ctx: spark context
+        table: table to delete from
+        keys: sequence of partition keys as dicts, {'chipx': 1, 'chipy': 2}
+
+    Returns:
+        count of deleted partitions
+    """
+
+    return backend().delete(ctx, table, keys)
@@ -1,10 +1,16 @@
+from ccdc import arrow
+from ccdc import cache
 from ccdc import cassandra
 from ccdc import context
+from ccdc import fetch
 from ccdc import ids
 from ccdc import logger
 from cytoolz import assoc
 from cytoolz import first
+from cytoolz import get
+from cytoolz import merge
 from cytoolz import second
+from cytoolz import thread_last
 from functools import partial
 from merlin.functions import denumpify
 from pyspark import sql
@@ -53,7 +59,20 @@ def schema(name):
                             StructField('aspect', ArrayType(IntegerType(), False), nullable=True),
                             StructField('posidex', ArrayType(FloatType(), False), nullable=True),
                             StructField('slope', ArrayType(FloatType(), False), nullable=True),
-                            StructField('mpw', ArrayType(IntegerType(), False), nullable=True)])}
+                            StructField('mpw', ArrayType(IntegerType(), False), nullable=True)]),
+         'static': StructType([StructField('chipx', IntegerType(), nullable=False),
+                               StructField('chipy', IntegerType(), nullable=False),
+                               StructField('ox', IntegerType(), nullable=False),
+                               StructField('oy', IntegerType(), nullable=False),
+                               StructField('rx', IntegerType(), nullable=False),
+                               StructField('ry', IntegerType(), nullable=False),
+                               StructField('ncols', IntegerType(), nullable=False),
+                               StructField('dem', ArrayType(FloatType()), nullable=True),
+                               StructField('trends', ArrayType(IntegerType()), nullable=True),
+                               StructField('aspect', ArrayType(IntegerType()), nullable=True),
+                               StructField('posidex', ArrayType(FloatType()), nullable=True),
+                               StructField('slope', ArrayType(FloatType()), nullable=True),
+                               StructField('mpw', ArrayType(IntegerType()), nullable=True)])}
 
     return s.get(name) if name else s
 
@@ -89,9 +108,177 @@ def dataframe(ctx, rdd):
                                    schema=schema(rdd.name()))
 
 
+def pack(timeseries):
+    """Packs the pixel timeseries of a single chip into one chip record
+
+    Every pixel in a chip shares the same dates, so they are kept once per chip
+    and each band becomes a 2d (pixels x observations) array.
+
+    Args:
+        timeseries (sequence): ((chipx, chipy, pixelx, pixely), {data}) for one chip
+
+    Returns:
+        tuple: ((chipx, chipy), {'pixels': 2d array of (pixelx, pixely),
+                                 'dates':  [...],
+                                 'blues':  2d array, ...}) or None if empty
+    """
+
+    pixels = list(timeseries)
+
+    if not pixels:
+        return None
+
+    keys  = [first(p) for p in pixels]
+    data  = [second(p) for p in pixels]
+    bands = [k for k in first(data) if k != 'dates']
+
+    return ((int(keys[0][0]), int(keys[0][1])),
+            merge({'pixels': numpy.array([(k[2], k[3]) for k in keys], dtype=numpy.int32),
+                   'dates':  get('dates', first(data))},
+                  {b: numpy.vstack([d[b] for d in data]) for b in bands}))
+
+
+def unpack(chip):
+    """Unpacks a chip record into pixel timeseries.  Inverse of pack().
+
+    Args:
+        chip (tuple): ((chipx, chipy), {data})
+
+    Returns:
+        generator of ((chipx, chipy, pixelx, pixely), {data})
+    """
+
+    (chipx, chipy), data = chip
+
+    dates = get('dates', data)
+    bands = [k for k in data if k not in ('dates', 'pixels')]
+
+    for i, (x, y) in enumerate(get('pixels', data)):
+        yield ((chipx, chipy, int(x), int(y)),
+               merge({'dates': dates}, {b: data[b][i] for b in bands}))
+
+
+def packed(x, y, locations, dates_fn, specmap, chipmap, datefmt):
+    """Merlin format_fn that builds a single chip record instead of pixel records.
+
+    Produces the same values as merlin.formats.pyccd and merlin.formats.aux
+    once unpacked, without creating a dictionary per pixel.
+
+    Args:
+        x: x projection coordinate of chip
+        y: y projection coordinate of chip
+        locations: chip shaped 2d array of projection coordinates
+        dates_fn (fn): returns dates that should be included in time series
+        specmap (dict): mapping of keys to specs
+        chipmap (dict): mapping of keys to chips
+        datefmt (fn): formats the chip dates for the record
+
+    Returns:
+        tuple: ((chipx, chipy), {data}) or None if the chip has no data.  See pack().
+    """
+
+    index = merlin.specs.index(list(merlin.functions.flatten(specmap.values())))
+    dates = dates_fn(datemap=merlin.dates.mapped(chipmap))
+
+    def rods(chipseq):
+        chips = thread_last(chipseq,
+                            partial(merlin.chips.trim, dates=dates),
+                            merlin.chips.deduplicate,
+                            merlin.chips.rsort,
+                            partial(merlin.chips.to_numpy, spec_index=index),
+                            list)
+        
+        return merlin.rods.from_chips(chips).reshape(-1, len(chips)) if chips else None
+
+    data = {k: v for k, v in {k: rods(c) for k, c in chipmap.items()}.items() if v is not None}
+
+    if not data:
+        return None
+
+    return ((int(x), int(y)),
+            merge({'pixels': numpy.asarray(locations).reshape(-1, 2).astype(numpy.int32),
+                   'dates':  datefmt(dates)},
+                  data))
+
+
+def packer(cfg):
+    """Returns a Merlin configuration that creates chip records.
+
+    Merlin's own formats are replaced with packed().  Any other format_fn
+    is wrapped with pack().
+
+    Args:
+        cfg: A Merlin configuration
+
+    Returns:
+        A Merlin configuration
+    """
+
+    datefmts = {merlin.formats.pyccd: lambda d: list(map(merlin.dates.to_ordinal, merlin.dates.rsort(d))),
+                merlin.formats.aux:   lambda d: [merlin.dates.minmax(d)]}
+    
+    fmt = get('format_fn', cfg)
+        
+    if fmt in datefmts:
+        return assoc(cfg, 'format_fn', partial(packed, datefmt=datefmts[fmt]))
+    else:
+        return assoc(cfg, 'format_fn', lambda *args, **kwargs: pack(fmt(*args, **kwargs)))
+
+
+def creator(acquired, cfg):
+    """Returns a function that fetches packed chips for a sequence of chip ids
+
+    Up to ccdc.FETCH_CHIPS chips are fetched concurrently and empty chips are
+    dropped.
+
+    Args:
+        acquired (str): ISO8601 date range: 1980-01-01/2017-01-01
+        cfg: A Merlin configuration
+
+    Returns:
+        func: sequence of chip ids -> generator of chip timeseries.  See pack().
+    """
+
+    fn     = partial(merlin.create, cfg=packer(cache.configure(fetch.configure(cfg))))
+    create = lambda c: fn(x=first(c), y=second(c), acquired=get(2, c, acquired))
+
+    return lambda cids: (c for c in fetch.pmap(create, cids, concurrency=ccdc.FETCH_CHIPS) if c is not None)
+
+
+def chips(ctx, cids, acquired, cfg, name=__name__):
+    """Create chip packed timeseries from a collection of chip ids and time range
+
+    Chips are repartitioned whole, so shuffles move one record per chip
+    with a single copy of the dates.  Chips are read from the local chip
+    cache when ccdc.CHIP_CACHE_DIR is set.
+
+    Within each partition up to ccdc.FETCH_CHIPS chips are fetched concurrently
+    and each chip requests its ubids concurrently, see ccdc.fetch.
+
+    Args:
+        ctx      : spark context
+        cids (rdd): RDD of chip ids, optionally (x, y, acquired) to override acquired per chip
+        acquired (str): ISO8601 date range: 1980-01-01/2017-01-01 
+        cfg: A Merlin configuration
+
+    Returns:
+        RDD of chip timeseries: ((chipx, chipy), {data}).  See pack().
+    """
+
+    logger(ctx, name).info('creating chip time series')
+    
+    return cids\
+        .mapPartitions(creator(acquired=acquired, cfg=cfg))\
+        .repartition(ccdc.PRODUCT_PARTITIONS)\
+        .setName(name)
+
+
 def rdd(ctx, cids, acquired, cfg, name=__name__):
     """Create timeseries from a collection of chip ids and time range
 
+    Chips are repartitioned before being unpacked, so pixel records only
+    exist inside the partition that consumes them.
+
     Args:
         ctx      : spark context
         cids (rdd): RDD of chip ids
@@ -115,17 +302,153 @@ def rdd(ctx, cids, acquired, cfg, name=__name__):
           'dates':    [734992, 734991, 734984, 734983, 734976, 734975, 734448, 734441, 734439, 727265, 726648, 726616]})
     """
 
-    logger(ctx, name).info('creating time series')
-    
-    fn = partial(merlin.create, acquired=acquired, cfg=cfg)
-    
-    return cids\
-        .flatMap(lambda xy: fn(x=first(xy), y=second(xy)))\
-        .map(lambda x: ((int(x[0][0]), int(x[0][1]), int(x[0][2]), int(x[0][3])), x[1]))\
-        .repartition(ccdc.PRODUCT_PARTITIONS)\
+    return chips(ctx=ctx, cids=cids, acquired=acquired, cfg=cfg, name=name)\
+        .flatMap(unpack)\
         .setName(name)
 
 
+def columns(chips, name):
+    """Unpacks chip timeseries into columns
+
+    Band arrays are kept as numpy rows of the chip arrays, see arrow.frame().
+
+    Args:
+        chips (sequence): chip timeseries, see pack()
+        name (str): name of timeseries schema
+
+    Returns:
+        dict: column name to list of values
+    """
+
+    names = schema(name).names
+    cols  = {n: [] for n in names}
+
+    for (chipx, chipy), data in chips:
+        pixels = get('pixels', data)
+        count  = len(pixels)
+
+        cols['chipx'].extend([chipx] * count)
+        cols['chipy'].extend([chipy] * count)
+        cols['pixelx'].extend(pixels[:, 0].tolist())
+        cols['pixely'].extend(pixels[:, 1].tolist())
+        cols['dates'].extend([get('dates', data)] * count)
+
+        for n in names:
+            if n in ('chipx', 'chipy', 'pixelx', 'pixely', 'dates'):
+                continue
+            band = get(n, data)
+            cols[n].extend([None] * count if band is None else list(band))
+
+    return cols
+
+
+def columnar(ctx, cids, acquired, cfg, name):
+    """Create a timeseries dataframe through Arrow instead of pickled rows
+
+    Args:
+        ctx      : spark context
+        cids (rdd): RDD of chip ids
+        acquired (str): ISO8601 date range: 1980-01-01/2017-01-01
+        cfg: A Merlin configuration
+        name (str): name of timeseries schema
+
+    Returns:
+        dataframe conforming to schema(name)
+    """
+
+    logger(ctx, name).info('creating columnar {} time series'.format(name))
+
+    fetch_fn = creator(acquired=acquired, cfg=cfg)
+
+    return arrow.dataframe(ctx=ctx,
+                           cids=cids,
+                           fn=lambda xys: columns(fetch_fn(xys), name),
+                           schema=schema(name))
+
+
+def raster(chip, layers):
+    """Converts a packed AUX chip to one raster per layer
+
+    AUX layers have a single value per pixel, so each layer is stored as a
+    flat row major array over the chip with its origin (ox, oy), pixel size
+    (rx, ry) and width.  The value for a pixel is at index
+    ((oy - pixely) / ry) * ncols + (pixelx - ox) / rx.
+
+    Args:
+        chip (tuple): packed AUX chip, see pack()
+        layers (sequence): layer names
+
+    Returns:
+        dict: row of schema('static')
+    """
+
+    (chipx, chipy), data = chip
+
+    pixels = numpy.asarray(get('pixels', data), dtype=numpy.int64)
+    xs     = numpy.unique(pixels[:, 0])
+    ys     = numpy.unique(pixels[:, 1])
+    rx     = int(numpy.diff(xs).min()) if len(xs) > 1 else 1
+    ry     = int(numpy.diff(ys).min()) if len(ys) > 1 else 1
+    ox, oy = int(xs.min()), int(ys.max())
+    ncols  = (int(xs.max()) - ox) // rx + 1
+    nrows  = (oy - int(ys.min())) // ry + 1
+    index  = ((oy - pixels[:, 1]) // ry) * ncols + (pixels[:, 0] - ox) // rx
+    filled = numpy.zeros(nrows * ncols, dtype=numpy.bool_)
+    filled[index] = True
+
+    def layer(name):
+        band = get(name, data, None)
+
+        if band is None:
+            return None
+
+        band   = numpy.asarray(band)[:, 0]
+        values = numpy.zeros(nrows * ncols, dtype=band.dtype)
+        values[index] = band
+
+        if not filled.all():
+            values = values.astype(object)
+            values[~filled] = None
+
+        return values.tolist()
+
+    return merge({'chipx': int(chipx),
+                  'chipy': int(chipy),
+                  'ox':    ox,
+                  'oy':    oy,
+                  'rx':    rx,
+                  'ry':    ry,
+                  'ncols': ncols},
+                 {n: layer(n) for n in layers})
+
+
+def static(ctx, cids, acquired, cfg=ccdc.AUX):
+    """Create a dataframe of AUX layer rasters, one row per chip
+
+    Each AUX chip is fetched once and kept as a raster per layer instead of
+    one record per pixel, see raster() and features.locate().  Rows are hash
+    partitioned by chip, see features.partitioned().
+
+    Args:
+        ctx:  spark context
+        cids: rdd of chip ids
+        acquired (str): ISO8601 date range: 1980-01-01/2017-12-31
+        cfg: A Merlin configuration
+
+    Returns:
+        dataframe conforming to schema('static')
+    """
+
+    logger(ctx, __name__).info('creating aux rasters')
+
+    layers = [n for n in schema('static').names if n in schema('aux').names and n not in ('chipx', 'chipy')]
+    rows   = cids.mapPartitions(creator(acquired=acquired, cfg=cfg))\
+                 .map(partial(raster, layers=layers))
+
+    return SparkSession(ctx).createDataFrame(rows, schema('static'))\
+                            .repartition(ccdc.PRODUCT_PARTITIONS, 'chipx', 'chipy')
+
+
 def ard(ctx, cids, acquired, cfg=ccdc.ARD):
     """Create an ard timeseries dataframe
     
@@ -137,6 +460,9 @@ def ard(ctx, cids, acquired, cfg=ccdc.ARD):
     Returns:
         ARD dataframe: ((chipx, chipy, pixelx, pixely), {data}) 
     """
+
+    if ccdc.ARROW:
+        return columnar(ctx=ctx, cids=cids, acquired=acquired, cfg=cfg, name='ard')
     
     return dataframe(ctx=ctx,
                      rdd=rdd(ctx=ctx,
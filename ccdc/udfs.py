@@ -2,6 +2,8 @@ from cytoolz import first
 from pyspark.sql.functions import udf
 from pyspark.ml.linalg import Vectors
 from pyspark.ml.linalg import VectorUDT
+from pyspark.sql.types import ArrayType
+from pyspark.sql.types import FloatType
 
 
 @udf(returnType=VectorUDT())
@@ -21,4 +23,15 @@ def densify(*args, **kwargs):
     return Vectors.dense(list(map(fn, args)))
 
 
- 
+@udf(returnType=ArrayType(FloatType()))
+def floats(vector):
+    """Convert a Vector to a list of floats
+
+    Args:
+        vector: pyspark.ml.linalg.Vector
+
+    Returns:
+        list of float
+    """
+
+    return None if vector is None else vector.toArray().tolist()
@@ -41,6 +41,9 @@ setup(name='lcmap-ccdc',
                    'mock',
                   ],
           'dev': ['',],
+          'arrow': ['pandas>=0.19.2',
+                    'pyarrow>=0.8.0',
+                   ],
       },
       #test_suite='nose.collector',
       #tests_require=['nose', 'nose-cover3'],
@@ -23,8 +23,8 @@ aux_schema       = merge([schemabase, auxbase, ['trends']])
 features_columns = merge([attrbase,   auxbase, ['grint']])
 features_dframe  = merge([attrbase, ard_schema, ['sday', 'eday', 'grint']])
 ccd_schema_base  = merge([schemabase, attrbase, ['sday', 'eday', 'bday', 'chprob', 'curqa', 'snprob', 'waprob', 'clprob', 'prmask']])
-ccd_format_keys  = merge([ccd_schema_base, ['grint']])
-ccd_schema_names = merge([ccd_schema_base, ['rfrawp']])
+ccd_format_keys  = merge([ccd_schema_base, ['grint', 'dtbits', 'prbits']])
+ccd_schema_names = merge([ccd_schema_base, ['grint', 'dtbits', 'prbits', 'rfrawp']])
 merged_schema    = merge([ard_schema, aux_schema])
 
 timeseries_element = ((-1815585, 1064805, -1814475, 1062105),
@@ -38,6 +38,18 @@ timeseries_element = ((-1815585, 1064805, -1814475, 1062105),
                        'greens':   array([-9999, -9999, -9999, -9999], dtype=int16),
                        'dates':    [734973, 731205, 724404, 723868]})
 
+chip_element = ((-1815585, 1064805),
+                {'pixels':   array([[-1814475, 1062105], [-1814445, 1062105]]),
+                 'blues':    array([[-9999, -9999, -9999, -9999], [-9999, -9999, -9999, -9999]], dtype=int16),
+                 'qas':      array([[1, 1, 1, 1], [1, 1, 1, 1]], dtype=uint16),
+                 'nirs':     array([[-9999, -9999, -9999, -9999], [-9999, -9999, -9999, -9999]], dtype=int16),
+                 'thermals': array([[-9999, -9999, -9999, -9999], [-9999, -9999, -9999, -9999]], dtype=int16),
+                 'swir2s':   array([[-9999, -9999, -9999, -9999], [-9999, -9999, -9999, -9999]], dtype=int16),
+                 'reds':     array([[-9999, -9999, -9999, -9999], [-9999, -9999, -9999, -9999]], dtype=int16),
+                 'swir1s':   array([[-9999, -9999, -9999, -9999], [-9999, -9999, -9999, -9999]], dtype=int16),
+                 'greens':   array([[-9999, -9999, -9999, -9999], [-9999, -9999, -9999, -9999]], dtype=int16),
+                 'dates':    [734973, 731205, 724404, 723868]})
+
 grid_resp = json.loads(open(TEST_ROOT+"/data/grid_response.json").read())
 near_resp = json.loads(open(TEST_ROOT+"/data/near_response.json").read())
 snap_resp = json.loads(open(TEST_ROOT+"/data/snap_response.json").read())
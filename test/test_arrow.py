@@ -0,0 +1,58 @@
+from ccdc import arrow
+from ccdc import pyccd
+from .shared import chip_element
+
+import numpy
+import pytest
+
+
+def test_dtype():
+    assert arrow.dtype(pyccd.schema()['prmask'].dataType.elementType) == numpy.int8
+    assert arrow.dtype(pyccd.schema()['dates']) is None
+
+
+def test_bucket():
+    assert arrow.bucket((-1815585, 1064805), 8) == arrow.bucket((-1815585.0, 1064805.0), 8)
+    assert 0 <= arrow.bucket((-1815585, 1064805), 8) < 8
+    assert arrow.bucket((-1815585, 1064805), 8) == 6
+
+    counts = numpy.bincount([arrow.bucket((x * 3000, y * 3000), 8) for x in range(50) for y in range(50)], minlength=8)
+    assert counts.min() > 0.8 * counts.mean()
+
+
+def test_labels(spark_context):
+    from pyspark.sql import SparkSession
+    from pyspark.sql.functions import spark_partition_id
+
+    labels = arrow.labels(spark_context, 7)
+    df     = SparkSession(spark_context).createDataFrame([(v,) for v in labels], 'bucket int').repartition(7, 'bucket')
+
+    assert len(set(labels)) == 7
+    assert sorted(r.bucket for r in df.select('bucket', spark_partition_id().alias('p')).collect()
+                  if labels[r.p] == r.bucket) == sorted(labels)
+
+
+def test_frame():
+    pytest.importorskip('pandas')
+
+    frame = arrow.frame(pyccd.columns([chip_element]), pyccd.schema())
+
+    assert list(frame.columns) == pyccd.schema().names
+    assert frame['chipx'].dtype == numpy.int32
+    assert frame['blrmse'].dtype == numpy.float32
+    assert frame['dates'][0].dtype == numpy.int32
+    assert frame['rfrawp'][0] is None
+
+
+def test_dataframe_partitions(spark_context, monkeypatch):
+    pytest.importorskip('pyarrow')
+    import ccdc
+
+    monkeypatch.setattr(ccdc, 'INPUT_PARTITIONS', 1)
+    monkeypatch.setattr(ccdc, 'PRODUCT_PARTITIONS', 3)
+
+    schema = pyccd.schema('list')
+    cids   = spark_context.parallelize([(x * 3000, 0) for x in range(30)], 1)
+    df     = arrow.dataframe(spark_context, cids, lambda xys: pyccd.columns([]), schema)
+
+    assert df.rdd.getNumPartitions() == 3
@@ -0,0 +1,55 @@
+from ccdc import cache
+from cytoolz import first
+from .shared import chip_resp
+
+import os
+
+
+def test_encode_decode(tmpdir):
+    chips = tuple(chip_resp[0:2])
+    path  = str(tmpdir.join('chips.npz'))
+    cache.numpy.savez_compressed(path, **cache.encode(chips))
+
+    with cache.numpy.load(path) as npz:
+        assert cache.decode(npz) == chips
+
+def test_key():
+    k1 = cache.key(x=1, y=2, acquired='1980/2017', ubids=['a', 'b'], url='http://x')
+    k2 = cache.key(x=1.0, y=2.0, acquired='1980/2017', ubids=['b', 'a'], url='http://x')
+    k3 = cache.key(x=1, y=2, acquired='1980/2017', ubids=['a', 'b'], url='http://y')
+    assert k1 == k2
+    assert k1 != k3
+
+def test_cached(tmpdir):
+    calls = []
+
+    def chips_fn(x, y, acquired, ubids):
+        calls.append((x, y))
+        return tuple(chip_resp[0:1])
+
+    cfg = cache.configure({'chips_fn': chips_fn}, directory=str(tmpdir), limit=10 ** 9)
+    fn  = cfg['chips_fn']
+
+    assert fn(x=1, y=2, acquired='a/b', ubids=['u']) == tuple(chip_resp[0:1])
+    assert fn(x=1, y=2, acquired='a/b', ubids=['u']) == tuple(chip_resp[0:1])
+    assert len(calls) == 1
+
+    stats = cache.instance(str(tmpdir), 10 ** 9).stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+
+def test_cached_empty(tmpdir):
+    cfg = cache.configure({'chips_fn': lambda **kwargs: ()}, directory=str(tmpdir), limit=10 ** 9)
+    assert cfg['chips_fn'](x=1, y=2, acquired='a/b', ubids=['u']) == ()
+    assert os.listdir(str(tmpdir)) == []
+
+def test_evict(tmpdir):
+    c = cache.ChipCache(directory=str(tmpdir), limit=1)
+    c.put('one', tuple(chip_resp[0:1]))
+    c.put('two', tuple(chip_resp[0:1]))
+    assert len(os.listdir(str(tmpdir))) <= 1
+    assert c.evictions >= 1
+
+def test_configure_disabled():
+    cfg = {'chips_fn': first}
+    assert cache.configure(cfg, directory='') is cfg
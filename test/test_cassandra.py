@@ -2,6 +2,8 @@ from ccdc    import cassandra
 from ccdc    import pyccd
 from pyspark import sql
 
+import ccdc
+
 
 def test_options():
     opts = cassandra.options("foo")
@@ -14,9 +16,67 @@ def test_options():
                                 'spark.cassandra.connection.port', 
                                 'spark.cassandra.input.consistency.level',
                                 'spark.cassandra.output.batch.grouping.buffer.size', 
+                                'spark.cassandra.output.batch.grouping.key',
+                                'spark.cassandra.output.batch.size.rows',
+                                'spark.cassandra.output.batch.size.bytes',
                                 'spark.cassandra.output.concurrent.writes', 
                                 'spark.cassandra.output.consistency.level'}
 
+
+    assert opts['spark.cassandra.output.batch.grouping.key'] == 'partition'
+
+
+def test_options_throughput(monkeypatch):
+    monkeypatch.setattr(ccdc, 'CASSANDRA_OUTPUT_THROUGHPUT_MB', 2.5)
+    assert cassandra.options('foo')['spark.cassandra.output.throughput_mb_per_sec'] == 2.5
+
+
+def test_options_grouping(monkeypatch):
+    monkeypatch.setattr(ccdc, 'CASSANDRA_OUTPUT_GROUPING_KEY', 'replica_set')
+    assert cassandra.options('foo')['spark.cassandra.output.batch.grouping.key'] == 'replica_set'
+
+
+def test_partition(sql_context):
+    assert cassandra.partition(sql_context.createDataFrame([(1, 2, 3)], ['chipy', 'chipx', 'sday'])) == ['chipx', 'chipy']
+    assert cassandra.partition(sql_context.createDataFrame([(1, 2)], ['tilex', 'tiley'])) == ['tilex', 'tiley']
+    assert cassandra.partition(sql_context.createDataFrame([(1,)], ['sday'])) == []
+
+
+def test_throughput():
+    assert cassandra.throughput(100, 2.0) == {'rows': 100, 'seconds': 2.0, 'rows/s': 50.0}
+    assert cassandra.throughput(None, 2.0)['rows/s'] is None
+
+
+def test_rows(sql_context):
+    df = sql_context.range(1234)
+    assert cassandra.rows(df) is None
+    assert cassandra.rows(df.cache()) == 1234
+    df.unpersist()
+
+
+def test_predicate(sql_context):
+    df   = sql_context.createDataFrame([(1, 2), (1, 4), (3, 2), (3, 4), (5, 6)], ['chipx', 'chipy'])
+    rows = [{'chipx': 1, 'chipy': 2}, {'chipx': 3, 'chipy': 2}]
+    diag = [{'chipx': 1, 'chipy': 2}, {'chipx': 3, 'chipy': 4}]
+
+    assert sorted(tuple(r) for r in df.filter(cassandra.predicate(rows, ['chipx', 'chipy'])).collect()) == [(1, 2), (3, 2)]
+    assert sorted(tuple(r) for r in df.filter(cassandra.predicate(diag, ['chipx', 'chipy'])).collect()) == [(1, 2), (3, 4)]
+    assert len(cassandra.restrictions(diag, ['chipx', 'chipy'])) == 2
+    assert len(cassandra.restrictions(diag, ['chipx', 'chipy'], 1)) == 1
+    assert len(cassandra.restrictions([{'chipx': x, 'chipy': x} for x in range(100)], ['chipx', 'chipy'], 8)) == 8
+    assert df.filter(cassandra.predicate([], ['chipx', 'chipy'])).count() == 0
+
+
+def test_select(spark_context, sql_context, monkeypatch):
+    df = sql_context.createDataFrame([(x, y, x * y) for x in range(4) for y in range(4)], ['chipx', 'chipy', 'v'])
+    monkeypatch.setattr(cassandra, 'read', lambda sc, table: df)
+
+    for keys in ([(1, 2), (3, 0)], [(1, 2), (1, 3), (2, 2), (2, 3)], [(x, 3 - x) for x in range(4)], []):
+        ids = sql_context.createDataFrame(keys, 'chipx int, chipy int')
+        for blocks in (1, 2, 8):
+            selected = cassandra.select(spark_context, 'data', ids, ['chipx', 'chipy'], blocks)
+            assert sorted((r.chipx, r.chipy) for r in selected.collect()) == sorted(keys)
+
     
 def test_read_write(spark_context, timeseries_rdd):
 
@@ -1,7 +1,10 @@
+from ccdc import cache
 from ccdc import cli
 from ccdc import cli
 from click.testing import CliRunner
 
+import datetime
+import numpy
 import test
 
 @test.vcr.use_cassette(test.cassette)
@@ -12,5 +15,131 @@ def test_changedetection():
     assert result.exit_code == 0
 
 
-def test_classification():
-    pass
+class Log(object):
+    def __init__(self):
+        self.messages = []
+    def info(self, msg):
+        self.messages.append(msg)
+
+
+def test_acquired(monkeypatch):
+    class Clock(datetime.datetime):
+        times = iter([(2018, 5, 1, 8, 15, 1, 123), (2018, 5, 1, 17, 40, 59, 987)])
+
+        @classmethod
+        def now(cls):
+            return datetime.datetime(*next(cls.times))
+
+    monkeypatch.setattr(cli.datetime, 'datetime', Clock)
+    first, second = cli.acquired(), cli.acquired()
+
+    assert first == '0001-01-01/2018-05-01'
+    assert cache.key(1, 2, first, ['a'], 'http://x') == cache.key(1, 2, second, ['a'], 'http://x')
+
+def test_stream(monkeypatch):
+    batches = []
+
+    def detection(ctx, xys, acquired, update=False):
+        batches.append(xys)
+        return len(xys) * 2
+
+    monkeypatch.setattr(cli, 'detection', detection)
+    xys     = [(x, x) for x in range(10)]
+    written = cli.stream(ctx=None, xys=xys, acquired='a/b', batch_size=3, in_flight=2, log=Log())
+    assert written == 20
+    assert sorted(map(len, batches)) == [1, 3, 3, 3]
+    assert sorted(xy for b in batches for xy in b) == xys
+
+
+def test_stream_array(monkeypatch):
+    batches = []
+
+    def detection(ctx, xys, acquired, update=False):
+        batches.append(xys)
+        return len(xys)
+
+    monkeypatch.setattr(cli, 'detection', detection)
+    xys     = numpy.array([(x, -x) for x in range(5)])
+    written = cli.stream(ctx=None, xys=xys, acquired='a/b', batch_size=2, in_flight=1, log=Log())
+    assert written == 5
+    assert batches == [[(0, 0), (1, -1)], [(2, -2), (3, -3)], [(4, -4)]]
+
+
+def test_checkpoint(spark_context, sql_context, monkeypatch, tmpdir):
+    df = sql_context.createDataFrame([(1, 2), (3, 4)], ['chipx', 'chipy'])
+
+    assert cli.checkpoint(spark_context, df).collect() == df.collect()
+
+    monkeypatch.setattr(cli.ccdc, 'CHECKPOINT_DIR', str(tmpdir))
+    assert cli.checkpoint(spark_context, df).collect() == df.collect()
+    assert tmpdir.listdir()
+
+
+def test_detection_update(monkeypatch):
+    calls = []
+
+    class Frame(object):
+        def __init__(self, name):
+            self.name = name
+        def select(self, *cols):
+            return self
+        def distinct(self):
+            return self
+        def collect(self):
+            return []
+        def count(self):
+            return 7
+        def unpersist(self):
+            calls.append(('unpersist', self.name))
+
+    monkeypatch.setattr(cli, 'incremental', lambda ctx, xys, acquired: (None, []))
+    monkeypatch.setattr(cli.pyccd, 'dataframe', lambda ctx, rdd: Frame('lazy'))
+    monkeypatch.setattr(cli, 'checkpoint', lambda ctx, df: calls.append(('checkpoint', df.name)) or Frame('done'))
+    monkeypatch.setattr(cli.sink, 'delete', lambda ctx, table, keys: calls.append(('delete', table)))
+    monkeypatch.setattr(cli.pyccd, 'write', lambda ctx, df: calls.append(('write', df.name)))
+    monkeypatch.setattr(cli.ledger, 'dataframe', lambda df, acquired, detector: df)
+    monkeypatch.setattr(cli.ledger, 'write', lambda ctx, df: calls.append(('ledger', df.name)))
+
+    assert cli.detection(ctx=None, xys=[(0, 0)], acquired='a/b', update=True) == 7
+    assert calls == [('checkpoint', 'lazy'), ('delete', 'data'), ('write', 'done'), ('ledger', 'done'), ('unpersist', 'done')]
+
+
+def test_classification(monkeypatch):
+    calls = []
+
+    class Context(object):
+        def stop(self):
+            calls.append('stop')
+
+    class Frame(object):
+        def persist(self):
+            return self
+        def unpersist(self):
+            calls.append('unpersist')
+
+    monkeypatch.setattr(cli.ccdc, 'context', lambda name: Context())
+    monkeypatch.setattr(cli, 'logger', lambda ctx, name: Log())
+    monkeypatch.setattr(cli.grid, 'training', lambda x, y, cfg: [(0, 0)])
+    monkeypatch.setattr(cli.grid, 'classification', lambda x, y, cfg: [(0, 0)])
+    monkeypatch.setattr(cli.pyccd, 'select', lambda ctx, xys: calls.append('select') or Frame())
+    monkeypatch.setattr(cli, 'tileclassification', lambda **kwargs: calls.append(('classify', kwargs['ccd'] is None)))
+
+    # a stored model is used without reading the training area
+    monkeypatch.setattr(cli, 'stored', lambda **kwargs: ('model', 'path'))
+    cli.classification.callback(0, 0, 1, 2, 'a/b')
+    assert calls == [('classify', True), 'stop']
+
+    # the training area is read once and released when training fails
+    del calls[:]
+    monkeypatch.setattr(cli, 'stored', lambda **kwargs: (None, None))
+    monkeypatch.setattr(cli, 'training', lambda **kwargs: (None, None))
+    cli.classification.callback(0, 0, 1, 2, 'a/b')
+    assert calls == ['select', 'unpersist', 'stop']
+
+
+def test_points(merlin_ard_config, tmpdir):
+    f = tmpdir.join('tiles.csv')
+    f.write('h,v,ulx,uly,lrx,lry\n0,1,-2565585,3164805,-2415585,3014805\n32,21,2234415,164805,2384415,14805\n\0\0\0\n')
+
+    xys = cli.points(hvs=['0,1'], xys=['100, 200'], path=str(f), cfg=merlin_ard_config)
+    assert xys == [(-2565585.0, 3164805.0), (2234415.0, 164805.0), (100.0, 200.0)]
@@ -0,0 +1,30 @@
+from ccdc import encoding
+
+import numpy
+
+
+def test_varints():
+    values = [0, 1, 127, 128, 300, 2 ** 40]
+    blob   = encoding.varints(values)
+    assert encoding.unvarints(blob) == (values, len(blob))
+    assert encoding.unvarints(blob, 2) == ([0, 1], 2)
+
+
+def test_dates():
+    dates = [730020, 730004, 729990, 729990, 724404]
+    assert encoding.unpackdates(encoding.packdates(dates)) == dates
+    assert encoding.unpackdates(encoding.packdates([])) == []
+    assert encoding.packdates(None) is None
+
+
+def test_dates_size():
+    dates = list(range(724000, 724000 + 16 * 2000, 16))
+    assert len(encoding.packdates(dates)) < len(dates) + 4
+
+
+def test_mask():
+    mask = [1, 0, 1, 1, 0, 0, 0, 1, 1]
+    assert encoding.unpackmask(encoding.packmask(mask)) == mask
+    assert encoding.unpackmask(encoding.packmask(numpy.array(mask, dtype=numpy.int8))) == mask
+    assert encoding.unpackmask(encoding.packmask([])) == []
+    assert len(encoding.packmask([1] * 2000)) == 2 + 250
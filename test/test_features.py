@@ -8,7 +8,17 @@ from .shared import merge
 from .shared import merged_schema
 from .shared import mock_timeseries_rdd
 
+import numpy
 import pyspark.sql.types
+import pytest
+
+@pytest.fixture(params=['false', 'true'])
+def copartitioning(request, sql_context):
+    conf = sql_context.sparkSession.conf
+    prev = conf.get('spark.sql.adaptive.enabled', 'false')
+    conf.set('spark.sql.adaptive.enabled', request.param)
+    yield sql_context
+    conf.set('spark.sql.adaptive.enabled', prev)
 
 def test_join(spark_context, ids_rdd, merlin_ard_config, merlin_aux_config):
     ard_df = timeseries.ard(spark_context, ids_rdd, acquired, cfg=merlin_ard_config)
@@ -36,3 +46,51 @@ def test_dataframe(spark_context, sql_context, ids_rdd, merlin_aux_config):
     fauxDF = faux_dataframe(sql_context, features_dframe)
     framed = features.dataframe(aux_df, fauxDF)
     assert set(['chipx', 'chipy', 'pixelx', 'pixely', 'sday', 'eday', 'label', 'features']) == set(framed.columns)
+
+def test_independent_matches_densify(sql_context):
+    from ccdc import udfs
+    from pyspark.sql.types import ArrayType, FloatType, StructField, StructType
+
+    schema = StructType([StructField(c, ArrayType(FloatType()) if c.endswith('coef') or c in ('dem', 'aspect', 'slope', 'mpw', 'posidex')
+                                        else FloatType())
+                         for c in features.columns()])
+    row    = [[float(i), 99.0] if isinstance(f.dataType, ArrayType) else float(i) for i, f in enumerate(schema.fields)]
+    row[1] = None
+    df     = sql_context.createDataFrame([row], schema)
+
+    jvm    = features.independent(df).first()['features'].toArray()
+    python = df.withColumn('features', udfs.densify(*features.columns())).first()['features'].toArray()
+
+    assert len(jvm) == len(features.columns())
+    assert list(jvm[2:]) == list(python[2:]) == [float(i) for i in range(2, len(features.columns()))]
+    assert jvm[0] == python[0] == 0.0
+    assert numpy.isnan(jvm[1])
+
+def test_locate(copartitioning):
+    sql_context = copartitioning
+    static = sql_context.createDataFrame([(0, 60, 0, 60, 30, 30, 2, [1.0, 2.0, 3.0, 4.0], [5, 6, 7, 8], None, None, None, None)],
+                                         timeseries.schema('static'))
+    ccd    = sql_context.createDataFrame([(0, 60, 30, 30, 1), (0, 60, 0, 60, 2)],
+                                         'chipx int, chipy int, pixelx int, pixely int, sday int')
+    rows   = sorted(features.locate(static, ccd).collect(), key=lambda r: r.sday)
+
+    assert [(r.dem, r.trends, r.mpw) for r in rows] == [(4.0, 8, None), (1.0, 5, None)]
+    assert features.dependent(features.locate(static, ccd)).select('label').count() == 2
+
+def test_partitioned(copartitioning):
+    df = copartitioning.createDataFrame([(0, 60, 1), (30, 60, 2)], ['chipx', 'chipy', 'sday'])
+    p  = features.partitioned(df, 4)
+
+    assert features.partitioning(p) == (['chipx', 'chipy'], 4)
+    assert features.partitioned(p, 4) is p
+
+def test_copartitioned(copartitioning):
+    left  = features.partitioned(copartitioning.createDataFrame([(0, 60, 1)], ['chipx', 'chipy', 'sday']), 4)
+    right = features.partitioned(copartitioning.createDataFrame([(0, 60, 2)], ['chipx', 'chipy', 'dem']), 4)
+    other = copartitioning.createDataFrame([(0, 60, 2)], ['chipx', 'chipy', 'dem'])
+
+    joined = left.join(right, on=['chipx', 'chipy'])
+    assert features.copartitioned(joined, left, right) is joined
+
+    with pytest.raises(ValueError):
+        features.copartitioned(left.join(other.repartition(3, 'chipx', 'chipy'), on=['chipx', 'chipy']), left, other)
@@ -0,0 +1,66 @@
+from ccdc import fetch
+from functools import partial
+
+import ccdc
+import merlin
+import threading
+import time
+
+
+def test_pmap():
+    assert sorted(fetch.pmap(lambda x: x * 2, range(10), concurrency=3)) == [x * 2 for x in range(10)]
+
+def test_pmap_bounded():
+    lock     = threading.Lock()
+    inflight = [0, 0]
+
+    def fn(x):
+        with lock:
+            inflight[0] += 1
+            inflight[1] = max(inflight)
+        time.sleep(0.01)
+        with lock:
+            inflight[0] -= 1
+        return x
+
+    assert len(list(fetch.pmap(fn, range(20), concurrency=4))) == 20
+    assert inflight[1] <= 4
+
+def test_pmap_empty():
+    assert list(fetch.pmap(lambda x: x, [])) == []
+
+def test_chips(monkeypatch):
+    class Response(object):
+        def __init__(self, ubid):
+            self.ubid = ubid
+        def raise_for_status(self):
+            pass
+        def json(self):
+            return [{'ubid': self.ubid}]
+
+    class Session(object):
+        def get(self, url, params):
+            return Response(params['ubid'])
+
+    monkeypatch.setattr(fetch, 'session', lambda **kwargs: Session())
+    chips = fetch.chips(x=1, y=2, acquired='a/b', ubids=['u1', 'u2', 'u3'], url='http://localhost')
+    assert chips == ({'ubid': 'u1'}, {'ubid': 'u2'}, {'ubid': 'u3'})
+
+def test_memoized():
+    calls = []
+    fn    = partial(fetch.memoized, fn=lambda: calls.append(1) or 'grid', key='test_memoized')
+    assert fn() == 'grid'
+    assert fn() == 'grid'
+    assert len(calls) == 1
+
+def test_configure():
+    cfg = fetch.configure(ccdc.ARD)
+    assert cfg['chips_fn'].func is fetch.chips
+    assert cfg['chips_fn'].keywords['url'] == ccdc.ARD['chips_fn'].keywords['url']
+    assert cfg['registry_fn'].func is fetch.memoized
+    assert cfg['grid_fn'].func is fetch.memoized
+
+def test_configure_injected(merlin_ard_config):
+    cfg = fetch.configure(merlin_ard_config)
+    assert cfg['chips_fn'] is merlin_ard_config['chips_fn']
+    assert cfg['registry_fn'] is merlin_ard_config['registry_fn']
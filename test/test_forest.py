@@ -0,0 +1,117 @@
+from ccdc import forest
+from pyspark.ml import Pipeline
+from pyspark.ml.classification import RandomForestClassifier
+from pyspark.ml.feature import VectorIndexer
+from pyspark.ml.linalg import Vectors
+from pyspark.sql import SparkSession
+
+import numpy
+import pytest
+import time
+
+
+def features(n, seed=0):
+    r = numpy.random.RandomState(seed)
+    x = numpy.column_stack([r.normal(size=n),
+                            r.uniform(size=n) * 10,
+                            r.randint(0, 4, size=n) * 2.5])
+    y = (x[:, 0] > 0).astype(float) + (x[:, 2] > 4).astype(float)
+    return x, y
+
+
+def frame(spark_context, x, y):
+    return SparkSession(spark_context).createDataFrame([(float(l), Vectors.dense(f)) for f, l in zip(x, y)],
+                                                       ['label', 'features'])
+
+
+def model(spark_context, x, y, trees=10, invalid='error'):
+    df = frame(spark_context, x, y)
+    vi = VectorIndexer(inputCol='features', outputCol='feature_index', maxCategories=8, handleInvalid=invalid)
+    rf = RandomForestClassifier(labelCol='label', featuresCol='feature_index', numTrees=trees, seed=1)
+    return df, Pipeline(stages=[vi, rf]).fit(df)
+
+
+def test_table():
+    nodes = [(0, 0, [3.0, 1.0], 1, 2, 0, [0.5], -1),
+             (0, 1, [2.0, 0.0], -1, -1, -1, [], -1),
+             (0, 2, [1.0, 1.0], -1, -1, -1, [], -1),
+             (1, 0, [0.0, 4.0], -1, -1, -1, [], -1)]
+    f = forest.table(nodes)
+
+    assert list(f['roots']) == [0, 3]
+    assert list(f['left'][:3]) == [1, 1, 2]
+    assert numpy.allclose(forest.raw(f, [[0.0], [1.0]]), [[1.0, 1.0], [0.5, 1.5]])
+
+
+def test_categorize():
+    nodes = [(0, 0, [2.0, 2.0], 1, 2, 0, [1.0], 3),
+             (0, 1, [0.0, 1.0], -1, -1, -1, [], -1),
+             (0, 2, [1.0, 0.0], -1, -1, -1, [], -1)]
+    cats  = {0: {0.0: 0, 2.5: 1, 5.0: 2}}
+
+    f = forest.table(nodes, cats)
+    assert numpy.allclose(forest.raw(f, [[0.0], [2.5], [5.0]]), [[1.0, 0.0], [0.0, 1.0], [1.0, 0.0]])
+
+    for value in (2.4, numpy.nan):
+        with pytest.raises(ValueError):
+            forest.raw(f, [[value]])
+
+    f = forest.table(nodes, cats, invalid='keep')
+    assert list(forest.categorize(f, [[2.4], [numpy.nan], [2.5]])[:, 0]) == [3, 3, 1]
+    assert numpy.allclose(forest.raw(f, [[2.4]]), [[1.0, 0.0]])
+
+    # more than half the categories on the left, unseen values go left
+    nodes[0] = (0, 0, [2.0, 2.0], 1, 2, 0, [0.0, 1.0], 3)
+    f = forest.table(nodes, cats, invalid='keep')
+    assert numpy.allclose(forest.raw(f, [[0.0], [5.0], [2.4]]), [[0.0, 1.0], [1.0, 0.0], [0.0, 1.0]])
+
+
+def test_raw_unseen(spark_context, tmpdir):
+    x, y     = features(500)
+    _, pm    = model(spark_context, x, y, invalid='keep')
+    unseen   = x.copy()
+    unseen[:, 2] = 1.0
+    rows     = pm.transform(frame(spark_context, unseen, y)).collect()
+    expected = numpy.array([r.rawPrediction.toArray() for r in rows])
+    f        = forest.export(spark_context, pm, str(tmpdir.join('rf')))
+
+    assert f['invalid'] == 'keep'
+    assert numpy.allclose(forest.raw(f, unseen), expected)
+
+
+def test_raw(spark_context, tmpdir):
+    x, y     = features(500)
+    df, pm   = model(spark_context, x, y)
+    rows     = pm.transform(df).collect()
+    expected = numpy.array([r.rawPrediction.toArray() for r in rows])
+    f        = forest.export(spark_context, pm, str(tmpdir.join('rf')))
+    actual   = forest.raw(f, numpy.array([r.features.toArray() for r in rows]))
+
+    assert list(f['categories']) == [2]
+    assert f['split'].any()
+    assert actual.shape == expected.shape
+    assert numpy.allclose(actual, expected)
+
+
+def test_throughput(spark_context, tmpdir, record_property):
+    x, y   = features(500)
+    _, pm  = model(spark_context, x, y, trees=50)
+    f      = forest.export(spark_context, pm, str(tmpdir.join('rf')))
+    rows   = numpy.tile(x, (20, 1))
+    df     = frame(spark_context, rows, numpy.tile(y, 20)).cache()
+    df.count()
+
+    start  = time.time()
+    pm.transform(df).select('rawPrediction').collect()
+    spark  = len(rows) / max(time.time() - start, 1e-9)
+
+    start  = time.time()
+    result = forest.raw(f, rows)
+    local  = len(rows) / max(time.time() - start, 1e-9)
+
+    record_property('spark rows/s', round(spark))
+    record_property('numpy rows/s', round(local))
+
+    assert result.shape == (len(rows), 3)
+    assert numpy.allclose(result.sum(axis=1), 50)
+    assert local > spark
@@ -1,4 +1,10 @@
 from ccdc import grid
+from functools import partial
+from .shared import grid_resp
+from .shared import near_resp
+from .shared import snap_resp
+
+import numpy
 
 def test_definition(merlin_ard_config):
     # all thats being tested is that merlin.chipmunk is the grid_fn
@@ -6,19 +12,82 @@ def test_definition(merlin_ard_config):
     defn = grid.definition(merlin_ard_config)[0]
     assert set(defn.keys()) == {'proj', 'tx', 'sy', 'ty', 'ry', 'rx', 'sx', 'name'}
 
+def test_snap():
+    tgrid, cgrid = grid_resp
+    assert grid.snap(-543485, 2378605, tgrid) == {'proj-pt': tuple(snap_resp['tile']['proj-pt']),
+                                                  'grid-pt': tuple(snap_resp['tile']['grid-pt'])}
+    assert grid.snap(-543485, 2378605, cgrid) == {'proj-pt': tuple(snap_resp['chip']['proj-pt']),
+                                                  'grid-pt': tuple(snap_resp['chip']['grid-pt'])}
+
 def test_tile(merlin_ard_config):
-    grid_tile = grid.tile(100, 200, merlin_ard_config)
+    grid_tile = grid.tile(-543485, 2378605, merlin_ard_config)
     assert set(grid_tile.keys()) == set(['x', 'y', 'h', 'v', 'ulx', 'uly', 'lrx', 'lry', 'chips'])
-    assert grid_tile['chips'] == ((-543585.0, 2378805.0),)
+    assert (grid_tile['x'], grid_tile['y'], grid_tile['h'], grid_tile['v']) == (-615585.0, 2414805.0, 13.0, 6.0)
+    assert grid_tile['chips'].shape == (2500, 2)
+    assert grid_tile['chips'].dtype == numpy.int64
+    assert tuple(grid_tile['chips'][0]) == (-615585, 2414805)
+    assert tuple(grid_tile['chips'][-1]) == (-468585, 2267805)
+    assert (-543585, 2378805) in grid.chips(grid_tile)
+
+def test_tile_strings(merlin_ard_config):
+    assert grid.tile('-543485', '2378605', merlin_ard_config)['x'] == -615585.0
+    assert grid.near('-543485', '2378605', merlin_ard_config) == grid.near(-543485, 2378605, merlin_ard_config)
+
+def test_point(merlin_ard_config):
+    assert grid.point(0, 1, merlin_ard_config) == (-2565585.0, 3164805.0)
+    assert grid.point(32, 21, merlin_ard_config) == (2234415.0, 164805.0)
 
 def test_chips():
     chips = grid.chips({"x": -100, "y": 100, "chips": [(1, 1), (2, 2)]})
     assert set(chips) == set([(1, 1), (2, 2)])
 
+def test_near(merlin_aux_config):
+    tiles = grid.near(-543485, 2378605, merlin_aux_config)
+    assert len(tiles) == 9
+    assert tiles == [tuple(t['proj-pt']) for t in near_resp['tile']]
+
 def test_training(merlin_aux_config):
-    training_data = grid.training(100, 200, merlin_aux_config)
-    assert len(training_data) == 9
+    training_data = grid.training(-543485, 2378605, merlin_aux_config)
+    assert training_data.shape == (9 * 2500, 2)
+    assert tuple(training_data.min(axis=0)) == (-765585, 2117805)
+    assert tuple(training_data.max(axis=0)) == (-318585, 2564805)
 
 def test_classification(merlin_aux_config):
-    classification_chips = grid.classification(-100, 200, merlin_aux_config)
-    assert classification_chips == [(-543585, 2378805)]
+    classification_chips = grid.classification(-543485, 2378605, merlin_aux_config)
+    assert classification_chips.shape == (2500, 2)
+    assert len(grid.intersection(classification_chips, [(-543585, 2378805)])) == 1
+
+def test_region(merlin_aux_config):
+    chips = grid.region(-543485, 2378605, -537585, 2372805, merlin_aux_config)
+    assert chips.tolist() == [[-543585, 2378805], [-543585, 2375805], [-543585, 2372805],
+                              [-540585, 2378805], [-540585, 2375805], [-540585, 2372805],
+                              [-537585, 2378805], [-537585, 2375805], [-537585, 2372805]]
+
+def test_set_algebra():
+    a = numpy.array([[-3000, 3000], [0, 3000], [0, 0]])
+    b = numpy.array([[0, 0], [3000, -3000]])
+
+    assert grid.union(a, b).tolist() == [[-3000, 3000], [0, 0], [0, 3000], [3000, -3000]]
+    assert grid.intersection(a, b).tolist() == [[0, 0]]
+    assert grid.difference(a, b).tolist() == [[-3000, 3000], [0, 3000]]
+    assert grid.union().shape == (0, 2)
+    assert grid.unkey(grid.key(b)).tolist() == b.tolist()
+
+def test_bounded():
+    xys = numpy.array([[-3000, 3000], [0, 3000], [0, 0], [3000, -3000]])
+    assert grid.bounded(xys, -1, 3001, 3001, -1).tolist() == [[0, 3000], [0, 0]]
+
+def test_inside():
+    xys      = numpy.array([[0, 0], [3000, 3000], [6000, 0], [3000, -6000]])
+    triangle = [(-1, -1), (6001, -1), (3000, 4500)]
+    assert grid.inside(xys, triangle).tolist() == [[0, 0], [3000, 3000], [6000, 0]]
+
+def test_index(tmpdir):
+    index = str(tmpdir.join('grid.json'))
+    calls = []
+    cfg   = {'grid_fn': partial(lambda: calls.append(1) or grid_resp)}
+
+    assert grid.definition(cfg, index=index) == grid_resp
+    assert grid.definition(cfg, index=index) == grid_resp
+    assert grid.definition({'grid_fn': partial(lambda: 1 / 0)}, index=index) == grid_resp
+    assert calls == [1]
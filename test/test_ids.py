@@ -1,6 +1,7 @@
 from ccdc import ids
 
 import json
+import numpy
 import pyspark.rdd
 import pyspark.sql.types
 import pytest
@@ -15,6 +16,11 @@ def test_rdd(spark_context):
     rdd = ids.rdd(spark_context, ((-100, 100), (-200, 200)))
     assert type(rdd) == pyspark.rdd.RDD
 
+def test_rdd_array(spark_context):
+    rdd = ids.rdd(spark_context, numpy.array([[-100, 100], [-200, 200]]))
+    assert rdd.collect() == [(-100, 100), (-200, 200)]
+    assert ids.dataframe(spark_context, rdd, ids.chip_schema()).count() == 2
+
 def test_dataframe(spark_context):
     rdd = ids.rdd(spark_context, ((-100, 100), (-200, 200)))
     df = ids.dataframe(spark_context, rdd)
@@ -0,0 +1,19 @@
+from ccdc import ledger
+from pyspark.sql import SparkSession
+
+
+def test_table():
+    assert ledger.table() == 'ledger'
+
+
+def test_dataframe(spark_context):
+    ccd = SparkSession(spark_context).createDataFrame([(1, 2, 0), (1, 2, 1), (3, 4, 0)], ['chipx', 'chipy', 'pixelx'])
+    df  = ledger.dataframe(ccd, acquired='1980/2018', detector='pyccd:1.0')
+
+    assert df.columns == ledger.schema().names
+    assert sorted((r.chipx, r.chipy, r.detector, r.acq, r.segcnt) for r in df.collect()) == \
+           [(1, 2, 'pyccd:1.0', '1980/2018', 2), (3, 4, 'pyccd:1.0', '1980/2018', 1)]
+
+
+def test_completed_empty():
+    assert ledger.completed(ctx=None, xys=[], acquired='1980/2018', detector='pyccd:1.0') == {}
@@ -16,7 +16,8 @@ def test_detector():
 
 
 def test_classifier():
-    pass
+    md = metadata.classify(tilex=1, tiley=2, msday='3', meday='4', classifier='model', auxurl='url')
+    assert (md['msday'], md['meday'], md['classifier']) == (3, 4, 'model')
 
 
 def test_dataframe():
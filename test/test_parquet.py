@@ -0,0 +1,112 @@
+from ccdc import ledger
+from ccdc import parquet
+from ccdc import sink
+from pyspark.sql import SparkSession
+
+import ccdc
+import os
+import pytest
+
+
+@pytest.fixture()
+def store(monkeypatch, tmpdir):
+    monkeypatch.setattr(ccdc, 'SINK', 'parquet')
+    monkeypatch.setattr(ccdc, 'SINK_DIR', str(tmpdir))
+    return str(tmpdir)
+
+
+def rows(df):
+    return sorted(tuple(r[c] for c in sorted(df.columns)) for r in df.collect())
+
+
+def test_backend(monkeypatch):
+    assert sink.backend('parquet') is parquet
+
+    monkeypatch.setattr(ccdc, 'SINK', 'nosuch')
+    with pytest.raises(ValueError):
+        sink.backend()
+
+
+def test_path(store):
+    assert parquet.path('data') == '{}/{}/data'.format(store, ccdc.keyspace())
+
+
+def test_merge(spark_context):
+    ss     = SparkSession(spark_context)
+    stored = ss.createDataFrame([(1, 1, 'a', 1.0), (1, 2, 'b', 2.0)], ['chipx', 'pixelx', 'name', 'value'])
+    df     = ss.createDataFrame([(1, 2, 5.0), (1, 3, 6.0)], ['chipx', 'pixelx', 'value'])
+    merged = parquet.merge(stored, df, ['chipx', 'pixelx'])
+
+    assert merged.columns == stored.columns
+    assert sorted(tuple(r) for r in merged.collect()) == [(1, 1, 'a', 1.0), (1, 2, 'b', 5.0), (1, 3, None, 6.0)]
+
+
+def test_write_select_delete(spark_context, store):
+    ss    = SparkSession(spark_context)
+    entry = [(1, 2, 'pyccd', '1980/2017', 3, 'x'), (3, 4, 'pyccd', '1980/2017', 5, 'y')]
+    ids   = ss.createDataFrame([(1, 2), (3, 4)], ['chipx', 'chipy'])
+
+    assert ledger.read(spark_context, ids).count() == 0
+
+    ledger.write(spark_context, ss.createDataFrame(entry, ledger.schema()))
+    assert rows(ledger.read(spark_context, ids)) == rows(ss.createDataFrame(entry, ledger.schema()))
+
+    update = ss.createDataFrame([(1, 2, 'pyccd', '1980/2017', 7, 'z')], ledger.schema())
+    ledger.write(spark_context, update)
+    assert sorted(r.segcnt for r in ledger.read(spark_context, ids).collect()) == [5, 7]
+    assert sorted(os.listdir(os.path.dirname(parquet.path('ledger')))) == ['ledger']
+    assert '_temporary' not in os.listdir(parquet.path('ledger'))
+
+    assert sink.delete(spark_context, ledger.table(), [{'chipx': 1, 'chipy': 2}]) == 1
+    assert [(r.chipx, r.chipy) for r in ledger.read(spark_context, ids).collect()] == [(3, 4)]
+
+
+def test_write_columns(spark_context, store):
+    ss    = SparkSession(spark_context)
+    ids   = ss.createDataFrame([(1, 2), (3, 4)], ['chipx', 'chipy'])
+
+    ledger.write(spark_context, ss.createDataFrame([(1, 2, 'pyccd', '1980/2017', 3, 'x')], ledger.schema()))
+    parquet.write(spark_context, ss.createDataFrame([(3, 4, 'pyccd', '1980/2017')], ['chipx', 'chipy', 'detector', 'acq']), 'ledger')
+
+    assert sorted(parquet.stored(spark_context, 'ledger').names) == sorted(ledger.schema().names)
+    assert sorted((r.chipx, r.segcnt) for r in ledger.read(spark_context, ids).collect()) == [(1, 3), (3, None)]
+
+
+def test_partitions(spark_context, store):
+    ss = SparkSession(spark_context)
+
+    assert parquet.partitions(spark_context, 'ledger') == set()
+
+    ledger.write(spark_context, ss.createDataFrame([(1, 2, 'pyccd', '1980/2017', 3, 'x'),
+                                                    (-3, 4, 'pyccd', '1980/2017', 5, 'y')], ledger.schema()))
+
+    assert parquet.partitions(spark_context, 'ledger') == {parquet.directory('ledger', {'chipx': 1, 'chipy': 2}),
+                                                           parquet.directory('ledger', {'chipx': -3, 'chipy': 4})}
+
+
+def test_publish_failure(monkeypatch, spark_context, store):
+    ss    = SparkSession(spark_context)
+    ids   = ss.createDataFrame([(1, 2)], ['chipx', 'chipy'])
+    entry = [(1, 2, 'pyccd', '1980/2017', 3, 'x')]
+
+    ledger.write(spark_context, ss.createDataFrame(entry, ledger.schema()))
+
+    class Failing(object):
+        def __init__(self, fs):
+            self.fs = fs
+
+        def __getattr__(self, name):
+            return getattr(self.fs, name)
+
+        def rename(self, src, dst):
+            failing = '.staging-' in src.toString() and '.replaced' not in src.toString()
+            return not failing and self.fs.rename(src, dst)
+
+    filesystem = parquet.filesystem
+    monkeypatch.setattr(parquet, 'filesystem', lambda sc, p: (Failing(filesystem(sc, p)[0]), filesystem(sc, p)[1]))
+
+    with pytest.raises(IOError):
+        ledger.write(spark_context, ss.createDataFrame([(1, 2, 'pyccd', '1980/2017', 7, 'z')], ledger.schema()))
+
+    monkeypatch.setattr(parquet, 'filesystem', filesystem)
+    assert rows(ledger.read(spark_context, ids)) == rows(ss.createDataFrame(entry, ledger.schema()))
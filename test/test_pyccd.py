@@ -3,12 +3,17 @@ from ccdc import ids
 from ccdc import pyccd
 from .shared import ccd_schema_names
 from .shared import ccd_format_keys
+from .shared import chip_element
 from .shared import faux_dataframe
 from .shared import mock_cassandra_read
 from .shared import timeseries_element
+from pyspark.sql.types import BinaryType
 from pyspark.sql.types import StructType
 from pyspark.rdd import PipelinedRDD
+from cytoolz import merge
 
+import ccdc
+import numpy
 import pyspark.sql as spark_sql
 
 
@@ -20,12 +25,24 @@ def test_table():
 
 def test_schema():
     assert type(pyccd.schema()) is StructType
-    assert set(pyccd.schema().names) == set(ccd_schema_names)
+    assert set(pyccd.schema('compact').names) == set(ccd_schema_names)
+    assert set(pyccd.schema('list').names) == set(ccd_schema_names) - {'dtbits', 'prbits'}
+
+def test_columnar_schema(monkeypatch, spark_context):
+    schemas = []
+    monkeypatch.setattr(pyccd.arrow, 'dataframe', lambda ctx, cids, fn, schema: schemas.append(schema))
+
+    for e in ('list', 'compact'):
+        monkeypatch.setattr(ccdc, 'ENCODING', e)
+        pyccd.columnar(spark_context, None, '1980-01-01/2017-01-01')
+
+    assert len(schemas) == 2
+    assert not [f.name for s in schemas for f in s.fields if isinstance(f.dataType, BinaryType)]
 
 def test_dataframe(spark_context, timeseries_rdd):
     rdd    = pyccd.rdd(ctx=spark_context, timeseries=timeseries_rdd)
     dframe = pyccd.dataframe(spark_context, rdd)
-    assert set(dframe.columns) == set(ccd_schema_names)
+    assert set(dframe.columns) == set(pyccd.schema().names)
 
 def test_default():
     assert pyccd.default([]) == [{'start_day': 0, 'end_day': 0}]
@@ -41,6 +58,48 @@ def test_detect():
     assert result['chipx'] == -1815585
     assert set(result.keys()) == set(ccd_format_keys)
 
+def test_chip():
+    results = pyccd.chip(chip_element)
+    assert set([(r['pixelx'], r['pixely']) for r in results]) == {(-1814475, 1062105), (-1814445, 1062105)}
+    assert all([r['chipx'] == -1815585 for r in results])
+    assert set(results[0].keys()) == set(ccd_format_keys)
+    assert results[0]['dates'] == chip_element[1]['dates']
+
+def stored(pixelx, pixely, sday, eday, **kwargs):
+    band = lambda p: {p + 'coef': [0.0] * 7, p + 'int': 100.0}
+    return merge(band('gr'), band('re'), band('ni'), band('s1'), band('s2'),
+                 {'chipx': 0, 'chipy': 0, 'pixelx': pixelx, 'pixely': pixely, 'sday': sday, 'eday': eday,
+                  'bday': eday, 'chprob': 0.0, 'curqa': 8, 'grrmse': 10.0, 'rermse': 10.0, 'nirmse': 10.0,
+                  's1rmse': 10.0, 's2rmse': 10.0, 'dates': [730000, 729990], 'prmask': [1, 1]},
+                 kwargs)
+
+def test_since():
+    rows = [stored(0, 0, 720000, 725000, curqa=4), stored(0, 0, 725001, 730000), stored(1, 0, 725001, 729999)]
+    assert pyccd.since(rows, '1980-01-01/2018-01-01') == '1999-09-03/2018-01-01'
+    assert pyccd.since(rows + [stored(2, 0, 0, 0)], '1980-01-01/2018-01-01') is None
+    assert pyccd.since(rows + [stored(2, 0, 725001, 730000, chprob=0.5)], '1980-01-01/2018-01-01') is None
+    assert pyccd.since([], '1980-01-01/2018-01-01') is None
+
+def chip_update(value):
+    dates = list(range(730001, 730021))
+    band  = numpy.full((1, len(dates)), value, dtype=numpy.int16)
+    return ((0, 0), merge({'pixels': numpy.array([[0, 0]]), 'dates': dates,
+                           'qas': numpy.full((1, len(dates)), 2, dtype=numpy.uint16)},
+                          {b: band for b in ['blues', 'greens', 'reds', 'nirs', 'swir1s', 'swir2s', 'thermals']}))
+
+def test_update():
+    rows    = [stored(0, 0, 720000, 725000), stored(0, 0, 725001, 730000)]
+    results = pyccd.update(chip_update(105), rows)
+
+    assert [(r['sday'], r['eday'], r['bday']) for r in results] == [(720000, 725000, 725000), (725001, 730014, 730015)]
+    assert all(r['dates'] == list(range(730020, 729999, -1)) + [729990] for r in results)
+    assert all(r['prmask'] == [1] * 22 for r in results)
+
+def test_update_fallback():
+    rows = [stored(0, 0, 725001, 730000)]
+    assert pyccd.update(chip_update(1000), rows) is None
+    assert pyccd.update(chip_update(105), [stored(1, 1, 725001, 730000)]) is None
+
 def test_rdd(spark_context, timeseries_rdd):
     # calling collect, or any other method to realize the results fails
     # unless we monkeypatch the function which actually retrieves chip data.
@@ -76,3 +135,36 @@ def test_join(sql_context):
     joined_df = pyccd.join(ccd=ccd_df, predictions=pred_df)
     assert set(['chipx', 'chipy', 'pixelx', 'pixely', 'sday', 'eday', 'srb3']) == set(joined_df.schema.names)
 
+
+def test_columns():
+    cols = pyccd.columns([chip_element])
+    rows = pyccd.chip(chip_element)
+
+    assert set(cols.keys()) == set(pyccd.schema().names)
+    assert cols['pixelx'] == [r['pixelx'] for r in rows]
+    assert cols['sday'] == [r['sday'] for r in rows]
+    assert cols['dates'][0] == chip_element[1]['dates']
+    assert cols['rfrawp'] == [None] * len(rows)
+
+
+def test_restrict(sql_context):
+    ccd  = sql_context.createDataFrame([(1, 2, 10), (1, 2, 11), (3, 4, 12)], ['chipx', 'chipy', 'sday'])
+    cids = sql_context.createDataFrame([(1, 2)], ['chipx', 'chipy'])
+
+    assert sorted(r.sday for r in pyccd.restrict(ccd, cids).collect()) == [10, 11]
+    assert pyccd.restrict(ccd, cids).columns == ccd.columns
+
+
+def test_encode_decode(monkeypatch):
+    row = {'chipx': 1, 'prmask': [1, 0, 1]}
+
+    monkeypatch.setattr(ccdc, 'ENCODING', 'compact')
+    packed = pyccd.encode(row, pyccd.shared([730020, 730004]))
+    assert packed['dates'] is None and packed['prmask'] is None
+    assert pyccd.decode(packed)['dates'] == [730020, 730004]
+    assert pyccd.decode(packed)['prmask'] == [1, 0, 1]
+
+    monkeypatch.setattr(ccdc, 'ENCODING', 'list')
+    plain = pyccd.encode(row, pyccd.shared([730020, 730004]))
+    assert plain['dtbits'] is None and plain['prbits'] is None
+    assert pyccd.decode(plain) == plain
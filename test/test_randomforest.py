@@ -1,4 +1,15 @@
+from ccdc import cli
 from ccdc import randomforest
+from pyspark.ml import Pipeline
+from pyspark.ml.classification import RandomForestClassifier
+from pyspark.ml.feature import StringIndexer
+from pyspark.ml.linalg import Vectors
+from pyspark.sql import SparkSession
+from pyspark.sql.types import FloatType
+
+import ccdc
+import datetime
+import pytest
 
 def test_pipeline():
     assert True
@@ -6,8 +17,92 @@ def test_pipeline():
 def test_train():
     assert True
 
-def test_classify():
-    assert True
+def test_classify(spark_context):
+    rows  = [(1, 2, p, 0, 10, 20, float(p % 2), Vectors.dense([float(p % 2), 1.0])) for p in range(10)]
+    df    = SparkSession(spark_context).createDataFrame(rows, ['chipx', 'chipy', 'pixelx', 'pixely', 'sday', 'eday', 'label', 'features'])
+    model = Pipeline(stages=[RandomForestClassifier(labelCol='label', featuresCol='features', numTrees=3)]).fit(df)
+    preds = randomforest.classify(model, df)
 
-def test_dedensify():
-    assert True
+    assert preds.columns == ['chipx', 'chipy', 'pixelx', 'pixely', 'sday', 'eday', 'rfrawp']
+    assert preds.schema['rfrawp'].dataType.elementType == FloatType()
+    assert all(len(r.rfrawp) == 2 and isinstance(r.rfrawp[0], float) for r in preds.collect())
+
+def test_key():
+    tiles = [(1.0, 2.0), (3.0, 4.0)]
+    k     = randomforest.key(tiles, 1, 2, '1980/2017')
+    assert k == randomforest.key(list(reversed(tiles)), 1, 2, '1980/2017')
+    assert k != randomforest.key(tiles, 1, 3, '1980/2017')
+    assert k != randomforest.key(tiles[:1], 1, 2, '1980/2017')
+
+def test_span():
+    today = datetime.date(2018, 5, 2)
+    assert randomforest.span('0001-01-01/2018-05-02', today) == '0001-01-01/..'
+    assert randomforest.span('0001-01-01/2018-05-01', today) == '0001-01-01/..'
+    assert randomforest.span('1980-01-01/2017-12-31', today) == '1980-01-01/2017-12-31'
+    assert randomforest.span('1980/2017', today) == '1980/2017'
+
+def test_key_default_acquired(monkeypatch):
+    class Clock(datetime.datetime):
+        times = iter([(2018, 5, 1, 8), (2018, 5, 2, 9)])
+
+        @classmethod
+        def now(cls):
+            return datetime.datetime(*next(cls.times))
+
+    monkeypatch.setattr(cli.datetime, 'datetime', Clock)
+    first, second = cli.acquired(), cli.acquired()
+    monkeypatch.undo()
+
+    class Day(datetime.date):
+        days = iter([datetime.date(2018, 5, 1), datetime.date(2018, 5, 2)])
+
+        @classmethod
+        def today(cls):
+            return next(cls.days)
+
+    monkeypatch.setattr(randomforest.datetime, 'date', Day)
+    assert randomforest.key([(1.0, 2.0)], 1, 2, first) == randomforest.key([(1.0, 2.0)], 1, 2, second)
+
+def test_path(monkeypatch):
+    monkeypatch.setattr(ccdc, 'MODEL_DIR', '')
+    assert randomforest.path('abc') is None
+    assert randomforest.path('abc', directory='/models/') == '/models/abc'
+
+def test_read_write(spark_context, tmpdir):
+    df    = SparkSession(spark_context).createDataFrame([('a',), ('b',)], ['label'])
+    model = Pipeline(stages=[StringIndexer(inputCol='label', outputCol='label_index')]).fit(df)
+
+    assert randomforest.read(spark_context, 'abc', directory=str(tmpdir)) is None
+
+    desc = randomforest.manifest([(1.0, 2.0)], 1, 2, '1980/2017')
+    path = randomforest.write(spark_context, model, 'abc', desc, directory=str(tmpdir))
+    loaded = randomforest.read(spark_context, 'abc', directory=str(tmpdir))
+
+    assert [r.label_index for r in loaded.transform(df).collect()] == [r.label_index for r in model.transform(df).collect()]
+
+    _, manifest = randomforest.load(spark_context, path)
+    assert manifest == desc
+
+def test_compatible():
+    desc = randomforest.manifest([(1.0, 2.0)], 1, 2, '1980/2017')
+    assert randomforest.compatible(desc) == desc
+
+    with pytest.raises(ValueError):
+        randomforest.compatible(dict(desc, features='different'))
+
+def test_fractions():
+    assert randomforest.fractions({1: 10, 2: 100, None: 5}, 20) == {1: 1.0, 2: 0.2}
+    assert randomforest.fractions({1: 10, 2: 100}, 0) == {1: 1.0, 2: 1.0}
+
+def test_sample(spark_context):
+    rows = [(x, 0, p, 0, 1 if p < 900 else 2) for x in range(2) for p in range(1000)]
+    df   = SparkSession(spark_context).createDataFrame(rows, ['chipx', 'chipy', 'pixelx', 'pixely', 'label'])
+
+    sdf, hist = randomforest.sample(df, per_class=100, per_chip=0, seed=1)
+    counts    = randomforest.histogram(sdf)
+    assert hist == {1: 1800, 2: 200}
+    assert counts[2] <= 200 and 50 < counts[1] < 200
+
+    tdf, hist = randomforest.sample(df, per_class=0, per_chip=10, seed=1)
+    assert sum(hist.values()) == 20
+    assert tdf.count() == 20
@@ -0,0 +1,97 @@
+from ccdc import grid
+from ccdc import region
+
+import json
+import numpy
+import pytest
+
+# tile h:13 v:6 of the test grid spans x -615585 to -465585 and y 2414805 to 2264805
+ulx, uly = -615585, 2414805
+
+
+def test_bbox():
+    assert region.bbox('-1,2,3.5,-4') == (-1.0, 2.0, 3.5, -4.0)
+
+    with pytest.raises(ValueError):
+        region.bbox('1,2,3')
+
+
+def test_polygons(tmpdir):
+    square = [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]]
+    hole   = [[2, 2], [4, 2], [4, 4], [2, 2]]
+    f      = tmpdir.join('area.geojson')
+    f.write(json.dumps({'type': 'FeatureCollection',
+                        'features': [{'type': 'Feature', 'properties': {},
+                                      'geometry': {'type': 'Polygon', 'coordinates': [square, hole]}},
+                                     {'type': 'Feature', 'properties': {},
+                                      'geometry': {'type': 'MultiPolygon', 'coordinates': [[square], [square]]}}]}))
+
+    shapes = region.load(str(f))
+    assert [len(rings) for rings in shapes] == [2, 1, 1]
+    assert shapes[0][1].shape == (4, 2)
+
+    with pytest.raises(ValueError):
+        region.polygons({'type': 'Point', 'coordinates': [0, 0]})
+
+
+def test_within():
+    square = [(0, 0), (10, 0), (10, 10), (0, 10)]
+    hole   = [(2, 2), (4, 2), (4, 4), (2, 4)]
+    points = numpy.array([[1, 1], [3, 3], [11, 5]])
+    assert region.within(points, [square, hole]).tolist() == [True, False, False]
+
+
+def test_touches_edges():
+    # 10 unit cells, y decreasing downward as in the ARD grid
+    g     = {'rx': 1, 'ry': -1, 'sx': 10, 'sy': 10, 'tx': 0, 'ty': 0}
+    cells = numpy.array([[h * 10, -v * 10] for h in range(-2, 6) for v in range(-1, 5)])
+
+    def hv(mask):
+        return sorted((int(x) // 10, -int(y) // 10) for x, y in cells[mask])
+
+    # a sliver along one row, no corner, center or vertex in the middle cells
+    sliver        = [numpy.array([[-0.5, -3.0], [45.0, -3.0], [45.0, -3.2], [-0.5, -3.2]])]
+    touched, full = region.touches(cells, g, sliver)
+    assert hv(touched) == [(h, 0) for h in range(-1, 5)]
+    assert not full.any()
+
+    # a diagonal sliver whose long edges cross cell sides just below the corners
+    diagonal      = [numpy.array([[0.5, -0.7], [39.5, -39.7], [39.6, -39.7], [0.6, -0.7]])]
+    touched, full = region.touches(cells, g, diagonal)
+    assert hv(touched) == [(0, 0), (0, 1), (1, 1), (1, 2), (2, 2), (2, 3), (3, 3)]
+    assert not full.any()
+
+    # cells entirely inside are full, cells the boundary crosses are not
+    square        = [numpy.array([[5.0, -5.0], [35.0, -5.0], [35.0, -35.0], [5.0, -35.0]])]
+    touched, full = region.touches(cells, g, square)
+    assert hv(touched) == [(h, v) for h in range(4) for v in range(4)]
+    assert hv(full) == [(1, 1), (1, 2), (2, 1), (2, 2)]
+
+
+def test_polygon(merlin_ard_config):
+    # a triangle over the upper left corner of one tile
+    rings = [numpy.array([[ulx + 1, uly - 1], [ulx + 8999, uly - 1], [ulx + 1, uly - 8999], [ulx + 1, uly - 1]])]
+    chips = region.polygon(rings, merlin_ard_config)
+
+    assert chips.tolist() == [[ulx, uly - 6000], [ulx, uly - 3000], [ulx, uly],
+                              [ulx + 3000, uly - 3000], [ulx + 3000, uly], [ulx + 6000, uly]]
+
+
+def test_polygon_tiles(merlin_ard_config):
+    # covers one tile and a ring of chips around it
+    rings = [numpy.array([[ulx - 10, uly + 10], [ulx + 151000, uly + 10],
+                          [ulx + 151000, uly - 150010], [ulx - 10, uly - 150010]])]
+    chips = region.polygon(rings, merlin_ard_config)
+    tile  = grid.tile(ulx, uly, merlin_ard_config)['chips']
+
+    assert len(grid.intersection(chips, tile)) == 2500
+    assert len(grid.difference(chips, tile)) == 52 * 52 - 2500
+
+
+def test_chips(merlin_ard_config):
+    box   = (ulx, uly, ulx + 2999, uly - 2999)
+    chips = region.chips(merlin_ard_config, box=box, hvs=[('13', '6')])
+
+    assert chips.shape == (2500, 2)
+    assert region.chips(merlin_ard_config, box=box).tolist() == [[ulx, uly]]
+    assert region.chips(merlin_ard_config).shape == (0, 2)
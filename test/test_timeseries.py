@@ -6,10 +6,15 @@ from cytoolz  import second
 from .shared import acquired
 from .shared import ard_schema
 from .shared import aux_schema
+from .shared import chip_element
+from .shared import timeseries_element
 from .shared import mock_merlin_create
 from .shared import mock_timeseries_rdd
+from base64 import b64encode
+from functools import partial
 
 import merlin
+import numpy
 import pyspark.sql.types
 
 def test_schema_invalid():
@@ -25,6 +30,53 @@ def test_converter():
     converter = timeseries.converter()
     assert converter([[5, 4, 3, 2], {"foo": 66}]) == {"chipx": 5, "chipy": 4, "pixelx": 3, "pixely": 2, "foo": 66}
 
+def test_pack():
+    key, data = timeseries_element
+    other     = ((key[0], key[1], key[2] + 30, key[3]), data)
+    chip      = timeseries.pack([timeseries_element, other])
+    assert first(chip) == (-1815585, 1064805)
+    assert second(chip)['pixels'].tolist() == [[-1814475, 1062105], [-1814445, 1062105]]
+    assert second(chip)['blues'].shape == (2, 4)
+    assert second(chip)['dates'] == data['dates']
+
+def test_pack_empty():
+    assert timeseries.pack([]) is None
+
+def test_unpack():
+    key, data = timeseries_element
+    other     = ((key[0], key[1], key[2] + 30, key[3]), data)
+    pixels    = list(timeseries.unpack(timeseries.pack([timeseries_element, other])))
+    assert [first(p) for p in pixels] == [key, first(other)]
+    assert second(first(pixels))['dates'] == data['dates']
+    assert second(first(pixels))['qas'].tolist() == data['qas'].tolist()
+
+def test_packed():
+    def chip(ubid, acquired, values):
+        return {'x': 0, 'y': 0, 'ubid': ubid, 'acquired': acquired,
+                'data': b64encode(numpy.array(values, dtype=numpy.int16).tobytes())}
+
+    specmap   = {'reds':  [{'ubid': 'R', 'data_shape': [2, 2], 'data_type': 'INT16'}],
+                 'blues': [{'ubid': 'B', 'data_shape': [2, 2], 'data_type': 'INT16'}]}
+    chipmap   = lambda: {'reds':  [chip('R', '2001-01-01', [1, 2, 3, 4]), chip('R', '2002-01-01', [5, 6, 7, 8])],
+                         'blues': [chip('B', '2001-01-01', [9, 8, 7, 6]), chip('B', '2002-01-01', [5, 4, 3, 2])]}
+    locations = merlin.chips.locations(x=0, y=0, cw=2, ch=2, rx=1, ry=-1, sx=60, sy=60)
+    args      = dict(x=0, y=0, locations=locations, dates_fn=merlin.dates.symmetric, specmap=specmap)
+    
+    fmt       = timeseries.packer({'format_fn': merlin.formats.pyccd})['format_fn']
+    expected  = dict(merlin.formats.pyccd(chipmap=chipmap(), **args))
+    actual    = dict(timeseries.unpack(fmt(chipmap=chipmap(), **args)))
+
+    assert set(actual.keys()) == set((0, 0, int(k[2]), int(k[3])) for k in expected.keys())
+    for k, v in expected.items():
+        a = actual[(0, 0, int(k[2]), int(k[3]))]
+        assert a['dates'] == v['dates']
+        assert a['reds'].tolist() == v['reds'].tolist()
+        assert a['blues'].tolist() == v['blues'].tolist()
+
+def test_packer_wraps_format():
+    fmt = timeseries.packer({'format_fn': lambda **kwargs: [timeseries_element]})['format_fn']
+    assert first(fmt()) == (-1815585, 1064805)
+
 def test_dataframe(spark_context):
     rdd = spark_context.parallelize([[5, 4, 3, 2], {"foo": 66}])
     rdd.setName("ard")
@@ -49,3 +101,30 @@ def test_aux(spark_context, ids_rdd, merlin_aux_config):
     assert type(aux_df) is pyspark.sql.dataframe.DataFrame
     assert set(aux_df.columns) == set(aux_schema)
     
+
+
+def test_columns():
+    cols = timeseries.columns([chip_element], 'ard')
+
+    assert set(cols.keys()) == set(timeseries.schema('ard').names)
+    assert cols['chipx'] == [-1815585, -1815585]
+    assert cols['pixelx'] == [-1814475, -1814445]
+    assert cols['dates'][1] == chip_element[1]['dates']
+    assert list(cols['qas'][0]) == [1, 1, 1, 1]
+
+def test_raster():
+    pixels = numpy.array([[0, 60], [30, 60], [0, 30], [30, 30]], dtype=numpy.int32)
+    chip   = ((0, 60), {'pixels': pixels[::-1],
+                        'dates':  ['1982-01-01/2017-12-31'],
+                        'dem':    numpy.array([[4.0], [3.0], [2.0], [1.0]]),
+                        'trends': numpy.array([[8], [7], [6], [5]])})
+    row    = timeseries.raster(chip, ['dem', 'trends', 'mpw'])
+
+    assert (row['ox'], row['oy'], row['rx'], row['ry'], row['ncols']) == (0, 60, 30, 30, 2)
+    assert row['dem'] == [1.0, 2.0, 3.0, 4.0]
+    assert row['trends'] == [5, 6, 7, 8]
+    assert row['mpw'] is None
+
+    partial = timeseries.raster(((0, 60), {'pixels': pixels[1:], 'dem': numpy.array([[2.0], [3.0], [4.0]])}), ['dem'])
+    assert partial['dem'] == [None, 2.0, 3.0, 4.0]
+    assert isinstance(partial['dem'][1], float)